@@ -0,0 +1,230 @@
+"""
+Admission control and load shedding for the LLM-backed routes.
+
+Generation requests (quiz, flashcards, graph) used to queue without limit: each one
+held a threadpool thread while it waited for the governor, so a burst of users
+starting videos slowed every request down, and once the threadpool was exhausted
+even transcripts and button state stopped being served.
+
+Now each route's generation (the cache-miss path only, so cached responses are
+always served) runs at most `concurrency` at a time and queues at most `queue` more,
+in arrival order. The slot is taken before the artifact's key lock, so requests
+waiting for an identical generation count (and are shed) too. A request is refused
+at once when the queue is full or when the expected wait (position in the queue
+times the route's recent generation latency, divided by its concurrency) exceeds
+`max_wait`. Across all routes at most GENERATION_REQUEST_LIMIT generations run or
+wait (KNOWTUBE_GENERATION_REQUEST_LIMIT, default 24 of the 40 threadpool threads), so
+cheap routes always find a thread.
+
+Refused requests get 503 with a Retry-After of the expected wait. Limits per route
+come from ROUTE_LIMITS, overridden by KNOWTUBE_ADMISSION, e.g.
+"quiz=8/16/20,graph=2/4/60" (concurrency/queue/max_wait seconds). Background work
+(jobs, warm-up: no cancellation token) is not admission controlled; the governor
+still bounds it. Counts and latencies are reported under "admission" in GET /metrics.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Any, Callable, ContextManager, Deque, Dict, Iterator, Mapping
+
+from fastapi import HTTPException
+
+from helpers import metrics, profiling
+from helpers.cancellation import Cancelled, current_token
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class RouteLimit:
+    concurrency: int
+    queue: int
+    # Seconds a request may expect to wait before it is refused.
+    max_wait: float
+    # Generation latency assumed until one has been measured.
+    initial_latency: float
+
+
+ROUTE_LIMITS: Dict[str, RouteLimit] = {
+    "quiz": RouteLimit(concurrency=8, queue=16, max_wait=20.0, initial_latency=10.0),
+    "flashcards": RouteLimit(concurrency=16, queue=32, max_wait=10.0, initial_latency=5.0),
+    "qa_flashcards": RouteLimit(concurrency=8, queue=16, max_wait=10.0, initial_latency=5.0),
+    "graph": RouteLimit(concurrency=2, queue=4, max_wait=60.0, initial_latency=45.0),
+}
+GENERATION_REQUEST_LIMIT = int(os.getenv("KNOWTUBE_GENERATION_REQUEST_LIMIT", "24"))
+# Retry-After sent when the overall limit (not a route queue) is exhausted.
+BUSY_RETRY_AFTER = 5
+# Weight of the newest generation in the latency average.
+LATENCY_ALPHA = 0.2
+# Queued requests re-check their cancellation token this often.
+CANCEL_POLL_SECONDS = 0.25
+
+
+def parse_route_limits(spec: str, base: Mapping[str, RouteLimit] = ROUTE_LIMITS) -> Dict[str, RouteLimit]:
+    """
+    Apply "route=concurrency/queue/max_wait,..." overrides to `base` (trailing fields may be omitted).
+
+    Raises:
+        ValueError: On a malformed entry or an unknown route
+    """
+    limits = dict(base)
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, values = entry.partition("=")
+        route = route.strip()
+        if route not in limits or not values:
+            raise ValueError(f"Malformed KNOWTUBE_ADMISSION entry: {entry!r}")
+        fields = dict(zip(("concurrency", "queue", "max_wait"), values.split("/")))
+        limits[route] = replace(
+            limits[route],
+            **{name: float(value) if name == "max_wait" else int(value) for name, value in fields.items()},
+        )
+    return limits
+
+
+def overloaded(retry_after: float, detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class _Route:
+    def __init__(self, name: str, limit: RouteLimit) -> None:
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self.queue: Deque[object] = deque()
+        self.latency = limit.initial_latency
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def expected_wait(self, position: int) -> float:
+        return position * self.latency / self.limit.concurrency
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.limit.concurrency,
+            "queue_limit": self.limit.queue,
+            "in_flight": self.in_flight,
+            "queued": len(self.queue),
+            "latency": self.latency,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class Admission:
+    """Per-route concurrency limits with bounded, latency-aware queues."""
+
+    def __init__(self, limits: Mapping[str, RouteLimit], request_limit: int = GENERATION_REQUEST_LIMIT) -> None:
+        self._cond = threading.Condition()
+        self._routes = {name: _Route(name, limit) for name, limit in limits.items()}
+        self._request_limit = request_limit
+        # Generations running or queued, over all routes.
+        self._active = 0
+        self._busy_rejected = 0
+
+    @contextmanager
+    def slot(self, route: str) -> Iterator[None]:
+        """
+        Hold one of the route's generation slots for the block (wait in its queue if needed).
+
+        Callers without a cancellation token (background work) pass straight through.
+
+        Raises:
+            HTTPException: 503 when the route is over capacity
+            Cancelled: If the request is cancelled while queued
+        """
+        token = current_token()
+        if token is None:
+            yield
+            return
+
+        entry = self._routes[route]
+        ticket = object()
+        enqueued = time.monotonic()
+        with self._cond:
+            if self._active >= self._request_limit:
+                self._busy_rejected += 1
+                logger.info(f"Shedding {route} generation: {self._active} generations running or queued")
+                raise overloaded(BUSY_RETRY_AFTER, "Too many generation requests right now, please retry shortly.")
+            if entry.in_flight >= entry.limit.concurrency or entry.queue:
+                wait = entry.expected_wait(len(entry.queue) + 1)
+                if len(entry.queue) >= entry.limit.queue or wait > entry.limit.max_wait:
+                    entry.rejected += 1
+                    logger.info(f"Shedding {route} generation: {len(entry.queue)} queued, ~{wait:.0f}s wait")
+                    raise overloaded(wait, f"The {route} service is busy, please retry shortly.")
+            entry.queue.append(ticket)
+            self._active += 1
+            deadline = enqueued + entry.limit.max_wait
+            try:
+                while entry.queue[0] is not ticket or entry.in_flight >= entry.limit.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        entry.timed_out += 1
+                        raise overloaded(
+                            entry.expected_wait(entry.queue.index(ticket) + 1),
+                            f"The {route} service is busy, please retry shortly.",
+                        )
+                    if token.cancelled:
+                        raise Cancelled(token.reason)
+                    self._cond.wait(min(remaining, CANCEL_POLL_SECONDS))
+            except BaseException:
+                entry.queue.remove(ticket)
+                self._active -= 1
+                self._cond.notify_all()
+                raise
+            entry.queue.popleft()
+            entry.in_flight += 1
+            entry.admitted += 1
+            # The next ticket may be admissible too.
+            self._cond.notify_all()
+
+        started = time.monotonic()
+        profiling.record(f"admission:{route}", "wait", started - enqueued)
+        succeeded = False
+        try:
+            yield
+            succeeded = True
+        finally:
+            with self._cond:
+                entry.in_flight -= 1
+                self._active -= 1
+                if succeeded:
+                    entry.latency += LATENCY_ALPHA * (time.monotonic() - started - entry.latency)
+                self._cond.notify_all()
+
+    def gate(self, route: str) -> Callable[[], ContextManager[None]]:
+        """
+        The route's slot as a `gate` for ArtifactStore.get_or_create: taken on a cache
+        miss before the key lock, so identical requests waiting for one generation
+        are admission controlled too instead of piling up on the lock.
+        """
+        return lambda: self.slot(route)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "active": self._active,
+                "limit": self._request_limit,
+                "busy_rejected": self._busy_rejected,
+                "routes": {name: entry.snapshot() for name, entry in self._routes.items()},
+            }
+
+
+_admission = Admission(parse_route_limits(os.getenv("KNOWTUBE_ADMISSION", "")))
+metrics.register("admission", _admission.snapshot)
+
+
+def get_admission() -> Admission:
+    return _admission
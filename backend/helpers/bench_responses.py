@@ -0,0 +1,117 @@
+"""
+Compare the cost of serving cached artifacts and encoding uncached responses.
+
+Cached path, per transcript:
+  - before: decode the stored JSON into Python objects and let FastAPI re-encode them
+            (jsonable_encoder + JSONResponse), as /transcript used to
+  - after:  send the stored bytes as is (json_bytes_response, with ETag)
+
+Uncached path, for a freshly built value:
+  - before: FastAPI's default for a returned dict (jsonable_encoder + JSONResponse)
+  - after:  json_response (encode_payload, orjson when installed, plus ETag)
+and, for routes that still return dicts, the app's default response class.
+
+Usage:
+    cd backend && python -m helpers.bench_responses --transcripts . --repeat 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+
+from helpers.http_cache import DEFAULT_RESPONSE_CLASS, json_bytes_response, json_response
+from helpers.storage import ArtifactStore, orjson
+
+
+def _timeit(fn: Callable[[], object], repeat: int) -> float:
+    """Best-of-3 mean seconds per call."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def _request() -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/transcript", "headers": []})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcripts", default=".", help="Directory with transcript_<video_id>.json files")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    payloads: List[dict] = []
+    for path in sorted(Path(args.transcripts).glob("transcript_*.json")):
+        try:
+            payloads.append(json.loads(path.read_text(encoding="utf-8")))
+        except json.JSONDecodeError:
+            continue
+    if not payloads:
+        parser.error(f"No readable transcript_*.json files in {args.transcripts}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ArtifactStore(os.path.join(tmp, "bench.db"), max_bytes=0)
+        video_ids = []
+        for index, payload in enumerate(payloads):
+            video_id = f"video{index}"
+            store.put("transcripts", video_id, payload)
+            video_ids.append(video_id)
+
+        def cached_before() -> None:
+            for video_id in video_ids:
+                value = store.get("transcripts", video_id)
+                JSONResponse(jsonable_encoder(value)).body
+
+        def cached_after() -> None:
+            request = _request()
+            for video_id in video_ids:
+                json_bytes_response(request, store.get_bytes("transcripts", video_id)).body
+
+        def encode_before() -> None:
+            for payload in payloads:
+                JSONResponse(jsonable_encoder(payload)).body
+
+        def encode_after() -> None:
+            request = _request()
+            for payload in payloads:
+                json_response(request, payload).body
+
+        def encode_default_class() -> None:
+            for payload in payloads:
+                DEFAULT_RESPONSE_CLASS(jsonable_encoder(payload)).body
+
+        total_bytes = sum(len(store.get_bytes("transcripts", v)) for v in video_ids)
+        print(f"{len(payloads)} transcripts, {total_bytes / 1024:.0f} KiB of JSON; orjson: {orjson is not None}\n")
+        rows = [
+            ("cached: decode + re-encode (before)", cached_before),
+            ("cached: stored bytes + ETag (after)", cached_after),
+            ("uncached: jsonable_encoder + json (before)", encode_before),
+            ("uncached: json_response (after)", encode_after),
+            (f"uncached: jsonable_encoder + {DEFAULT_RESPONSE_CLASS.__name__}", encode_default_class),
+        ]
+        results = {name: _timeit(fn, args.repeat) for name, fn in rows}
+        store.close()
+
+    for name, seconds in results.items():
+        print(f"{name:<45} {seconds * 1000 / len(payloads):8.3f} ms per response")
+    cached = results[rows[0][0]] / results[rows[1][0]]
+    uncached = results[rows[2][0]] / results[rows[3][0]]
+    print(f"\nspeed-up: cached {cached:.1f}x, uncached {uncached:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
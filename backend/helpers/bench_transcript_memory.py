@@ -0,0 +1,78 @@
+"""
+Measure the memory of a decoded transcript against its TranscriptIndex.
+
+For every transcript file this reports the bytes allocated (tracemalloc) by
+  - the decoded JSON payload, i.e. the list of segment dicts that get_transcript
+    returns (a fresh copy per request), and
+  - the TranscriptIndex built from it (one shared copy per video in the index LRU),
+and checks that select_context_window picks the same window from both.
+
+Usage:
+    cd backend && python -m helpers.bench_transcript_memory --transcripts .
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Tuple
+
+from helpers.flashcards.create_flashcard import select_context_window
+from helpers.transcript_index import TranscriptIndex, normalize_segment_text
+
+
+def _allocated(build: Callable[[], object]) -> Tuple[object, int]:
+    """Build a value and return it with the bytes still allocated for it."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        value = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return value, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcripts", default=".", help="Directory with transcript_<video_id>.json files")
+    args = parser.parse_args()
+
+    rows = []
+    for path in sorted(Path(args.transcripts).glob("transcript_*.json")):
+        raw = path.read_text(encoding="utf-8")
+        try:
+            json.loads(raw)
+        except json.JSONDecodeError:
+            continue
+        payload, payload_bytes = _allocated(lambda: json.loads(raw))
+        segments = payload["transcript"]
+        index, index_bytes = _allocated(lambda: TranscriptIndex.from_segments(segments))
+
+        end = index.end_time
+        for time_stamp in (0.0, end / 3, end / 2, end):
+            expected = [(normalize_segment_text(s["text"]), s["start"]) for s in select_context_window(payload, time_stamp, 45)]
+            actual = [(s["text"], s["start"]) for s in select_context_window(index, time_stamp, 45)]
+            assert actual == expected, f"window mismatch for {path.name} at {time_stamp}"
+        rows.append((path.stem.removeprefix("transcript_"), len(segments), payload_bytes, index_bytes))
+
+    if not rows:
+        parser.error(f"No readable transcript_*.json files in {args.transcripts}")
+
+    print(f"{'video':<14}{'segments':>9}{'dicts KiB':>12}{'index KiB':>12}{'ratio':>8}")
+    for video_id, count, payload_bytes, index_bytes in rows:
+        print(f"{video_id:<14}{count:>9}{payload_bytes / 1024:>12.1f}{index_bytes / 1024:>12.1f}"
+              f"{payload_bytes / index_bytes:>7.1f}x")
+    total_payload = sum(row[2] for row in rows)
+    total_index = sum(row[3] for row in rows)
+    total_segments = sum(row[1] for row in rows)
+    print(f"\ntotal: {total_payload / 1024:.0f} KiB as dicts, {total_index / 1024:.0f} KiB as index "
+          f"({total_payload / total_index:.1f}x); "
+          f"{total_payload / total_segments:.0f} vs {total_index / total_segments:.0f} bytes per segment")
+
+
+if __name__ == "__main__":
+    main()
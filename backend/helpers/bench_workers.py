@@ -0,0 +1,132 @@
+"""
+Measure request throughput for different numbers of uvicorn worker processes.
+
+Each run starts `uvicorn main:app --workers N` on a scratch artifact database seeded
+with the transcripts found in the given directory (transcript_<video_id>.json, the
+legacy cache files), fires a fixed number of concurrent GET /transcript requests
+with gzip enabled and reports requests per second.
+
+Usage:
+    cd backend && python -m helpers.bench_workers --workers 1 2 4 --requests 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+import httpx
+
+from helpers.storage import ArtifactStore
+
+STARTUP_TIMEOUT_SECONDS = 60.0
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _seed(db_path: str, transcript_dir: Path) -> List[str]:
+    store = ArtifactStore(db_path, max_bytes=0)
+    video_ids = []
+    for path in sorted(transcript_dir.glob("transcript_*.json")):
+        video_id = path.stem[len("transcript_"):]
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            print(f"Skipping unreadable {path.name}")
+            continue
+        store.put("transcripts", video_id, payload)
+        video_ids.append(video_id)
+    store.close()
+    return video_ids
+
+
+def _wait_until_ready(base_url: str) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+
+def run(workers: int, requests: int, concurrency: int, video_ids: List[str], db_path: str) -> float:
+    """
+    Serve with `workers` processes and return the measured requests per second.
+    """
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "KNOWTUBE_DB_PATH": db_path,
+        "TOGETHER_API_KEY": os.getenv("TOGETHER_API_KEY", "benchmark"),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning", "--no-access-log"],
+        env=env,
+    )
+    try:
+        _wait_until_ready(base_url)
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        with httpx.Client(base_url=base_url, limits=limits, timeout=60.0,
+                          headers={"Accept-Encoding": "gzip"}) as client:
+
+            def fetch(i: int) -> int:
+                response = client.get("/transcript", params={"video_id": video_ids[i % len(video_ids)]})
+                return response.status_code
+
+            # Warm-up: open connections and build the per-process indexes.
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(fetch, range(concurrency * 2)))
+                start = time.perf_counter()
+                statuses = list(pool.map(fetch, range(requests)))
+                elapsed = time.perf_counter() - start
+        failures = sum(status != 200 for status in statuses)
+        if failures:
+            print(f"  {failures} requests failed")
+        return requests / elapsed
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--transcripts", default=".", help="Directory with transcript_<video_id>.json files")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        video_ids = _seed(db_path, Path(args.transcripts))
+        if not video_ids:
+            parser.error(f"No transcript_*.json files found in {args.transcripts}")
+        print(f"Seeded {len(video_ids)} transcripts; {args.requests} requests at concurrency {args.concurrency}")
+
+        baseline = None
+        for workers in args.workers:
+            throughput = run(workers, args.requests, args.concurrency, video_ids, db_path)
+            baseline = baseline or throughput
+            print(f"workers={workers:<3} {throughput:8.1f} req/s  ({throughput / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
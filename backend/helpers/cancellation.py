@@ -0,0 +1,195 @@
+"""
+Cancellation of generation work whose client has gone away.
+
+Routes that run LLM pipelines call run_cancellable: the work runs in the threadpool
+under a CancellationToken, and a watcher on the event loop cancels the token as soon
+as the client disconnects. Code along the pipeline picks the token up from the
+calling context (like fetch priorities, see helpers.fetch_scheduler):
+
+- chat_completion stops waiting for in-flight requests and does not start new ones;
+  responses that still arrive afterwards go to the completion cache, so a retry of
+  the same generation reuses them,
+- the graph pipeline drops its queued decompositions and link searches,
+- cache factories raise Cancelled, so nothing incomplete is stored.
+
+Work without a token (jobs, warm-up, batch streams) is never cancelled.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, List, Optional
+
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+
+from helpers import metrics, profiling
+
+logger = logging.getLogger(__name__)
+
+# How often the watcher checks whether the client is still connected.
+DISCONNECT_POLL_SECONDS = 0.5
+# Non-standard "Client Closed Request"; nobody reads it, but it stands out in access logs.
+CLIENT_CLOSED_STATUS = 499
+
+_current: ContextVar[Optional["CancellationToken"]] = ContextVar("cancellation_token", default=None)
+
+
+class Cancelled(Exception):
+    """Raised inside cancelled work; aborts the generation without caching anything."""
+
+
+class CancellationToken:
+    """Thread-safe, one-way cancellation flag with callbacks."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+        # Resolved on cancel, so waits on concurrent futures can include it.
+        self.future: Future = Future()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.future.done()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        with self._lock:
+            if self.future.done():
+                return
+            self.reason = reason
+            self.future.set_result(reason)
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as exc:
+                logger.warning(f"Cancellation callback failed: {exc}")
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        """Run callback on cancellation (immediately if already cancelled)."""
+        with self._lock:
+            if not self.future.done():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep, but raise Cancelled as soon as the token is cancelled."""
+        try:
+            self.future.result(timeout=seconds)
+        except TimeoutError:
+            return
+        raise Cancelled(self.reason)
+
+
+@contextmanager
+def cancellation_scope(token: Optional[CancellationToken]) -> Iterator[None]:
+    """Run the enclosed code under the given token (None: not cancellable)."""
+    reset = _current.set(token)
+    try:
+        yield
+    finally:
+        _current.reset(reset)
+
+
+def current_token() -> Optional[CancellationToken]:
+    return _current.get()
+
+
+def raise_if_cancelled() -> None:
+    """Raise Cancelled if the calling context's token has been cancelled."""
+    token = _current.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def submit_in_context(executor: Executor, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """
+    executor.submit that runs fn in a copy of the caller's context, so the
+    cancellation token (and fetch priority) carry over to the worker thread.
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class _Counters:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started = 0
+        self.cancelled = 0
+        self.dropped_tasks = 0
+
+    def add(self, name: str, count: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + count)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"started": self.started, "cancelled": self.cancelled, "dropped_tasks": self.dropped_tasks}
+
+
+_counters = _Counters()
+metrics.register("cancellation", _counters.snapshot)
+
+
+def cancel_futures_on(token: Optional[CancellationToken], futures: List[Future]) -> None:
+    """Drop the futures that have not started yet once the token is cancelled."""
+    if token is None:
+        return
+
+    def _drop() -> None:
+        dropped = sum(1 for future in futures if future.cancel())
+        _counters.add("dropped_tasks", dropped)
+
+    token.add_callback(_drop)
+
+
+async def _watch_disconnect(request: Request, token: CancellationToken) -> None:
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel(f"client disconnected from {request.url.path}")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def run_cancellable(request: Request, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run fn(*args, **kwargs) in the threadpool, cancelled when the client disconnects.
+
+    Returns:
+        fn's result
+
+    Raises:
+        Cancelled: If the client went away first (answered by cancelled_handler)
+    """
+    token = CancellationToken()
+    _counters.add("started")
+
+    def _run() -> Any:
+        with cancellation_scope(token), profiling.thread_scope():
+            return fn(*args, **kwargs)
+
+    watcher = asyncio.create_task(_watch_disconnect(request, token))
+    try:
+        return await run_in_threadpool(_run)
+    except Cancelled:
+        _counters.add("cancelled")
+        raise
+    finally:
+        watcher.cancel()
+
+
+async def cancelled_handler(request: Request, exc: Cancelled) -> Response:
+    """Exception handler for Cancelled: the client is gone, so send an empty 499."""
+    logger.info(f"Stopped work for {request.url.path}: {exc}")
+    return Response(status_code=CLIENT_CLOSED_STATUS)
@@ -0,0 +1,210 @@
+"""
+Topic segmentation of transcripts into chapters (TextTiling).
+
+At ingest the transcript's words are cut into fixed-size token sequences and the
+lexical cohesion across every sequence gap is measured as the cosine similarity of
+the term counts of the blocks on either side (computed for all gaps at once from
+cumulative counts with NumPy). Gaps where the similarity dips deepest become chapter
+boundaries, subject to a minimum chapter length. Chapters are stored with the
+transcript in the artifact store, and flashcards, quizzes and the concept graph can
+be generated and cached per chapter.
+
+Reference: Hearst, "TextTiling: Segmenting Text into Multi-paragraph Subtopic
+Passages", Computational Linguistics 23(1), 1997.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from bisect import bisect_right
+from typing import Any, Dict, List, Mapping, Sequence
+
+import numpy as np
+
+from helpers.transcript_index import TranscriptIndex, normalize_segment_text
+
+# Words per token sequence (TextTiling's w) and sequences per comparison block (k).
+SEQUENCE_WORDS = 20
+BLOCK_SEQUENCES = 6
+# Chapters shorter than this are merged into their neighbours.
+MIN_CHAPTER_SECONDS = float(os.getenv("KNOWTUBE_CHAPTER_MIN_SECONDS", "120"))
+# Only the most frequent terms are counted; rare terms barely affect block similarity
+# and this bounds the count matrix for very long videos.
+MAX_VOCABULARY = 2048
+KEYWORDS_PER_CHAPTER = 3
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    """
+    a about above after again against all also am an and any are as at be because been before being
+    below between both but by can could did do does doing don't down during each even few for from
+    further get gets getting go going gonna got had has have having he her here hers herself him
+    himself his how i i'm if in into is it it's its itself just know let's like me more most much my
+    myself no nor not now of off oh okay on once one only or other our ours ourselves out over own
+    really right same see she should so some such than that that's the their theirs them themselves
+    then there there's these they they're thing things think this those through to too um uh under
+    until up us very wanna was way we we're well were what when where which while who whom why will
+    with would yeah yes you you're your yours yourself yourselves i've i'll i'd you've we've isn't
+    can't didn't doesn't won't say said use make made want need back
+    """.split()
+)
+
+
+def _tokenize(text: str) -> List[str]:
+    return [w for w in _WORD_RE.findall(text.lower()) if len(w) > 2 and w not in _STOPWORDS]
+
+
+def _gap_scores(counts: np.ndarray, block: int) -> np.ndarray:
+    """
+    Cosine similarity of the `block` sequences before and after every inner gap.
+
+    Gap g lies between sequences g - 1 and g, for g in 1..len(counts) - 1.
+    """
+    n = counts.shape[0]
+    cumulative = np.zeros((n + 1, counts.shape[1]), dtype=np.float32)
+    np.cumsum(counts, axis=0, out=cumulative[1:])
+    gaps = np.arange(1, n)
+    left = cumulative[gaps] - cumulative[np.maximum(gaps - block, 0)]
+    right = cumulative[np.minimum(gaps + block, n)] - cumulative[gaps]
+    norms = np.linalg.norm(left, axis=1) * np.linalg.norm(right, axis=1)
+    dots = np.einsum("ij,ij->i", left, right)
+    return np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+
+
+def _depth_scores(scores: np.ndarray) -> np.ndarray:
+    """
+    Depth of every gap's similarity below the peaks reached by climbing left and right.
+    """
+    left_peak = scores.copy()
+    right_peak = scores.copy()
+    # Climbing from gap i continues from gap i - 1 while the similarity keeps rising,
+    # so each peak follows from its neighbour's in one pass.
+    for i in range(1, len(scores)):
+        if scores[i - 1] >= scores[i]:
+            left_peak[i] = left_peak[i - 1]
+    for i in range(len(scores) - 2, -1, -1):
+        if scores[i + 1] >= scores[i]:
+            right_peak[i] = right_peak[i + 1]
+    return (left_peak - scores) + (right_peak - scores)
+
+
+def _keywords(counts: np.ndarray, vocabulary: np.ndarray, chapter_rows: List[slice]) -> List[List[str]]:
+    """Most distinctive terms of each chapter (term count weighted by inverse chapter frequency)."""
+    per_chapter = np.stack([counts[rows].sum(axis=0) for rows in chapter_rows])
+    spread = np.count_nonzero(per_chapter, axis=0)
+    weights = per_chapter * np.log((1 + len(chapter_rows)) / (1 + spread))[None, :]
+    keywords = []
+    for row in weights:
+        top = np.argsort(-row, kind="stable")[:KEYWORDS_PER_CHAPTER]
+        keywords.append([str(vocabulary[i]) for i in top if row[i] > 0])
+    return keywords
+
+
+def segment_chapters(
+    segments: Sequence[Mapping[str, Any]],
+    *,
+    min_chapter_seconds: float = MIN_CHAPTER_SECONDS,
+    sequence_words: int = SEQUENCE_WORDS,
+    block_sequences: int = BLOCK_SEQUENCES,
+) -> List[Dict[str, Any]]:
+    """
+    Split a transcript into topical chapters.
+
+    Args:
+        segments: Transcript segments ({"text", "start", "duration"})
+        min_chapter_seconds: Minimum chapter length
+        sequence_words: Content words per token sequence
+        block_sequences: Token sequences compared on each side of a gap
+
+    Returns:
+        Chapters in order, each {"index", "start", "end", "first_segment", "stop_segment",
+        "keywords"} where segments[first_segment:stop_segment] belong to the chapter.
+        Empty if there are no segments.
+    """
+    if not segments:
+        return []
+
+    token_segments: List[int] = []
+    words: List[str] = []
+    for position, segment in enumerate(segments):
+        tokens = _tokenize(normalize_segment_text(segment.get("text", "")))
+        words.extend(tokens)
+        token_segments.extend([position] * len(tokens))
+
+    starts = np.array([float(s.get("start", 0.0)) for s in segments])
+    video_end = float(segments[-1].get("start", 0.0)) + float(segments[-1].get("duration", 0.0))
+
+    boundaries: List[int] = []
+    counts = vocabulary = None
+    sequence_count = len(words) // sequence_words
+    if sequence_count >= 2 * block_sequences:
+        vocabulary, token_ids, frequencies = np.unique(np.array(words), return_inverse=True, return_counts=True)
+        keep = np.argsort(-frequencies, kind="stable")[:MAX_VOCABULARY]
+        column = np.full(len(vocabulary), -1)
+        column[keep] = np.arange(len(keep))
+        vocabulary = vocabulary[keep]
+
+        token_ids = column[token_ids[: sequence_count * sequence_words]]
+        sequence_ids = np.arange(len(token_ids)) // sequence_words
+        counted = token_ids >= 0
+        counts = np.zeros((sequence_count, len(vocabulary)), dtype=np.float32)
+        np.add.at(counts, (sequence_ids[counted], token_ids[counted]), 1.0)
+
+        scores = _gap_scores(counts, block_sequences)
+        # Light smoothing, as in TextTiling, so single noisy gaps do not become boundaries.
+        scores = np.convolve(np.pad(scores, 1, mode="edge"), np.ones(3) / 3, mode="valid")
+        depths = _depth_scores(scores)
+        cutoff = depths.mean() - depths.std() / 2
+
+        # Deepest valleys first; skip boundaries that would leave a chapter too short.
+        chosen_times: List[float] = [float(starts[0]), video_end]
+        for gap in np.argsort(-depths, kind="stable"):
+            if depths[gap] <= max(cutoff, 0.0):
+                break
+            segment = token_segments[(gap + 1) * sequence_words]
+            if segment == 0:
+                continue
+            time = float(starts[segment])
+            slot = bisect_right(chosen_times, time)
+            if time - chosen_times[slot - 1] < min_chapter_seconds or chosen_times[slot] - time < min_chapter_seconds:
+                continue
+            chosen_times.insert(slot, time)
+            boundaries.append(segment)
+        boundaries.sort()
+
+    firsts = [0] + boundaries
+    stops = boundaries + [len(segments)]
+    chapters = []
+    for index, (first, stop) in enumerate(zip(firsts, stops)):
+        last = segments[stop - 1]
+        chapters.append({
+            "index": index,
+            "start": float(segments[first].get("start", 0.0)),
+            "end": float(last.get("start", 0.0)) + float(last.get("duration", 0.0)),
+            "first_segment": first,
+            "stop_segment": stop,
+            "keywords": [],
+        })
+
+    if counts is not None:
+        # Token sequence of each chapter, by the sequence its first segment's words start in.
+        token_starts = np.searchsorted(np.array(token_segments), firsts) // sequence_words
+        rows = [slice(a, b) for a, b in zip(token_starts, list(token_starts[1:]) + [sequence_count])]
+        for chapter, keywords in zip(chapters, _keywords(counts, vocabulary, rows)):
+            chapter["keywords"] = keywords
+    return chapters
+
+
+def chapter_at_time(chapters: Sequence[Mapping[str, Any]], seconds: float) -> Mapping[str, Any]:
+    """The chapter playing at `seconds` (the first / last one outside the video)."""
+    if not chapters:
+        raise IndexError("Transcript has no chapters.")
+    position = bisect_right([chapter["start"] for chapter in chapters], seconds) - 1
+    return chapters[max(0, position)]
+
+
+def chapter_text(index: TranscriptIndex, chapter: Mapping[str, Any]) -> str:
+    """Normalized text of a chapter, sliced from the transcript index."""
+    begin, end = index.char_range(chapter["first_segment"], chapter["stop_segment"] - 1)
+    return index.text[begin:end]
@@ -0,0 +1,225 @@
+"""
+Transcript compaction before prompt building.
+
+Caption text sent to the LLM used to carry a lot of tokens that say nothing: caption
+line breaks, sound cues ("[Music]"), speaker-change markers (">>"), filler words,
+and the rolling overlaps of auto-generated captions, where each caption repeats the
+tail of the previous one. The multitype flashcard prompts even carried the Python
+repr of the segment dicts, start times and durations included.
+
+Every prompt builder now serializes transcript text through this module:
+- compact_segments(segments): plain text of a window of segments, with overlaps of
+  MIN_OVERLAP_WORDS or more words between consecutive captions removed,
+- compact_text(text): the same cleanup for text that is already joined.
+
+Both normalize whitespace, drop known sound cues ("[Music]", "(laughs)", "♪") and
+speaker markers (">>"), collapse phrases of two or more words repeated back to back
+("so we so we"), and drop pure fillers ("um", "uh") unless KNOWTUBE_COMPACT_FILLERS=0.
+Other bracketed or parenthesized text ("f(x)", "a[i]", "[1, 2, 3]") is content and
+kept, and so are single repeated words ("that that"), which are often grammatical,
+also across a caption boundary ("... the / the ..."). The characters removed and the
+estimated prompt tokens saved are reported under "compaction" in GET /metrics.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import re
+import threading
+from typing import Any, Iterable, Iterator, List, Mapping, Optional
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+DROP_FILLERS = os.getenv("KNOWTUBE_COMPACT_FILLERS", "1") != "0"
+# Shortest and longest phrase (in words) whose immediate repetition is collapsed.
+MIN_REPEAT_WORDS = 2
+MAX_REPEAT_WORDS = 6
+# Shortest and longest caption overlap (in words) removed between consecutive
+# segments; a single shared word is as likely to be said twice.
+MIN_OVERLAP_WORDS = 2
+MAX_OVERLAP_WORDS = 30
+# Compaction rarely removes more than half of the text, so this much raw text is
+# read to fill a truncated prompt.
+RAW_CHARS_PER_COMPACT_CHAR = 2
+# Rough size of a token in English text for the savings estimate.
+CHARS_PER_TOKEN = 4.0
+
+# Caption annotations of YouTube's and common human captioners' styles.
+CUE_WORDS = (
+    "music", "applause", "laughter", "laughs", "laughing", "cheering", "cheers", "inaudible",
+    "silence", "crosstalk", "foreign", "background noise", "noise", "no audio", "sighs", "coughs",
+)
+_CUE_ALTERNATION = "|".join(re.escape(word).replace(r"\ ", r"\s+") for word in CUE_WORDS)
+_CUE_RE = re.compile(
+    rf"\[\s*(?:{_CUE_ALTERNATION})\s*\]|\(\s*(?:{_CUE_ALTERNATION})\s*\)|♪+|>>+",
+    re.IGNORECASE,
+)
+_FILLER_RE = re.compile(r"\b(?:u+m+|u+h+|uhm+|e+r+m+|h+m+|mhm)\b[,.]?", re.IGNORECASE)
+_SPACE_BEFORE_PUNCT_RE = re.compile(r"\s+([,.!?;:])")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate prompt tokens of `text` (about four characters per token)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _word_key(word: str) -> str:
+    return word.strip(",.!?;:\"'").lower()
+
+
+def _collapse_repeats(
+    words: List[str], min_words: int = MIN_REPEAT_WORDS, max_words: int = MAX_REPEAT_WORDS
+) -> List[str]:
+    """Drop phrases of min_words to max_words words that immediately repeat the previous phrase."""
+    out: List[str] = []
+    keys: List[str] = []
+    for word in words:
+        out.append(word)
+        keys.append(_word_key(word))
+        for n in range(min_words, min(max_words, len(out) // 2) + 1):
+            if keys[-n:] == keys[-2 * n : -n] and any(keys[-n:]):
+                del out[-n:]
+                del keys[-n:]
+                break
+    return out
+
+
+def _clean(text: str, drop_fillers: bool) -> str:
+    text = _CUE_RE.sub(" ", str(text))
+    if drop_fillers:
+        text = _FILLER_RE.sub(" ", text)
+    return " ".join(text.split())
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.texts = 0
+        self.chars_in = 0
+        self.chars_out = 0
+
+    def add(self, chars_in: int, chars_out: int) -> None:
+        with self._lock:
+            self.texts += 1
+            self.chars_in += chars_in
+            self.chars_out += chars_out
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            saved = self.chars_in - self.chars_out
+            return {
+                "texts": self.texts,
+                "chars_in": self.chars_in,
+                "chars_out": self.chars_out,
+                "saved_ratio": saved / self.chars_in if self.chars_in else None,
+                "estimated_tokens_saved": math.ceil(saved / CHARS_PER_TOKEN),
+            }
+
+
+_stats = _Stats()
+metrics.register("compaction", _stats.snapshot)
+
+
+def _finish(words: List[str], chars_in: int, label: Optional[str]) -> str:
+    text = _SPACE_BEFORE_PUNCT_RE.sub(r"\1", " ".join(_collapse_repeats(words)))
+    _stats.add(chars_in, len(text))
+    if label is not None and chars_in:
+        logger.debug(
+            f"Compacted {label}: {chars_in} -> {len(text)} chars "
+            f"(~{math.ceil((chars_in - len(text)) / CHARS_PER_TOKEN)} tokens saved)"
+        )
+    return text
+
+
+def compact_text(text: str, *, drop_fillers: bool = DROP_FILLERS, label: Optional[str] = None) -> str:
+    """
+    Compact already joined transcript text for a prompt.
+
+    Args:
+        text: Transcript text
+        drop_fillers: Remove filler words ("um", "uh", ...)
+        label: Names the text in debug logs
+
+    Returns:
+        Compacted text
+    """
+    return _finish(_clean(text, drop_fillers).split(), len(text), label)
+
+
+def compact_segments(
+    segments: Iterable[Mapping[str, Any]], *, drop_fillers: bool = DROP_FILLERS, label: Optional[str] = None
+) -> str:
+    """
+    Serialize transcript segments as compact plain text for a prompt.
+
+    Start times and durations are dropped, and where a caption begins with the
+    words the previous one ended with (rolling auto-captions), the repeated words
+    are dropped if there are at least MIN_OVERLAP_WORDS of them.
+
+    Args:
+        segments: Transcript segments ({"text", ...}), e.g. a slice of a TranscriptIndex
+        drop_fillers: Remove filler words ("um", "uh", ...)
+        label: Names the window in debug logs
+
+    Returns:
+        Compacted text
+    """
+    words: List[str] = []
+    keys: List[str] = []
+    chars_in = 0
+    for segment in segments:
+        raw = segment.get("text", "")
+        chars_in += len(raw) + 1
+        new = _clean(raw, drop_fillers).split()
+        new_keys = [_word_key(word) for word in new]
+        overlap = 0
+        for n in range(min(MAX_OVERLAP_WORDS, len(new_keys), len(keys)), MIN_OVERLAP_WORDS - 1, -1):
+            if keys[-n:] == new_keys[:n]:
+                overlap = n
+                break
+        words.extend(new[overlap:])
+        keys.extend(new_keys[overlap:])
+    return _finish(words, max(chars_in - 1, 0), label)
+
+
+def _leading_segments(segments: Iterable[Mapping[str, Any]], raw_chars: int) -> Iterator[Mapping[str, Any]]:
+    seen = 0
+    for segment in segments:
+        if seen >= raw_chars:
+            return
+        seen += len(segment.get("text", "")) + 1
+        yield segment
+
+
+def compact_transcript(
+    segments: Iterable[Mapping[str, Any]],
+    max_chars: Optional[int] = None,
+    *,
+    drop_fillers: bool = DROP_FILLERS,
+    label: Optional[str] = None,
+) -> str:
+    """
+    compact_segments for a prompt with a length budget: only the leading segments
+    needed to fill max_chars are compacted, and the result is cut at max_chars
+    (marked with "...").
+
+    Args:
+        segments: Transcript segments, e.g. a TranscriptIndex or a slice of one
+        max_chars: Character budget (None: no limit)
+        drop_fillers: Remove filler words ("um", "uh", ...)
+        label: Names the text in debug logs
+
+    Returns:
+        Compacted text
+    """
+    if max_chars is None:
+        return compact_segments(segments, drop_fillers=drop_fillers, label=label)
+    leading = _leading_segments(segments, max_chars * RAW_CHARS_PER_COMPACT_CHAR)
+    text = compact_segments(leading, drop_fillers=drop_fillers, label=label)
+    if len(text) > max_chars:
+        text = f"{text[:max_chars]}..."
+    return text
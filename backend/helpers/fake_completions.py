@@ -0,0 +1,133 @@
+"""
+Local fake of the Together chat completions endpoint for exercising helpers.llm.
+
+Start it and point the backend at it:
+    python -m helpers.fake_completions --port 8001 --latency 0.5 --tail-rate 0.05 --error-rate 0.1
+    TOGETHER_BASE_URL=http://127.0.0.1:8001/v1 TOGETHER_API_KEY=fake uvicorn main:app
+
+Latency is `latency` seconds, except for a `tail_rate` fraction of requests which take
+`tail_latency` seconds. An `error_rate` fraction of requests fail with `error_status`.
+For deterministic tests, the first `tail_first` requests are slow and the first
+`fail_first` requests fail.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+@dataclass
+class FakeConfig:
+    latency: float = 0.2
+    tail_latency: float = 5.0
+    tail_rate: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    content: str = "[]"
+    tail_first: int = 0
+    fail_first: int = 0
+
+
+class FakeCompletionsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: FakeConfig) -> None:
+        super().__init__(address, _Handler)
+        self.config = config
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+
+    def next_request(self) -> int:
+        with self._count_lock:
+            self.request_count += 1
+            return self.request_count
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeCompletionsServer
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        number = self.server.next_request()
+        config = self.server.config
+
+        is_tail = number <= config.tail_first or random.random() < config.tail_rate
+        time.sleep(config.tail_latency if is_tail else config.latency)
+
+        if number <= config.fail_first or random.random() < config.error_rate:
+            self._send(config.error_status, {"error": {"message": "fake upstream error"}})
+            return
+
+        self._send(
+            200,
+            {
+                "id": str(uuid.uuid4()),
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": config.content},
+                    }
+                ],
+            },
+        )
+
+    def _send(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def serve_in_thread(config: Optional[FakeConfig] = None, host: str = "127.0.0.1", port: int = 0) -> FakeCompletionsServer:
+    """Start a fake server on a background thread; call .shutdown() when done."""
+    server = FakeCompletionsServer((host, port), config or FakeConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=FakeConfig.latency)
+    parser.add_argument("--tail-latency", type=float, default=FakeConfig.tail_latency)
+    parser.add_argument("--tail-rate", type=float, default=FakeConfig.tail_rate)
+    parser.add_argument("--error-rate", type=float, default=FakeConfig.error_rate)
+    parser.add_argument("--error-status", type=int, default=FakeConfig.error_status)
+    parser.add_argument("--content", default=FakeConfig.content, help="Completion text returned on success")
+    args = parser.parse_args()
+
+    config = FakeConfig(
+        latency=args.latency,
+        tail_latency=args.tail_latency,
+        tail_rate=args.tail_rate,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        content=args.content,
+    )
+    server = FakeCompletionsServer((args.host, args.port), config)
+    print(f"Fake Together completions listening on {server.base_url}")
+    server.serve_forever()
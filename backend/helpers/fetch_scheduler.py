@@ -0,0 +1,223 @@
+"""
+Priority scheduler for YouTube transcript fetches.
+
+Every fetch waits for a slot. Slots are handed out one at a time in priority order,
+interactive requests (a user waiting on a route) before background work (jobs,
+batch quizzes, warm-up), and each slot draws one token from the shared YouTube
+budget in helpers.rate_limit. The slot is only handed out once the caller's
+reservation may be used within its maximum wait (otherwise SchedulerTimeout, and a
+503 with Retry-After), and the waiting itself happens after the next caller has had
+its turn. When YouTube blocks us the scheduler backs off
+exponentially, and withholds the same budget from the other worker processes, then
+recovers gradually once fetches succeed again.
+
+The priority of a fetch comes from the calling context (see fetch_priority), so
+pipelines do not need to pass it down explicitly.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from helpers import metrics, profiling
+from helpers.rate_limit import penalize, reserve
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Interactive callers give up (503) rather than wait longer than this for a slot.
+INTERACTIVE_MAX_WAIT = float(os.getenv("KNOWTUBE_YOUTUBE_INTERACTIVE_MAX_WAIT", "15"))
+
+# Backoff after a blocked response: doubles per block, halves per success.
+BACKOFF_MIN_SECONDS = float(os.getenv("KNOWTUBE_YOUTUBE_BACKOFF_MIN", "5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("KNOWTUBE_YOUTUBE_BACKOFF_MAX", "300"))
+
+WAIT_WINDOW = 200
+
+_priority: ContextVar[int] = ContextVar("fetch_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def fetch_priority(level: int) -> Iterator[None]:
+    """Run the enclosed code with transcript fetches at the given priority."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def run_with_priority(level: int, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Call fn(*args, **kwargs) with transcript fetches at the given priority."""
+    with fetch_priority(level):
+        return fn(*args, **kwargs)
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a fetch could not get a slot within its maximum wait."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"No fetch slot available; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class FetchScheduler:
+    """Hands out fetch slots in priority order, paced by the shared rate limit."""
+
+    def __init__(self, upstream: str = "youtube") -> None:
+        self.upstream = upstream
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        # True while the caller at the head reserves its rate-limit token.
+        self._dispatching = False
+        self.backoff = 0.0
+        self._blocked_until = 0.0
+        self._waits: Dict[int, Deque[float]] = {level: deque(maxlen=WAIT_WINDOW) for level in PRIORITY_NAMES}
+        self._served: Dict[int, int] = {level: 0 for level in PRIORITY_NAMES}
+        self._timeouts: Dict[int, int] = {level: 0 for level in PRIORITY_NAMES}
+        self.blocked_count = 0
+
+    @contextmanager
+    def slot(self, priority: Optional[int] = None, max_wait: Optional[float] = None) -> Iterator[None]:
+        """
+        Wait for permission to send one request upstream.
+
+        Args:
+            priority: INTERACTIVE or BACKGROUND (default: from the calling context)
+            max_wait: Give up after this many seconds (default: INTERACTIVE_MAX_WAIT for
+                      interactive callers, unlimited for background ones)
+
+        Raises:
+            SchedulerTimeout: If no slot became available within max_wait
+        """
+        priority = _priority.get() if priority is None else priority
+        if max_wait is None and priority == INTERACTIVE:
+            max_wait = INTERACTIVE_MAX_WAIT
+        enqueued = time.monotonic()
+        deadline = None if max_wait is None else enqueued + max_wait
+        ticket = (priority, next(self._sequence))
+
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            try:
+                while self._dispatching or self._queue[0] != ticket:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise self._timeout(priority)
+                    self._cond.wait(remaining)
+                # We are next: the backoff must end within our deadline.
+                pause = self._blocked_until - time.monotonic()
+                if pause > 0 and deadline is not None and time.monotonic() + pause > deadline:
+                    raise self._timeout(priority, retry_after=pause)
+            except BaseException:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._queue)
+            self._dispatching = True
+
+        # Reserve outside the condition (it is a database write), but still in turn so
+        # that tokens go out in priority order. Another process may have penalized the
+        # shared budget, so the reservation can be far off: take it only if it can be
+        # used before the deadline.
+        try:
+            max_wait = None if deadline is None else deadline - time.monotonic()
+            wait = reserve(self.upstream, max_wait=max_wait)
+        finally:
+            with self._cond:
+                self._dispatching = False
+                self._cond.notify_all()
+        if max_wait is not None and wait > max_wait:
+            with self._cond:
+                raise self._timeout(priority, retry_after=wait)
+
+        # The turn has passed on; wait out the backoff and the reservation.
+        delay = max(pause, wait)
+        if delay > 0:
+            time.sleep(delay)
+            profiling.record(f"rate:{self.upstream}", "wait", wait)
+
+        wait = time.monotonic() - enqueued
+        profiling.record(f"scheduler:{self.upstream}", "wait", wait)
+        with self._cond:
+            self._waits[priority].append(wait)
+            self._served[priority] += 1
+        if wait > 1.0:
+            logger.debug(f"{PRIORITY_NAMES[priority]} {self.upstream} fetch waited {wait:.2f}s")
+        yield
+
+    def _timeout(self, priority: int, retry_after: Optional[float] = None) -> SchedulerTimeout:
+        self._timeouts[priority] += 1
+        return SchedulerTimeout(retry_after if retry_after is not None else self.retry_after())
+
+    def report_blocked(self) -> float:
+        """
+        Record a blocked / rate-limited response and extend the backoff.
+
+        Returns:
+            The new backoff in seconds
+        """
+        with self._cond:
+            self.blocked_count += 1
+            self.backoff = min(BACKOFF_MAX_SECONDS, max(BACKOFF_MIN_SECONDS, self.backoff * 2))
+            self._blocked_until = time.monotonic() + self.backoff
+            backoff = self.backoff
+        logger.warning(f"{self.upstream} is blocking requests; backing off for {backoff:.0f}s")
+        # Other worker processes share the budget, so they slow down too.
+        penalize(self.upstream, backoff)
+        return backoff
+
+    def report_success(self) -> None:
+        with self._cond:
+            if self.backoff:
+                self.backoff = self.backoff / 2 if self.backoff / 2 >= BACKOFF_MIN_SECONDS else 0.0
+
+    def retry_after(self) -> float:
+        """Seconds until the current backoff ends (at least 1)."""
+        return max(1.0, self._blocked_until - time.monotonic())
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for level, _ in self._queue:
+                depth[PRIORITY_NAMES[level]] += 1
+            classes = {}
+            for level, name in PRIORITY_NAMES.items():
+                waits = sorted(self._waits[level])
+                classes[name] = {
+                    "queued": depth[name],
+                    "served": self._served[level],
+                    "timeouts": self._timeouts[level],
+                    "wait_avg": sum(waits) / len(waits) if waits else None,
+                    "wait_p95": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else None,
+                    "wait_max": waits[-1] if waits else None,
+                }
+            return {
+                "queue_depth": len(self._queue) + int(self._dispatching),
+                "backoff_seconds": self.backoff,
+                "blocked_for_seconds": max(0.0, self._blocked_until - time.monotonic()),
+                "blocked_responses": self.blocked_count,
+                "classes": classes,
+            }
+
+
+_youtube_scheduler = FetchScheduler("youtube")
+metrics.register("youtube_fetch", _youtube_scheduler.snapshot)
+
+
+def get_youtube_scheduler() -> FetchScheduler:
+    return _youtube_scheduler
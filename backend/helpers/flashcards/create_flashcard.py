@@ -4,16 +4,44 @@ Utilities for generating flashcards from quiz responses with Together's GPT-OSS
 
 from __future__ import annotations
 
-import json
+import logging
+import os
 import random
-from typing import Mapping, Optional, Sequence, Union
+from bisect import bisect_left, bisect_right
+from typing import Any, Mapping, Optional, Sequence, Union
 
 from together import Together
 
-from .flashcard_prompts import get_prompt_generate_multitype_flashcards, get_prompt_generate_qa_flashcards
-from helpers.transcripts import get_transcript
-DEFAULT_MODEL = "moonshotai/Kimi-K2-Instruct-0905"
+from .flashcard_prompts import (
+    get_prompt_generate_multitype_flashcards,
+    get_prompt_generate_qa_flashcards,
+    get_prompt_repair_multitype_flashcards,
+)
+from .similarity import get_window_index
+from helpers.admission import get_admission
+from helpers.cancellation import Cancelled
+from helpers.compaction import compact_segments, compact_transcript
+from helpers.routing import routed_completion
+from helpers.schemas import MULTITYPE_CARD_TYPES, MultitypeFlashcard, QAFlashcard
+from helpers.storage import get_store
+from helpers.structured_output import scan_json_array, validate_items
+from helpers.transcript_index import TranscriptIndex
+from helpers.transcripts import get_chapter, get_transcript_index
 
+logger = logging.getLogger(__name__)
+
+# A budget window spans at least / at most these multiples of context_seconds.
+BUDGET_MIN_SECONDS_FACTOR = 0.5
+BUDGET_MAX_SECONDS_FACTOR = 2.0
+
+
+def default_context_chars() -> Optional[int]:
+    """
+    Text budget of multitype flashcard windows when the request sets none
+    (KNOWTUBE_FLASHCARD_CONTEXT_CHARS; unset or 0: windows are sized by context_seconds).
+    Read on each call, as the routes are imported before .env is loaded.
+    """
+    return int(os.getenv("KNOWTUBE_FLASHCARD_CONTEXT_CHARS", "0")) or None
 
 
 def _response_text(response) -> str:
@@ -22,14 +50,28 @@ def _response_text(response) -> str:
     except (AttributeError, IndexError, KeyError) as exc:
         raise RuntimeError("Together chat completion response missing content.") from exc
 
-def select_context_window(transcript_payload, timestamp, context_seconds=30):
+def select_context_window(transcript_payload, timestamp, context_seconds=30, context_chars=None):
     """
     Return transcript segments that cover the last `context_seconds`
     before `timestamp`, including the segment that contains `timestamp`.
+
+    transcript_payload may be the transcript dict, a list of segment dicts or a
+    TranscriptIndex (whose segments are mapping views, see helpers.transcript_index).
+    With a `context_chars` budget the window is sized by text instead (see
+    select_budget_window).
     """
     segments = transcript_payload.get("transcript", []) if isinstance(transcript_payload, dict) else transcript_payload
     if not segments:
         return []
+    if context_chars:
+        index = segments if isinstance(segments, TranscriptIndex) else TranscriptIndex.from_segments(segments)
+        return select_budget_window(
+            index,
+            timestamp,
+            context_chars,
+            min_seconds=context_seconds * BUDGET_MIN_SECONDS_FACTOR,
+            max_seconds=context_seconds * BUDGET_MAX_SECONDS_FACTOR,
+        )
 
     def _collect_backward(idx: int) -> list:
         window = []
@@ -81,22 +123,108 @@ def select_context_window(transcript_payload, timestamp, context_seconds=30):
     return _collect_backward(target_idx)
 
 
+def select_budget_window(
+    index: TranscriptIndex,
+    timestamp: float,
+    max_chars: int,
+    *,
+    min_seconds: float = 0.0,
+    max_seconds: Optional[float] = None,
+) -> list:
+    """
+    Transcript segments ending at `timestamp` whose text fits a character budget.
+
+    A fixed number of seconds holds very different amounts of text (a fast talker
+    vs. a slow demo), and with it the prompt size and generation time of the cards.
+    This window instead takes as many segments before `timestamp` as fit into
+    `max_chars` characters, within [min_seconds, max_seconds] of video. Like
+    select_context_window it ends with the segment containing `timestamp` and runs
+    forward from the first segment for timestamps before the video starts.
+
+    The index offsets are cumulative text lengths, so the boundaries are found by
+    bisection instead of walking the segments.
+
+    Args:
+        index: Transcript index
+        timestamp: Video position (seconds) the window ends at
+        max_chars: Text budget; the target segment is always included, even if longer
+        min_seconds: The window covers at least this much video, over budget if needed
+        max_seconds: The window covers at most this much video (None: no limit)
+
+    Returns:
+        The window's segments, in order
+    """
+    count = len(index)
+    if not count:
+        return []
+    starts = index.starts
+
+    if timestamp <= starts[0]:
+        # Forward from the first segment.
+        origin = starts[0]
+        last = bisect_right(index.ends, index.offsets[0] + max_chars) - 1
+        if max_seconds is not None:
+            longest = index.segment_at_time(origin + max_seconds)
+            if starts[longest] + index.durations[longest] > origin + max_seconds:
+                longest -= 1
+            last = min(last, longest)
+        last = max(last, index.segment_at_time(origin + min_seconds), 0)
+        return index[0:last + 1]
+
+    target = index.segment_at_time(timestamp)
+    if starts[target] + index.durations[target] < timestamp and target + 1 < count:
+        # In a gap between captions: the window ends with the next one.
+        target += 1
+    end_time = starts[target] + index.durations[target]
+    first = bisect_left(index.offsets, index.ends[target] - max_chars, 0, target + 1)
+    if max_seconds is not None:
+        first = max(first, bisect_left(starts, end_time - max_seconds))
+    first = min(first, index.segment_at_time(end_time - min_seconds), target)
+    return index[first:target + 1]
+
+
 def generate_multitype_flashcards(
     video_id: str,
     time_stamp: float = 0.0,
     context_seconds: int = 30,
     language_code: Optional[str] = None,
     temperature: float = 0.3,
-    model: str = DEFAULT_MODEL,
+    model: Optional[str] = None,
     *,
     client: Together,
+    context_chars: Optional[int] = None,
 ) -> dict:
     
-    transcript_payload = get_transcript(video_id=video_id, language_code=language_code)
-    transcript_section = select_context_window(transcript_payload, time_stamp, context_seconds)
-    prompt = get_prompt_generate_multitype_flashcards(str(transcript_section))
+    # The shared in-memory index; no per-request copy of the segment dicts.
+    transcript_index = get_transcript_index(video_id=video_id, language_code=language_code)
+    transcript_section = select_context_window(transcript_index, time_stamp, context_seconds, context_chars)
+    return _generate_multitype_cards(
+        transcript_section, f"{video_id}@{time_stamp}", temperature=temperature, model=model, client=client
+    )
+
 
-    response = client.chat.completions.create(
+def _generate_multitype_cards(
+    transcript_section: Sequence[Mapping[str, Any]],
+    label: str,
+    *,
+    temperature: float,
+    model: Optional[str],
+    client: Together,
+) -> dict:
+    """
+    One card of each multitype card type for a list of transcript segments.
+
+    Args:
+        transcript_section: Transcript segments the cards are generated from
+        label: Names the section in log output (e.g. "<video_id>@<time_stamp>")
+    """
+    # Plain, compacted caption text instead of the repr of the segment dicts.
+    section_text = compact_segments(transcript_section, label=label)
+    prompt = get_prompt_generate_multitype_flashcards(section_text)
+
+    response = routed_completion(
+        client,
+        task="flashcards_window",
         model=model,
         messages=[
             {"role": "user", "content": prompt},
@@ -105,26 +233,194 @@ def generate_multitype_flashcards(
     )
 
     flashcards_text = _response_text(response)
-    if flashcards_text.startswith("```json"):
-        flashcards_text = "\n".join(flashcards_text.splitlines()[1:-1])
+    cards = _valid_cards_by_type(flashcards_text)
+    missing_types = [card_type for card_type in MULTITYPE_CARD_TYPES if card_type not in cards]
 
-    try:
-        json_object = json.loads(flashcards_text)
-        return json_object
-    except json.JSONDecodeError as exc:
+    if missing_types:
+        # Keep the valid cards and only ask for the missing / invalid card types.
+        logger.info(f"Flashcards for {label}: repairing card types {missing_types}")
+        repair_prompt = get_prompt_repair_multitype_flashcards(
+            section_text, missing_types, list(cards.values())
+        )
+        try:
+            repair_response = routed_completion(
+                client,
+                task="flashcards_window",
+                model=model,
+                messages=[
+                    {"role": "user", "content": repair_prompt},
+                ],
+                temperature=temperature
+            )
+            for card_type, card in _valid_cards_by_type(_response_text(repair_response)).items():
+                cards.setdefault(card_type, card)
+        except Cancelled:
+            raise
+        except Exception as exc:
+            logger.warning(f"Flashcard repair failed: {exc}")
+
+    if not cards:
         raise RuntimeError(
-            "Together response was not valid JSON. Inspect flashcards_text for debugging."
-        ) from exc
+            "Together response contained no valid flashcards. Inspect flashcards_text for debugging."
+        )
+    return {"flashcards": [cards[card_type] for card_type in MULTITYPE_CARD_TYPES if card_type in cards]}
+
+
+def multitype_cache_params(
+    time_stamp: float, context_seconds: int, language_code: Optional[str], context_chars: Optional[int] = None
+) -> dict:
+    """Cache params of one multitype flashcard window in the "flashcards" table."""
+    params = {
+        "time_stamp": float(time_stamp),
+        "context_seconds": context_seconds,
+        "language_code": language_code,
+    }
+    # Only budget windows carry the key, so the fixed-seconds windows keep their cache entries.
+    if context_chars:
+        params["context_chars"] = context_chars
+    return params
+
+
+def get_multitype_flashcards(
+    video_id: str,
+    time_stamp: float = 0.0,
+    context_seconds: int = 30,
+    language_code: Optional[str] = None,
+    *,
+    client: Together,
+    context_chars: Optional[int] = None,
+) -> dict:
+    """
+    Cached generate_multitype_flashcards, in the response shape of
+    POST /generate_multitype_flashcards. Concurrent requests for the same window
+    share one generation.
+    """
+    factory = _multitype_factory(video_id, time_stamp, context_seconds, context_chars, language_code, client)
+    cache_params = multitype_cache_params(time_stamp, context_seconds, language_code, context_chars)
+    gate = get_admission().gate("flashcards")
+    return get_store().get_or_create("flashcards", video_id, factory, cache_params, gate=gate)
+
+
+def get_multitype_flashcards_bytes(
+    video_id: str,
+    time_stamp: float = 0.0,
+    context_seconds: int = 30,
+    language_code: Optional[str] = None,
+    *,
+    client: Together,
+    context_chars: Optional[int] = None,
+) -> bytes:
+    """
+    get_multitype_flashcards as the stored JSON bytes, ready to be sent as is.
+
+    When this exact window is not cached yet but a cached window of the same video has
+    near-identical transcript text (see helpers.flashcards.similarity), its cards are
+    served instead of generating new ones.
+    """
+    store = get_store()
+    cache_params = multitype_cache_params(time_stamp, context_seconds, language_code, context_chars)
+    payload = store.get_bytes("flashcards", video_id, cache_params)
+    if payload is not None:
+        return payload
+
+    def segments_for(window_time_stamp: float, window_seconds: int, window_chars: Optional[int]) -> list:
+        transcript_index = get_transcript_index(video_id=video_id, language_code=language_code)
+        return select_context_window(transcript_index, window_time_stamp, window_seconds, window_chars)
+
+    similar = get_window_index().find_similar(
+        video_id, segments_for, time_stamp, context_seconds, language_code, context_chars=context_chars
+    )
+    if similar is not None:
+        payload = store.get_bytes("flashcards", video_id, similar[0])
+        if payload is not None:
+            # Later requests for this window are plain cache hits.
+            store.put_bytes("flashcards", video_id, payload, cache_params)
+            return payload
+
+    factory = _multitype_factory(video_id, time_stamp, context_seconds, context_chars, language_code, client)
+    # Only a cache miss needs (and waits for) admission; see helpers.admission.
+    gate = get_admission().gate("flashcards")
+    return store.get_or_create_bytes("flashcards", video_id, factory, cache_params, gate=gate)
+
+
+def chapter_flashcards_cache_params(chapter: int, language_code: Optional[str]) -> dict:
+    """Cache params of one chapter's multitype flashcards in the "flashcards" table."""
+    return {"chapter": chapter, "language_code": language_code}
+
+
+def get_chapter_flashcards_bytes(
+    video_id: str,
+    chapter: Optional[int] = None,
+    time_stamp: float = 0.0,
+    language_code: Optional[str] = None,
+    temperature: float = 0.3,
+    *,
+    client: Together,
+) -> bytes:
+    """
+    Multitype flashcards for one topical chapter (see helpers.chapters), as stored JSON bytes.
+
+    Unlike time windows, chapters never overlap, so a video needs at most one
+    generation per chapter however the player is scrubbed.
+
+    Args:
+        video_id: YouTube video ID
+        chapter: Chapter index, or None for the chapter playing at time_stamp
+        time_stamp: Video position used when chapter is None
+
+    Returns:
+        {"chapter": {...}, "flashcards": [...]} encoded as JSON
+    """
+    selected = get_chapter(video_id, chapter, time_stamp, language_code)
+
+    def _generate() -> dict:
+        transcript_index = get_transcript_index(video_id=video_id, language_code=language_code)
+        cards = _generate_multitype_cards(
+            transcript_index[selected["first_segment"]:selected["stop_segment"]],
+            f"{video_id} chapter {selected['index']}",
+            temperature=temperature,
+            model=None,
+            client=client,
+        )
+        return {"chapter": selected, **cards}
+
+    cache_params = chapter_flashcards_cache_params(selected["index"], language_code)
+    gate = get_admission().gate("flashcards")
+    return get_store().get_or_create_bytes("flashcards", video_id, _generate, cache_params, gate=gate)
+
+
+def _multitype_factory(video_id, time_stamp, context_seconds, context_chars, language_code, client):
+    def _generate() -> dict:
+        flashcards = generate_multitype_flashcards(
+            video_id,
+            time_stamp,
+            context_seconds,
+            language_code=language_code,
+            client=client,
+            context_chars=context_chars,
+        )
+        return {"flashcards": flashcards}
+
+    return _generate
+
+
+def _valid_cards_by_type(flashcards_text: str) -> dict:
+    """First valid card of each card_type in a {"flashcards": [...]} response."""
+    valid, _ = validate_items(scan_json_array(flashcards_text, key="flashcards").items, MultitypeFlashcard)
+    cards = {}
+    for index in sorted(valid):
+        cards.setdefault(valid[index]["card_type"], valid[index])
+    return cards
 
 
 def _transcript_text(transcript_payload, max_chars: int = 8_000) -> str:
-    """Collapse transcript list into plaintext for QA prompts."""
-    segments = transcript_payload.get("transcript", []) if isinstance(transcript_payload, dict) else transcript_payload
-    text_parts = [str(chunk.get("text", "")).strip() for chunk in segments if isinstance(chunk, Mapping)]
-    text = " ".join(filter(None, text_parts))
-    if len(text) > max_chars:
-        return f"{text[:max_chars]}..."
-    return text
+    """Collapse transcript list (or a prebuilt TranscriptIndex) into compacted plaintext for QA prompts."""
+    if isinstance(transcript_payload, TranscriptIndex):
+        segments = transcript_payload
+    else:
+        segments = transcript_payload.get("transcript", []) if isinstance(transcript_payload, dict) else transcript_payload
+        segments = [chunk for chunk in segments if isinstance(chunk, Mapping)]
+    return compact_transcript(segments, max_chars, label="QA flashcard context")
 
 
 def generate_qa_flashcards(
@@ -132,17 +428,35 @@ def generate_qa_flashcards(
     video_id: str,
     language_code: Optional[str] = None,
     temperature: float = 0.3,
-    model: str = DEFAULT_MODEL,
+    model: Optional[str] = None,
     *,
     client: Together,
 ) -> dict:
-    transcript_payload = get_transcript(video_id=video_id, language_code=language_code)
-    transcript_context = _transcript_text(transcript_payload)
+    # Not cached as an artifact, so every request is admission controlled.
+    with get_admission().slot("qa_flashcards"):
+        return _generate_qa_flashcards(
+            quiz_questions_with_wrong_answers, video_id, language_code, temperature, model, client=client
+        )
+
+
+def _generate_qa_flashcards(
+    quiz_questions_with_wrong_answers: str,
+    video_id: str,
+    language_code: Optional[str],
+    temperature: float,
+    model: Optional[str],
+    *,
+    client: Together,
+) -> dict:
+    transcript_index = get_transcript_index(video_id=video_id, language_code=language_code)
+    transcript_context = _transcript_text(transcript_index)
     prompt = get_prompt_generate_qa_flashcards(quiz_questions_with_wrong_answers)
     if transcript_context:
         prompt = f"{prompt}\n\nVideo Transcript Context:\n{transcript_context}"
 
-    response = client.chat.completions.create(
+    response = routed_completion(
+        client,
+        task="flashcards_qa",
         model=model,
         messages=[
             {"role": "user", "content": prompt},
@@ -151,13 +465,39 @@ def generate_qa_flashcards(
     )
 
     flashcards_text = _response_text(response)
-    if flashcards_text.startswith("```json"):
-        flashcards_text = "\n".join(flashcards_text.splitlines()[1:-1])
+    valid, invalid = validate_items(scan_json_array(flashcards_text).items, QAFlashcard)
 
-    try:
-        json_object = json.loads(flashcards_text)
-        return json_object
-    except json.JSONDecodeError as exc:
+    # One flashcard is expected per quiz question; repair only the missing ones.
+    if isinstance(quiz_questions_with_wrong_answers, list):
+        expected = len(quiz_questions_with_wrong_answers)
+        valid = {index: card for index, card in valid.items() if index < expected}
+        missing = [index for index in range(expected) if index not in valid]
+        if missing:
+            logger.info(f"QA flashcards for {video_id}: repairing positions {missing} ({invalid})")
+            repair_prompt = get_prompt_generate_qa_flashcards(
+                [quiz_questions_with_wrong_answers[index] for index in missing]
+            )
+            if transcript_context:
+                repair_prompt = f"{repair_prompt}\n\nVideo Transcript Context:\n{transcript_context}"
+            try:
+                repair_response = routed_completion(
+                    client,
+                    task="flashcards_qa",
+                    model=model,
+                    messages=[
+                        {"role": "user", "content": repair_prompt},
+                    ],
+                    temperature=temperature
+                )
+                repaired, _ = validate_items(scan_json_array(_response_text(repair_response)).items, QAFlashcard)
+                valid.update(zip(missing, (repaired[index] for index in sorted(repaired))))
+            except Cancelled:
+                raise
+            except Exception as exc:
+                logger.warning(f"QA flashcard repair failed: {exc}")
+
+    if not valid:
         raise RuntimeError(
-            "Together response was not valid JSON. Inspect flashcards_text for debugging."
-        ) from exc
+            "Together response contained no valid flashcards. Inspect flashcards_text for debugging."
+        )
+    return [valid[index] for index in sorted(valid)]
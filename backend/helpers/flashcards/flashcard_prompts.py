@@ -1,3 +1,5 @@
+import json
+
 
 PROMPT_GENERATE_QA_FLASHCARDS = """
 You are an expert at creating educational content. Your task is to generate a set of flashcards based on the quiz questions that the student has answered wrongly. Each flashcard should help the student understand and remember the correct information. Please follow these guidelines:
@@ -102,4 +104,31 @@ def get_prompt_generate_qa_flashcards(quiz_questions_with_wrong_answers: str) ->
     return PROMPT_GENERATE_QA_FLASHCARDS + str(quiz_questions_with_wrong_answers)
 
 def get_prompt_generate_multitype_flashcards(transcript: str) -> str:
-    return PROMPT_GENERATE_MUTITYPE_FLASHCARDS + "\n" + str(transcript)
\ No newline at end of file
+    return PROMPT_GENERATE_MUTITYPE_FLASHCARDS + "\n" + str(transcript)
+
+PROMPT_REPAIR_MUTITYPE_FLASHCARDS = """
+You are an expert at creating educational content.
+A previous request produced some flashcards for the video transcript excerpt below, but the following card types are missing or invalid: CARD_TYPES_PLACEHOLDER.
+
+Generate ONLY those card types, one card each, about the same single piece of knowledge as the existing cards:
+EXISTING_PLACEHOLDER
+
+Use the same JSON formats as before:
+- knowledge: {"card_type": "knowledge", "title": "...", "knowledge_summary": "..."}
+- multiple_choice: {"card_type": "multiple_choice", "question": "...", "choices": ["...", "...", "...", "..."], "correct_choice_index": 0, "explanation": "..."}
+- cloze: {"card_type": "cloze", "cloze_text": "... {{c1::hidden part}} ...", "hint": "..."}
+- qa: {"card_type": "qa", "question": "...", "answer": "...", "explanation": "..."}
+
+Return a single JSON object {"flashcards": [...]} with no extra text before or after.
+
+Transcript Excerpt:
+"""
+
+
+def get_prompt_repair_multitype_flashcards(transcript: str, card_types: list, existing_cards: list) -> str:
+    return (
+        PROMPT_REPAIR_MUTITYPE_FLASHCARDS.replace("CARD_TYPES_PLACEHOLDER", ", ".join(card_types))
+        .replace("EXISTING_PLACEHOLDER", json.dumps(existing_cards, ensure_ascii=False) if existing_cards else "(none)")
+        + "\n"
+        + str(transcript)
+    )
@@ -0,0 +1,153 @@
+"""
+MinHash similarity index over cached multitype flashcard windows.
+
+The frontend asks for windows that overlap heavily (e.g. time_stamp 0, 1 and 2 with
+the same context), and each distinct window used to cost an LLM call. Before
+generating, the flashcard route looks up the already cached windows of the video
+and serves the cards of one whose transcript text is near-identical.
+
+Signatures are computed from word 3-gram shingles with NumPy and kept in a bounded
+LRU (KNOWTUBE_SIMILARITY_CACHE_BYTES); the set of cached windows is read from the
+artifact store on every lookup so windows generated by other worker processes are
+found too. Reused cards are also stored under the requested window, so the lookup
+happens once per window.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import zlib
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from helpers import metrics
+from helpers.storage import get_store, params_key
+from helpers.transcript_index import SizedLRU
+
+logger = logging.getLogger(__name__)
+
+NUM_PERMUTATIONS = 64
+SHINGLE_WORDS = 3
+# Estimated Jaccard similarity of the window texts above which cards are reused.
+SIMILARITY_THRESHOLD = float(os.getenv("KNOWTUBE_FLASHCARD_SIMILARITY", "0.7"))
+# Memory for window signatures (NUM_PERMUTATIONS * 8 bytes each).
+SIGNATURE_CACHE_BYTES = int(os.getenv("KNOWTUBE_SIMILARITY_CACHE_BYTES", str(8 * 1024 * 1024)))
+
+# Universal hashing modulo a Mersenne prime; a * x stays below 2**62, so no uint64 overflow.
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, int(_PRIME), NUM_PERMUTATIONS, dtype=np.uint64)[:, None]
+_B = _rng.integers(0, int(_PRIME), NUM_PERMUTATIONS, dtype=np.uint64)[:, None]
+
+
+def window_text(segments: Sequence[Mapping[str, Any]]) -> str:
+    return " ".join(str(segment.get("text", "")) for segment in segments)
+
+
+def minhash_signature(text: str) -> Optional[np.ndarray]:
+    """
+    MinHash signature of the text's word shingles, or None if the text has no words.
+    """
+    words = text.lower().split()
+    if not words:
+        return None
+    size = min(SHINGLE_WORDS, len(words))
+    shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles)
+    ) % _PRIME
+    return ((_A * hashes[None, :] + _B) % _PRIME).min(axis=1)
+
+
+def estimated_similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return float(np.count_nonzero(first == second)) / NUM_PERMUTATIONS
+
+
+class WindowIndex:
+    """Signatures of cached flashcard windows, per video."""
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, max_bytes: int = SIGNATURE_CACHE_BYTES) -> None:
+        self.threshold = threshold
+        # Windows without any words have no signature; they are not cached (and rare).
+        self._signatures = SizedLRU(max_bytes)
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.reused = 0
+
+    def find_similar(
+        self,
+        video_id: str,
+        segments_for: Any,
+        time_stamp: float,
+        context_seconds: int,
+        language_code: Optional[str],
+        *,
+        context_chars: Optional[int] = None,
+    ) -> Optional[Tuple[dict, float]]:
+        """
+        Find a cached window of this video whose text is near-identical to the requested one.
+
+        Args:
+            video_id: YouTube video ID
+            segments_for: Callable (time_stamp, context_seconds, context_chars) -> transcript segments of that window
+            time_stamp: Requested window position
+            context_seconds: Requested window length
+            language_code: Only windows generated for this language are considered
+            context_chars: Requested text budget of the window (None: sized by context_seconds)
+
+        Returns:
+            (cache params of the best match, similarity), or None if nothing is above the threshold
+        """
+        with self._lock:
+            self.lookups += 1
+        target = minhash_signature(window_text(segments_for(time_stamp, context_seconds, context_chars)))
+        if target is None:
+            return None
+
+        best: Optional[Tuple[dict, float]] = None
+        for params in get_store().list_params("flashcards", video_id):
+            if params.get("language_code") != language_code or "time_stamp" not in params:
+                continue
+            key = (video_id, params_key(params))
+            signature = self._signatures.get(key)
+            if signature is None:
+                segments = segments_for(
+                    params["time_stamp"], params.get("context_seconds", context_seconds), params.get("context_chars")
+                )
+                signature = minhash_signature(window_text(segments))
+                if signature is None:
+                    continue
+                self._signatures.put(key, signature)
+            similarity = estimated_similarity(target, signature)
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (params, similarity)
+
+        if best is not None:
+            with self._lock:
+                self.reused += 1
+            logger.info(
+                f"Reusing flashcards of {video_id}@{best[0]['time_stamp']} for @{time_stamp} "
+                f"(similarity {best[1]:.2f})"
+            )
+        return best
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "signatures": self._signatures.stats(),
+                "lookups": self.lookups,
+                "reused": self.reused,
+            }
+
+
+_window_index = WindowIndex()
+metrics.register("flashcard_similarity", _window_index.snapshot)
+
+
+def get_window_index() -> WindowIndex:
+    return _window_index
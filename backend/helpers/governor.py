@@ -0,0 +1,291 @@
+"""
+Process-wide concurrency governor for upstream calls.
+
+Every call to an upstream service (Together per model, YouTube, DuckDuckGo) and
+every fan-out task of a pipeline goes through one governor instead of per-request
+thread pools. Each upstream has its own concurrency limit; callers beyond the limit
+queue, and the queue is fair across requests: waiting flows (one per request, see
+flow_key) are served round-robin, so a graph build with fifteen decompositions does
+not hold up a quiz that needs one completion.
+
+Two entry points:
+- slot(upstream): blocks the calling thread until it may call the upstream,
+- submit(upstream, fn, ...): runs fn on the shared worker pool once the upstream has
+  room, and returns a Future (cancellable while still queued).
+
+Slots are reentrant per thread, so code running as a task of an upstream can take a
+slot of the same upstream without waiting for itself.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Hashable, Iterator, Mapping, Optional
+
+from helpers import metrics, profiling
+from helpers.cancellation import Cancelled, current_token
+
+logger = logging.getLogger(__name__)
+
+# Concurrent calls / tasks allowed per upstream.
+UPSTREAM_LIMITS: Dict[str, int] = {
+    # Pipeline tasks that call Together (e.g. concept decompositions).
+    "together": int(os.getenv("KNOWTUBE_TOGETHER_TASK_CONCURRENCY", "16")),
+    "youtube": int(os.getenv("KNOWTUBE_YOUTUBE_CONCURRENCY", "4")),
+    "ddg": int(os.getenv("KNOWTUBE_DDG_CONCURRENCY", "4")),
+}
+# Limit of the per-model upstreams "together:<model>" (requests in flight to one model).
+TOGETHER_MODEL_LIMIT = int(os.getenv("KNOWTUBE_TOGETHER_MODEL_CONCURRENCY", "8"))
+DEFAULT_LIMIT = 4
+
+WAIT_WINDOW = 500
+# Slot waiters re-check their cancellation token this often.
+CANCEL_POLL_SECONDS = 0.25
+
+BACKGROUND_FLOW = "background"
+
+
+def flow_key() -> Hashable:
+    """Fair-queuing flow of the caller: its request (cancellation token) or the shared background flow."""
+    token = current_token()
+    return token if token is not None else BACKGROUND_FLOW
+
+
+class _Ticket:
+    __slots__ = ("enqueued", "grant")
+
+    def __init__(self, grant: Callable[[], bool]) -> None:
+        self.enqueued = time.monotonic()
+        # Called under the governor lock; returns False if the ticket is void (cancelled task).
+        self.grant = grant
+
+
+class _Upstream:
+    def __init__(self, name: str, limit: int) -> None:
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.flows: "OrderedDict[Hashable, Deque[_Ticket]]" = OrderedDict()
+        self.waits: Deque[float] = deque(maxlen=WAIT_WINDOW)
+        self.served = 0
+        self.dropped = 0
+
+    def queued(self) -> int:
+        return sum(len(tickets) for tickets in self.flows.values())
+
+    def enqueue(self, flow: Hashable, ticket: _Ticket) -> None:
+        self.flows.setdefault(flow, deque()).append(ticket)
+
+    def remove(self, ticket: _Ticket) -> bool:
+        for flow, tickets in self.flows.items():
+            if ticket in tickets:
+                tickets.remove(ticket)
+                if not tickets:
+                    del self.flows[flow]
+                return True
+        return False
+
+    def next_ticket(self) -> Optional[_Ticket]:
+        """Pop the head ticket of the next flow in round-robin order."""
+        if not self.flows:
+            return None
+        flow, tickets = next(iter(self.flows.items()))
+        ticket = tickets.popleft()
+        del self.flows[flow]
+        if tickets:
+            # Back of the line for this flow's next ticket.
+            self.flows[flow] = tickets
+        return ticket
+
+    def snapshot(self) -> Dict[str, Any]:
+        waits = sorted(self.waits)
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "queued": self.queued(),
+            "waiting_flows": len(self.flows),
+            "served": self.served,
+            "dropped": self.dropped,
+            "wait_avg": sum(waits) / len(waits) if waits else None,
+            "wait_p95": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else None,
+            "wait_max": waits[-1] if waits else None,
+        }
+
+
+class Governor:
+    """Per-upstream concurrency limits with fair queuing across request flows."""
+
+    def __init__(
+        self,
+        limits: Mapping[str, int] = UPSTREAM_LIMITS,
+        model_limit: int = TOGETHER_MODEL_LIMIT,
+        workers: Optional[int] = None,
+    ) -> None:
+        self._limits = dict(limits)
+        self._model_limit = model_limit
+        self._lock = threading.Lock()
+        self._upstreams: Dict[str, _Upstream] = {}
+        self._held = threading.local()
+        # Tasks only reach the pool once their upstream has room, so this many
+        # threads never queue work for the configured upstreams.
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers or sum(self._limits.values()), thread_name_prefix="governor"
+        )
+
+    def _upstream(self, name: str) -> _Upstream:
+        upstream = self._upstreams.get(name)
+        if upstream is None:
+            if name in self._limits:
+                limit = self._limits[name]
+            elif name.startswith("together:"):
+                limit = self._model_limit
+            else:
+                limit = DEFAULT_LIMIT
+            upstream = self._upstreams[name] = _Upstream(name, limit)
+        return upstream
+
+    def _dispatch(self, upstream: _Upstream) -> None:
+        """Grant queued tickets while the upstream has room (governor lock held)."""
+        while upstream.in_flight < upstream.limit:
+            ticket = upstream.next_ticket()
+            if ticket is None:
+                return
+            if not ticket.grant():
+                upstream.dropped += 1
+                continue
+            upstream.in_flight += 1
+            upstream.peak_in_flight = max(upstream.peak_in_flight, upstream.in_flight)
+            upstream.served += 1
+            upstream.waits.append(time.monotonic() - ticket.enqueued)
+
+    def _release(self, name: str) -> None:
+        with self._lock:
+            upstream = self._upstreams[name]
+            upstream.in_flight -= 1
+            self._dispatch(upstream)
+
+    def _held_upstreams(self) -> set:
+        held = getattr(self._held, "names", None)
+        if held is None:
+            held = self._held.names = set()
+        return held
+
+    @contextmanager
+    def slot(self, name: str) -> Iterator[None]:
+        """
+        Wait (fairly) for permission to call upstream `name`, and hold it for the block.
+
+        Raises:
+            Cancelled: If the caller's request is cancelled while waiting
+        """
+        held = self._held_upstreams()
+        if name in held:
+            yield
+            return
+
+        granted = threading.Event()
+
+        def grant() -> bool:
+            granted.set()
+            return True
+
+        ticket = _Ticket(grant)
+        token = current_token()
+        waited = time.monotonic()
+        with self._lock:
+            upstream = self._upstream(name)
+            upstream.enqueue(flow_key(), ticket)
+            self._dispatch(upstream)
+        while not granted.wait(CANCEL_POLL_SECONDS if token is not None else None):
+            if token is not None and token.cancelled:
+                with self._lock:
+                    removed = upstream.remove(ticket)
+                if removed:
+                    raise Cancelled(token.reason)
+                # Granted meanwhile; fall through and hand the slot back below.
+
+        started = time.monotonic()
+        profiling.record(name, "wait", started - waited)
+        held.add(name)
+        try:
+            if token is not None:
+                token.raise_if_cancelled()
+            yield
+        finally:
+            held.discard(name)
+            self._release(name)
+            profiling.record(name, "busy", time.monotonic() - started)
+
+    def submit(self, name: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """
+        Run fn(*args, **kwargs) on the shared pool as a task of upstream `name`.
+
+        The task runs in a copy of the caller's context (cancellation token, fetch
+        priority) and queues in the caller's flow. Cancelling the returned future
+        before the task starts removes it from the queue.
+        """
+        future: Future = Future()
+        context = contextvars.copy_context()
+        enqueued = time.monotonic()
+
+        def task() -> Any:
+            started = time.monotonic()
+            profiling.record(name, "wait", started - enqueued)
+            try:
+                with profiling.thread_scope():
+                    return fn(*args, **kwargs)
+            finally:
+                profiling.record(name, "busy", time.monotonic() - started)
+
+        def run() -> None:
+            held = self._held_upstreams()
+            held.add(name)
+            try:
+                result = context.run(task)
+            except BaseException as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+            finally:
+                held.discard(name)
+                self._release(name)
+
+        def grant() -> bool:
+            if not future.set_running_or_notify_cancel():
+                return False
+            self._pool.submit(run)
+            return True
+
+        ticket = _Ticket(grant)
+        with self._lock:
+            upstream = self._upstream(name)
+            upstream.enqueue(flow_key(), ticket)
+            self._dispatch(upstream)
+        future.add_done_callback(lambda f: f.cancelled() and self._discard(upstream, ticket))
+        return future
+
+    def _discard(self, upstream: _Upstream, ticket: _Ticket) -> None:
+        with self._lock:
+            if upstream.remove(ticket):
+                upstream.dropped += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: upstream.snapshot() for name, upstream in sorted(self._upstreams.items())}
+
+
+_governor = Governor()
+metrics.register("governor", _governor.snapshot)
+
+
+def get_governor() -> Governor:
+    return _governor
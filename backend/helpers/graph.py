@@ -1,9 +1,21 @@
 import httpx
 import logging
-import json
 import uuid
-from typing import Dict, Any, List, Optional, TYPE_CHECKING
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Any, List, Optional, TYPE_CHECKING
+from concurrent.futures import as_completed
+
+from helpers.admission import get_admission
+from helpers.cancellation import Cancelled, cancel_futures_on, current_token, raise_if_cancelled
+from helpers.governor import get_governor
+from helpers.related_videos import get_related_video_index
+from helpers.http_clients import get_http_clients
+from helpers.chapters import chapter_text
+from helpers.compaction import RAW_CHARS_PER_COMPACT_CHAR, compact_text
+from helpers.routing import routed_completion
+from helpers.schemas import ConceptItem, SubConcept
+from helpers.storage import get_store
+from helpers.structured_output import scan_json_array, validate_items
+from helpers.transcripts import get_chapter, get_transcript_index
 
 if TYPE_CHECKING:
     from together import Together
@@ -379,9 +391,11 @@ def transcript_to_item_descriptions(
     transcript: str,
     *,
     client: "Together",
-    model: str = "meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo",
+    model: Optional[str] = None,
     temperature: float = 0.7,
     max_transcript_chars: int = 20000,
+    progress: Optional[Callable[[float, str], None]] = None,
+    video_id: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """
     Extract a list of key themes from a transcript as JSON objects suitable for semantic search with Wikidata.
@@ -389,9 +403,11 @@ def transcript_to_item_descriptions(
     Args:
         transcript: The transcript text string
         client: Together API client instance
-        model: The model to use for completion (default: meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo)
+        model: The model to use for every completion (default: routed per task by helpers.routing)
         temperature: Sampling temperature (default: 0.7)
         max_transcript_chars: Maximum characters from transcript to send (default: 20000)
+        progress: Optional callback receiving (fraction done, message) as the pipeline advances
+        video_id: Video the transcript belongs to; never linked as its own related video
     
     Returns:
         List of ConceptTree dictionaries, where each dictionary contains:
@@ -401,10 +417,16 @@ def transcript_to_item_descriptions(
         - data: ConceptData with concepts, description, and optional context
         - children: optional list of ConceptTree for sub-concepts
     """
-    import re
+    def report(fraction: float, message: str) -> None:
+        if progress is not None:
+            progress(fraction, message)
+
+    # Set when the requesting client disconnects (see helpers.cancellation).
+    token = current_token()
 
     
-    # Truncate transcript if too long
+    # Compact (see helpers.compaction), then truncate transcript if too long
+    transcript = compact_text(transcript[: max_transcript_chars * RAW_CHARS_PER_COMPACT_CHAR], label="graph transcript")
     if len(transcript) > max_transcript_chars:
         transcript = transcript[:max_transcript_chars]
         logger.debug(f"Truncated transcript to {max_transcript_chars} characters")
@@ -442,7 +464,9 @@ Transcript:
         logger.debug(f"Calling Together API with model={model}")
 
         # API Call
-        response = client.chat.completions.create(
+        response = routed_completion(
+            client,
+            task="graph_extract",
             model=model,
             messages=[
                 {"role": "user", "content": prompt},
@@ -459,46 +483,21 @@ Transcript:
             logger.error(f"Malformed API response: {response}")
             raise ValueError(f"API response error: {e}")
 
-        # Robust JSON Extraction (Regex)
-        # Finds the first '[' and the last ']' to ignore markdown or chatty intros
-        json_match = re.search(r'\[.*\]', content, re.DOTALL)
-        
-        if json_match:
-            json_str = json_match.group(0)
-        else:
-            # Fallback: try parsing the whole string if regex failed
-            json_str = content
-
-        try:
-            items = json.loads(json_str)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON Decode failed. Raw content: {content[:1000]}")
-            raise
-
-        # Validation
-        if not isinstance(items, list):
-            logger.warning("Model returned a single item not wrapped in a list. Wrapping now.")
-            items = [items]
+        # Tolerant JSON extraction: keeps every complete item even if the output is
+        # wrapped in markdown, chatty, or cut off mid-list
+        scan = scan_json_array(content)
+        if not scan.items:
+            logger.error(f"No JSON items found. Raw content: {content[:1000]}")
+            raise ValueError("API response did not contain a JSON array of items")
 
         # Validate and filter items
-        validated_items = []
-        for item in items:
-            if isinstance(item, dict):
-                # Ensure all required fields are present and are strings
-                validated_item = {
-                    "concepts": str(item.get("concepts", "")).strip(),
-                    "description": str(item.get("description", "")).strip(),
-                    "context": str(item.get("context", "")).strip()
-                }
-                # Only add if concepts and description are not empty
-                if validated_item["concepts"] and validated_item["description"]:
-                    validated_items.append(validated_item)
-                else:
-                    logger.warning(f"Skipping item with missing required fields: {item}")
-            else:
-                logger.warning(f"Skipping non-dict item: {item}")
+        valid, invalid = validate_items(scan.items, ConceptItem)
+        for index, reason in invalid.items():
+            logger.warning(f"Skipping invalid item {index}: {reason}")
+        validated_items = [valid[index] for index in sorted(valid)]
         
         logger.info(f"Successfully extracted {len(validated_items)} items")
+        report(0.2, f"Extracted {len(validated_items)} concepts")
         
         # Helper function to decompose each item into sub-concepts
         def decompose_item_description(
@@ -553,7 +552,9 @@ Generate sub-concepts for the parent concept above:
                 logger.debug(f"Calling Together API to decompose concept '{concepts}' with model={model}")
 
                 # API Call
-                response = client.chat.completions.create(
+                response = routed_completion(
+                    client,
+                    task="graph_decompose",
                     model=model,
                     messages=[
                         {"role": "user", "content": prompt},
@@ -570,47 +571,18 @@ Generate sub-concepts for the parent concept above:
                     logger.error(f"Malformed API response: {response}")
                     raise ValueError(f"API response error: {e}")
 
-                # Robust JSON Extraction (Regex)
-                # Finds the first '[' and the last ']' to ignore markdown or chatty intros
-                json_match = re.search(r'\[.*\]', content, re.DOTALL)
-                
-                if json_match:
-                    json_str = json_match.group(0)
-                else:
-                    # Fallback: try parsing the whole string if regex failed
-                    json_str = content
-
-                try:
-                    sub_items = json.loads(json_str)
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON Decode failed. Raw content: {content[:1000]}")
-                    raise
-
-                # Validation
-                if not isinstance(sub_items, list):
-                    logger.warning("Model returned a single item not wrapped in a list. Wrapping now.")
-                    sub_items = [sub_items]
-
-                # Validate and filter items
-                validated_sub_items = []
-                for sub_item in sub_items:
-                    if isinstance(sub_item, dict):
-                        # Ensure all required fields are present and are strings
-                        validated_sub_item = {
-                            "concepts": str(sub_item.get("concepts", "")).strip(),
-                            "description": str(sub_item.get("description", "")).strip()
-                        }
-                        # Only add if concepts and description are not empty
-                        if validated_sub_item["concepts"] and validated_sub_item["description"]:
-                            validated_sub_items.append(validated_sub_item)
-                        else:
-                            logger.warning(f"Skipping sub-item with missing required fields: {sub_item}")
-                    else:
-                        logger.warning(f"Skipping non-dict sub-item: {sub_item}")
+                # Tolerant JSON extraction and validation
+                scan = scan_json_array(content)
+                valid, invalid = validate_items(scan.items, SubConcept)
+                for index, reason in invalid.items():
+                    logger.warning(f"Skipping invalid sub-item {index}: {reason}")
+                validated_sub_items = [valid[index] for index in sorted(valid)]
                 
                 logger.info(f"Successfully decomposed '{concepts}' into {len(validated_sub_items)} sub-concepts")
                 return validated_sub_items
 
+            except Cancelled:
+                raise
             except Exception as e:
                 logger.error(f"Error decomposing item '{concepts}': {str(e)}", exc_info=True)
                 # Return empty list on error to not break the main flow
@@ -626,24 +598,33 @@ Generate sub-concepts for the parent concept above:
                     context=item["context"]
                 )
                 return item, sub_concepts
+            except Cancelled:
+                raise
             except Exception as e:
                 logger.warning(f"Failed to decompose item '{item.get('concepts', 'unknown')}': {str(e)}")
                 return item, []
             
-        print(validated_items)
-        
-        # Use ThreadPoolExecutor to run decompositions in parallel
-        with ThreadPoolExecutor(max_workers=min(len(validated_items), 10)) as executor:
-            # Submit all decomposition tasks
-            future_to_item = {
-                executor.submit(decompose_with_error_handling, item): item 
-                for item in validated_items
-            }
-            
-            # Process results as they complete
-            for future in as_completed(future_to_item):
-                item, sub_concepts = future.result()
-                item["sub_concepts"] = sub_concepts
+        logger.debug("Validated items: %s", validated_items)
+        
+        # Run decompositions in parallel on the shared governor pool, which bounds
+        # concurrent Together work process-wide and queues fairly across requests
+        governor = get_governor()
+        future_to_item = {
+            governor.submit("together", decompose_with_error_handling, item): item
+            for item in validated_items
+        }
+        # On disconnect, decompositions that have not started are dropped.
+        cancel_futures_on(token, list(future_to_item))
+        
+        # Process results as they complete
+        for done_count, future in enumerate(as_completed(future_to_item), start=1):
+            raise_if_cancelled()
+            item, sub_concepts = future.result()
+            item["sub_concepts"] = sub_concepts
+            report(
+                0.2 + 0.5 * done_count / len(validated_items),
+                f"Decomposed {done_count}/{len(validated_items)} concepts",
+            )
         
         # Transform to ConceptTree format
         def transform_to_concept_tree(item: Dict[str, Any]) -> Dict[str, Any]:
@@ -719,13 +700,46 @@ Generate sub-concepts for the parent concept above:
             
             return None
         
-        # Gather videos for each concept
+        def add_video_children(concept_tree: Dict[str, Any], video_children: List[Dict[str, Any]]) -> None:
+            """Add video children to existing children or create new children list"""
+            if video_children:
+                if "children" in concept_tree and concept_tree["children"]:
+                    concept_tree["children"].extend(video_children)
+                else:
+                    concept_tree["children"] = video_children
+                logger.info(f"Added {len(video_children)} videos to concept '{concept_tree.get('name', '')}'")
+
+        # Concepts covered by videos ingested here link to those (at the first mention)
+        # instead of costing a DuckDuckGo search
+        related_index = get_related_video_index()
+        external_indices = []
+        for idx, tree in enumerate(concept_trees):
+            local_videos = related_index.lookup(tree.get("name", ""), exclude=video_id, limit=3)
+            if not local_videos:
+                external_indices.append(idx)
+                continue
+            add_video_children(tree, [
+                {
+                    "id": str(uuid.uuid4()),
+                    "name": video["title"],
+                    "type": "video",
+                    "data": {"video_id": video["video_id"], "start": video["start"], "source": "local"},
+                }
+                for video in local_videos
+            ])
+        logger.info(
+            f"Related videos: {len(concept_trees) - len(external_indices)} concepts covered locally, "
+            f"{len(external_indices)} searched externally"
+        )
+
+        # Gather videos for each remaining concept
         def gather_videos_for_concept(concept_tree: Dict[str, Any]) -> Dict[str, Any]:
             """Gather YouTube videos for a concept and add them as children"""
             try:
                 concept_name = concept_tree.get("name", "")
                 if not concept_name:
                     return concept_tree
+                raise_if_cancelled()
                 
                 logger.debug(f"Gathering videos for concept: {concept_name}")
                 video_results = gather_links(concept_name, max_results=3)
@@ -746,44 +760,105 @@ Generate sub-concepts for the parent concept above:
                             }
                         })
                 
-                # Add video children to existing children or create new children list
-                if video_children:
-                    if "children" in concept_tree and concept_tree["children"]:
-                        concept_tree["children"].extend(video_children)
-                    else:
-                        concept_tree["children"] = video_children
-                    logger.info(f"Added {len(video_children)} videos to concept '{concept_name}'")
-                
+                add_video_children(concept_tree, video_children)
                 return concept_tree
+            except Cancelled:
+                raise
             except Exception as e:
                 logger.warning(f"Error gathering videos for concept '{concept_tree.get('name', 'unknown')}': {str(e)}")
                 return concept_tree
         
-        # Gather videos for all concepts in parallel
-        with ThreadPoolExecutor(max_workers=min(len(concept_trees), 10)) as executor:
-            # Submit all video gathering tasks with index tracking
-            future_to_index = {
-                executor.submit(gather_videos_for_concept, tree): idx 
-                for idx, tree in enumerate(concept_trees)
-            }
-            
-            # Process results and maintain order
-            updated_trees = [None] * len(concept_trees)
-            for future in as_completed(future_to_index):
-                idx = future_to_index[future]
-                updated_tree = future.result()
-                updated_trees[idx] = updated_tree
+        # Search for the remaining concepts in parallel (DuckDuckGo slots of the governor)
+        future_to_index = {
+            governor.submit("ddg", gather_videos_for_concept, concept_trees[idx]): idx
+            for idx in external_indices
+        }
+        cancel_futures_on(token, list(future_to_index))
+        
+        # Process results and maintain order
+        updated_trees = list(concept_trees)
+        for done_count, future in enumerate(as_completed(future_to_index), start=1):
+            raise_if_cancelled()
+            idx = future_to_index[future]
+            updated_tree = future.result()
+            updated_trees[idx] = updated_tree
+            report(
+                0.7 + 0.3 * done_count / len(external_indices),
+                f"Gathered videos for {done_count}/{len(external_indices)} concepts",
+            )
         
         # All futures should complete successfully (errors are handled in gather_videos_for_concept)
         concept_trees = updated_trees
         
         return concept_trees
 
+    except Cancelled as e:
+        logger.info(f"Graph extraction cancelled: {e}")
+        raise
     except Exception as e:
         logger.error(f"Error in transcript_to_item_descriptions: {str(e)}", exc_info=True)
         raise e
 
 
+def graph_cache_params(model: Optional[str], max_transcript_chars: int, chapter: Optional[int] = None) -> Dict[str, Any]:
+    """Cache params of a video's (or one chapter's) concept graph in the "graphs" table."""
+    params: Dict[str, Any] = {"model": model, "max_transcript_chars": max_transcript_chars}
+    if chapter is not None:
+        params["chapter"] = chapter
+    return params
+
+
+def build_video_graph(
+    video_id: str,
+    *,
+    client: "Together",
+    model: Optional[str] = None,
+    temperature: float = 0.7,
+    max_transcript_chars: int = 10000,
+    progress: Optional[Callable[[float, str], None]] = None,
+    chapter: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Build (or load from the artifact store) the concept graph for a video.
+
+    Args:
+        video_id: YouTube video ID
+        client: Together API client instance
+        model: The model to use (default: routed per task)
+        temperature: Sampling temperature (default: 0.7)
+        max_transcript_chars: Maximum characters from transcript to send (default: 10000)
+        progress: Optional callback receiving (fraction done, message)
+        chapter: Build the graph of this chapter only (see helpers.chapters); None for the whole video
+
+    Returns:
+        List of ConceptTree dictionaries, see transcript_to_item_descriptions
+    """
+    def _build() -> List[Dict[str, Any]]:
+        logger.debug(f"Fetching transcript for video_id: {video_id}")
+        transcript_index = get_transcript_index(video_id)
+        if chapter is None:
+            transcript_text = transcript_index.text
+        else:
+            transcript_text = chapter_text(transcript_index, get_chapter(video_id, chapter))
+        logger.debug(f"Transcript text length: {len(transcript_text)} characters")
+        trees = transcript_to_item_descriptions(
+            transcript_text,
+            client=client,
+            model=model,
+            temperature=temperature,
+            max_transcript_chars=max_transcript_chars,
+            progress=progress,
+            video_id=video_id,
+        )
+        get_related_video_index().add_graph(video_id, trees)
+        return trees
+
+    cache_params = graph_cache_params(model, max_transcript_chars, chapter)
+    # Cached graphs are served directly; concurrent builds of the same graph share one run.
+    # Admission (see helpers.admission) is only needed, and waited for, on a cache miss.
+    return get_store().get_or_create("graphs", video_id, _build, cache_params, gate=get_admission().gate("graph"))
+
+
 def gather_links(topic: str, max_results: int = 10) -> Dict[str, List[Dict[str, str]]]:
     """
     Search DuckDuckGo for YouTube videos related to a topic.
@@ -796,8 +871,6 @@ def gather_links(topic: str, max_results: int = 10) -> Dict[str, List[Dict[str,
         Dictionary with one key:
         - "videos": List of dictionaries with "title" and "link" keys (YouTube videos only)
     """
-    from duckduckgo_search import DDGS
-    
     logger.debug(f"🔍 Searching DuckDuckGo for YouTube videos: {topic}...")
     
     results = {
@@ -805,7 +878,9 @@ def gather_links(topic: str, max_results: int = 10) -> Dict[str, List[Dict[str,
     }
     
     try:
-        with DDGS() as ddgs:
+        # No-op when already running as a "ddg" task of the governor.
+        with get_governor().slot("ddg"):
+            ddgs = get_http_clients().ddgs()
             # Get Video Links and filter for YouTube only
             video_gen = ddgs.videos(
                 keywords=topic,
@@ -1,8 +1,9 @@
-import json
 from fastapi import HTTPException
-from youtube_transcript_api import YouTubeTranscriptApi
+from youtube_transcript_api import RequestBlocked, YouTubeRequestFailed
+from helpers.fetch_scheduler import SchedulerTimeout, get_youtube_scheduler
+from helpers.governor import get_governor
+from helpers.http_clients import get_http_clients
 from typing import Optional, TYPE_CHECKING
-import os
 if TYPE_CHECKING:
     from youtube_transcript_api._types import FetchedTranscript
 
@@ -10,6 +11,8 @@ if TYPE_CHECKING:
 def fetch_transcript(video_id: str, language_code: Optional[str] = None) -> "FetchedTranscript":
     """
     Helper function to fetch transcript from YouTube.
+    Caching is handled by helpers.transcripts.get_transcript; pacing and priority
+    by helpers.fetch_scheduler.
     
     Args:
         video_id: YouTube video ID
@@ -19,29 +22,35 @@ def fetch_transcript(video_id: str, language_code: Optional[str] = None) -> "Fet
         FetchedTranscript object
     
     Raises:
-        HTTPException: If transcript cannot be fetched
+        HTTPException: If transcript cannot be fetched (503 while YouTube is blocking us)
     """
-    file_path = f"transcript_{video_id}.json"
-
-    # 1. Try to use cache
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            # Cache is corrupted; delete and regenerate
-            os.remove(file_path)
-
+    scheduler = get_youtube_scheduler()
     try:
-        ytt_api = YouTubeTranscriptApi()
-        
-        if language_code:
-            fetched_transcript = ytt_api.fetch(video_id)
-        else:
-            fetched_transcript = ytt_api.fetch(video_id)
+        with scheduler.slot(), get_governor().slot("youtube"):
+            # Per-thread API object on the shared, kept-alive YouTube connection pool.
+            ytt_api = get_http_clients().youtube_api()
+            
+            if language_code:
+                fetched_transcript = ytt_api.fetch(video_id)
+            else:
+                fetched_transcript = ytt_api.fetch(video_id)
         
+        scheduler.report_success()
         return fetched_transcript
+    except SchedulerTimeout as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many transcript requests right now, please retry shortly.",
+            headers={"Retry-After": str(int(e.retry_after + 0.5))},
+        )
     except Exception as e:
+        if _is_blocked(e):
+            backoff = scheduler.report_blocked()
+            raise HTTPException(
+                status_code=503,
+                detail="YouTube is temporarily limiting transcript requests, please retry later.",
+                headers={"Retry-After": str(int(backoff))},
+            )
         error_message = str(e)
         if "No transcripts were found" in error_message or "could not retrieve a transcript" in error_message:
             raise HTTPException(
@@ -59,3 +68,10 @@ def fetch_transcript(video_id: str, language_code: Optional[str] = None) -> "Fet
                 detail=f"Error fetching transcript: {error_message}"
             )
 
+
+
+def _is_blocked(error: Exception) -> bool:
+    # RequestBlocked covers IpBlocked; a plain 429 surfaces as YouTubeRequestFailed.
+    if isinstance(error, RequestBlocked):
+        return True
+    return isinstance(error, YouTubeRequestFailed) and "429" in error.reason
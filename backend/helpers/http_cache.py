@@ -0,0 +1,115 @@
+"""
+Conditional and compressed JSON responses.
+
+json_response serializes once (with orjson when available), derives a weak ETag from
+the body, answers If-None-Match revalidations with 304 and compresses the body with
+brotli (when the optional `brotli` package is installed) or gzip according to
+Accept-Encoding. json_bytes_response does the same for bodies that are already
+serialized, such as artifacts read straight from the store.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from helpers.storage import encode_payload
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+# Response class for routes that return Python objects: orjson encodes several times
+# faster than the json module when it is installed.
+DEFAULT_RESPONSE_CLASS = ORJSONResponse if orjson is not None else JSONResponse
+
+# Bodies smaller than this are sent uncompressed; the headers would eat the savings.
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def etag_for(body: bytes) -> str:
+    # Weak: the same entity is served with different content encodings.
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def _accepted_encodings(accept_encoding: Optional[str]) -> Dict[str, float]:
+    encodings: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[name.strip().lower()] = quality
+    return encodings
+
+
+def compress_body(body: bytes, accept_encoding: Optional[str]) -> tuple[bytes, Optional[str]]:
+    """
+    Compress body with the best encoding the client accepts.
+
+    Returns:
+        (body, content_encoding) where content_encoding is None if left uncompressed
+    """
+    if len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if accepted.get("gzip", 0) > 0:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def json_bytes_response(request: Request, body: bytes, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Serve an already serialized JSON body with ETag revalidation and compression.
+
+    Args:
+        request: Incoming request (If-None-Match and Accept-Encoding are read from it)
+        body: UTF-8 encoded JSON
+        headers: Extra response headers (e.g. Cache-Control)
+
+    Returns:
+        200 response with the (possibly compressed) body, or 304 if the client's copy is current
+    """
+    etag = etag_for(body)
+    response_headers = {"ETag": etag, "Vary": "Accept-Encoding", **(headers or {})}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=response_headers)
+
+    body, encoding = compress_body(body, request.headers.get("accept-encoding"))
+    if encoding is not None:
+        response_headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=response_headers)
+
+
+def json_response(request: Request, content: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serialize content compactly (orjson when available) and serve it via json_bytes_response."""
+    return json_bytes_response(request, encode_payload(content), headers)
@@ -0,0 +1,349 @@
+"""
+Long-lived, pooled HTTP clients for the upstream services.
+
+Before, every transcript fetch built a new YouTubeTranscriptApi (and requests
+Session), every link search a new DDGS client, and the Together SDK one Session
+per thread that it throws away every few minutes. Each of those paid for new TCP
+and TLS handshakes (and a DNS lookup) on the request path.
+
+Now one UpstreamClients object per process owns:
+- one connection pool (a requests HTTPAdapter, keep-alive) per upstream, shared by
+  all threads. Threads get their own Session on top of it, because sessions carry
+  cookies (YouTubeTranscriptApi is explicitly not thread-safe), but they all draw
+  connections from the shared pool,
+- the Together SDK's sessions, via its `together.requestssession` hook,
+- one DDGS client per thread (its primp client keeps connections alive and speaks
+  HTTP/2 on its own),
+- a small, bounded DNS cache used by the pools' new connections only (the rest of
+  the process resolves names as usual). Entries live for the record's TTL, capped
+  at KNOWTUBE_DNS_TTL seconds.
+
+requests only speaks HTTP/1.1, so the Together and YouTube pools rely on keep-alive
+rather than HTTP/2.
+
+main.py starts the clients at startup (app.state.http_clients) and closes them on
+shutdown; code outside the app (warm-up, jobs) gets the same object from
+get_http_clients(). Pool usage is reported under "http_pools" in GET /metrics.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util import connection as urllib3_connection
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+Timeout = Union[None, float, Tuple[float, float]]
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    # Connections kept per host; should cover the governor's concurrency for the upstream.
+    pool_size: int
+    # (connect, read) seconds applied when the caller passes no timeout.
+    timeout: Timeout
+    # Retries of failed connection attempts (never of requests that reached the server).
+    connect_retries: int = 2
+
+
+UPSTREAMS: Dict[str, UpstreamConfig] = {
+    # The SDK passes its own (long) read timeout on every call.
+    "together": UpstreamConfig(pool_size=int(os.getenv("KNOWTUBE_TOGETHER_POOL_SIZE", "32")), timeout=(5.0, 600.0)),
+    "youtube": UpstreamConfig(pool_size=int(os.getenv("KNOWTUBE_YOUTUBE_POOL_SIZE", "8")), timeout=(5.0, 30.0)),
+}
+DDG_TIMEOUT = int(os.getenv("KNOWTUBE_DDG_TIMEOUT", "10"))
+DNS_TTL_SECONDS = float(os.getenv("KNOWTUBE_DNS_TTL", "300"))
+DNS_CACHE_MAX_ENTRIES = 256
+# Seconds allowed for the extra lookup that reads a record's TTL.
+DNS_TTL_LOOKUP_SECONDS = 2.0
+
+
+class _PooledSession(requests.Session):
+    """
+    Session on a shared HTTPAdapter, with a default timeout.
+
+    close() leaves the shared pool open: the Together SDK closes its sessions
+    periodically, and the pool belongs to UpstreamClients.
+    """
+
+    def __init__(self, adapter: HTTPAdapter, timeout: Timeout) -> None:
+        super().__init__()
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self._default_timeout = timeout
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self._default_timeout
+        return super().request(method, url, **kwargs)
+
+    def close(self) -> None:
+        self.cookies.clear()
+
+
+class UpstreamPool:
+    """Connection pool of one upstream plus per-thread sessions on top of it."""
+
+    def __init__(self, name: str, config: UpstreamConfig) -> None:
+        self.name = name
+        self.config = config
+        self.adapter = _PooledAdapter(
+            pool_connections=4,
+            pool_maxsize=config.pool_size,
+            max_retries=requests.adapters.Retry(total=0, connect=config.connect_retries, read=False, redirect=False),
+        )
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.sessions_created = 0
+
+    def new_session(self) -> _PooledSession:
+        with self._lock:
+            self.sessions_created += 1
+        return _PooledSession(self.adapter, self.config.timeout)
+
+    def session(self) -> _PooledSession:
+        """The calling thread's session."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self.new_session()
+        return session
+
+    def close(self) -> None:
+        self.adapter.close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        hosts = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts[pool.host] = {
+                # Connections opened over the pool's lifetime (a low number per request is the point).
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                # The pool queue is pre-filled with None placeholders for unopened connections.
+                "idle": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+                "max": self.config.pool_size,
+            }
+        return {"sessions": self.sessions_created, "hosts": hosts}
+
+
+class _DnsCache:
+    """
+    Bounded LRU of resolved addresses, per (host, port).
+
+    getaddrinfo does not report TTLs, so the record's TTL is read with dnspython
+    when available; entries expire after it, capped at max_ttl.
+    """
+
+    def __init__(self, max_ttl: float, max_entries: int = DNS_CACHE_MAX_ENTRIES) -> None:
+        self.max_ttl = max_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, List[Tuple[str, int]]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _ttl(self, host: str) -> float:
+        try:
+            import dns.resolver
+
+            answer = dns.resolver.resolve(host, "A", lifetime=DNS_TTL_LOOKUP_SECONDS)
+            return min(self.max_ttl, float(answer.rrset.ttl))
+        except Exception:
+            # No dnspython, or a name only the system resolver knows (/etc/hosts).
+            return self.max_ttl
+
+    def resolve(self, host: str, port: int) -> List[Tuple[str, int]]:
+        """
+        Addresses to connect to for host:port, in getaddrinfo order.
+
+        Raises:
+            socket.gaierror: If the name does not resolve
+        """
+        try:
+            ipaddress.ip_address(host.strip("[]"))
+            return [(host.strip("[]"), port)]
+        except ValueError:
+            pass
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        infos = socket.getaddrinfo(host, port, urllib3_connection.allowed_gai_family(), socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys((info[4][0], info[4][1]) for info in infos))
+        ttl = self._ttl(host) if self.max_ttl > 0 else 0.0
+        if ttl > 0:
+            with self._lock:
+                self._entries[key] = (now + ttl, addresses)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return addresses
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_dns_cache = _DnsCache(DNS_TTL_SECONDS)
+
+
+class _CachedDnsConnection:
+    """urllib3 connection mixin that resolves the host through _dns_cache."""
+
+    def _new_conn(self) -> socket.socket:
+        try:
+            addresses = _dns_cache.resolve(self._dns_host, self.port)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        error: Optional[Exception] = None
+        for address in addresses:
+            # An IP literal: no lookup. TLS still verifies (and sends SNI for) self.host.
+            try:
+                return urllib3_connection.create_connection(
+                    address, self.timeout, source_address=self.source_address, socket_options=self.socket_options
+                )
+            except socket.timeout:
+                error = ConnectTimeoutError(
+                    self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})"
+                )
+            except OSError as e:
+                error = NewConnectionError(self, f"Failed to establish a new connection: {e}")
+        raise error or NewConnectionError(self, f"No addresses for {self.host}")
+
+
+class _HTTPConnection(_CachedDnsConnection, HTTPConnection):
+    pass
+
+
+class _HTTPSConnection(_CachedDnsConnection, HTTPSConnection):
+    pass
+
+
+class _HTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _HTTPConnection
+
+
+class _HTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _HTTPSConnection
+
+
+class _PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose new connections resolve names through the DNS cache."""
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _HTTPConnectionPool, "https": _HTTPSConnectionPool}
+
+
+class UpstreamClients:
+    """Owner of the pooled clients of every upstream."""
+
+    def __init__(self, upstreams: Dict[str, UpstreamConfig] = UPSTREAMS) -> None:
+        self.pools = {name: UpstreamPool(name, config) for name, config in upstreams.items()}
+        self._local = threading.local()
+        self._ddg_clients = 0
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self) -> "UpstreamClients":
+        """Hand the Together SDK the shared pool (idempotent)."""
+        import together
+
+        with self._lock:
+            if not self._started:
+                together.requestssession = self.pools["together"].new_session
+                self._started = True
+        return self
+
+    def close(self) -> None:
+        """Close every pool and undo start()."""
+        import together
+
+        with self._lock:
+            if together.requestssession == self.pools["together"].new_session:
+                together.requestssession = None
+            _dns_cache.clear()
+            for pool in self.pools.values():
+                pool.close()
+            self._started = False
+
+    def session(self, upstream: str) -> requests.Session:
+        """The calling thread's pooled session for `upstream`."""
+        return self.pools[upstream].session()
+
+    def youtube_api(self) -> Any:
+        """The calling thread's YouTubeTranscriptApi, on the shared YouTube pool."""
+        from youtube_transcript_api import YouTubeTranscriptApi
+
+        api = getattr(self._local, "youtube_api", None)
+        if api is None:
+            api = self._local.youtube_api = YouTubeTranscriptApi(http_client=self.session("youtube"))
+        return api
+
+    def ddgs(self) -> Any:
+        """The calling thread's DuckDuckGo search client."""
+        from duckduckgo_search import DDGS
+
+        client = getattr(self._local, "ddgs", None)
+        if client is None:
+            client = self._local.ddgs = DDGS(timeout=DDG_TIMEOUT)
+            with self._lock:
+                self._ddg_clients += 1
+        return client
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot: Dict[str, Any] = {name: pool.snapshot() for name, pool in self.pools.items()}
+        snapshot["ddg"] = {"clients": self._ddg_clients}
+        snapshot["dns"] = _dns_cache.snapshot()
+        return snapshot
+
+
+_clients: Optional[UpstreamClients] = None
+_clients_lock = threading.Lock()
+
+
+def get_http_clients() -> UpstreamClients:
+    """The process-wide (started) upstream clients."""
+    global _clients
+    if _clients is None:
+        with _clients_lock:
+            if _clients is None:
+                _clients = UpstreamClients().start()
+                metrics.register("http_pools", _clients.snapshot)
+    return _clients
+
+
+def close_http_clients() -> None:
+    global _clients
+    with _clients_lock:
+        if _clients is not None:
+            _clients.close()
+            _clients = None
@@ -0,0 +1,82 @@
+"""
+One-shot importer that moves loose cache files from the working directory into the artifact store.
+
+Usage (from the backend directory):
+    python -m helpers.import_legacy [directory]
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+from typing import Optional
+
+from helpers.storage import ArtifactStore, get_store
+
+# The frontend always requested flashcards with this window, and the legacy cache
+# files did not record it.
+LEGACY_FLASHCARD_CONTEXT_SECONDS = 45
+
+
+def import_legacy_files(directory: Path, store: Optional[ArtifactStore] = None) -> dict:
+    """
+    Import transcript_*.json, flashcards_*.json, quiz_debug.* and actions/colors button files.
+
+    Args:
+        directory: Directory holding the legacy files (the old process working directory)
+        store: Target store (default: the process-wide store)
+
+    Returns:
+        Mapping of table name to the number of imported entries
+    """
+    store = store or get_store()
+    counts = {"transcripts": 0, "flashcards": 0, "debug": 0, "actions": 0, "colors": 0}
+
+    transcripts = []
+    for path in sorted(directory.glob("transcript_*.json")):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            print(f"Skipping corrupted transcript file: {path}")
+            continue
+        video_id = data.get("video_id") or path.stem[len("transcript_"):]
+        transcripts.append((video_id, None, data))
+    counts["transcripts"] = store.put_many("transcripts", transcripts)
+
+    flashcards = []
+    for path in sorted(directory.glob("flashcards_*.json")):
+        # Video IDs may themselves contain underscores, so split the timestamp off the right.
+        video_id, _, time_stamp = path.stem[len("flashcards_"):].rpartition("_")
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            params = {"time_stamp": float(time_stamp), "context_seconds": LEGACY_FLASHCARD_CONTEXT_SECONDS}
+        except (json.JSONDecodeError, ValueError):
+            print(f"Skipping unreadable flashcard file: {path}")
+            continue
+        flashcards.append((video_id, params, data))
+    counts["flashcards"] = store.put_many("flashcards", flashcards)
+
+    debug = []
+    for name in ("quiz_debug.txt", "quiz_debug.json"):
+        path = directory / name
+        if path.exists():
+            debug.append(("", {"kind": "quiz", "source": name}, path.read_text(encoding="utf-8")))
+    counts["debug"] = store.put_many("debug", debug)
+
+    for kind in ("actions", "colors"):
+        items = []
+        for path in sorted((directory / kind).glob("*.txt")):
+            if path.stem.isdigit():
+                items.append((int(path.stem), path.read_text(encoding="utf-8")))
+        store.set_buttons(kind, items)
+        counts[kind] = len(items)
+
+    return counts
+
+
+if __name__ == "__main__":
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(".")
+    imported = import_legacy_files(source)
+    for table, count in imported.items():
+        print(f"{table}: {count}")
@@ -0,0 +1,182 @@
+"""
+Background jobs for long-running graph and quiz generation.
+
+Submitting a job returns immediately with its ID; a bounded worker pool runs the
+pipeline and every status change is written to the artifact store (jobs and
+job_events tables), so GET /jobs/{id} and the SSE progress stream survive client
+reconnects. Identical submissions attach to the existing job.
+
+A queued or running job whose worker process died is failed as soon as it is
+looked at (submit, GET /jobs/{id}, the SSE stream), so nobody waits on it forever
+and a resubmission starts a new job.
+
+Finished jobs and their events are deleted JOB_RETENTION_SECONDS after they finish
+(KNOWTUBE_JOB_RETENTION, default one day); a later identical submission then starts
+a new job (usually answered from the artifact cache).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple, TYPE_CHECKING
+
+from fastapi import HTTPException
+
+from helpers.fetch_scheduler import BACKGROUND, fetch_priority
+from helpers.graph import build_video_graph
+from helpers.quiz.create_quiz import generate_quiz_from_transcript
+from helpers.storage import get_store, owner_alive, params_key, process_owner
+
+if TYPE_CHECKING:
+    from together import Together
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("KNOWTUBE_JOB_WORKERS", "4"))
+JOB_RETENTION_SECONDS = float(os.getenv("KNOWTUBE_JOB_RETENTION", str(24 * 3600)))
+
+ACTIVE_STATUSES = ("queued", "running")
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+ProgressCallback = Callable[[float, str], None]
+
+
+def _run_graph(params: Mapping[str, Any], client: "Together", progress: ProgressCallback) -> Any:
+    return build_video_graph(
+        params["video_id"],
+        client=client,
+        model=params.get("model"),
+        temperature=params.get("temperature", 0.7),
+        max_transcript_chars=params.get("max_transcript_chars", 10000),
+        progress=progress,
+    )
+
+
+def _run_quiz(params: Mapping[str, Any], client: "Together", progress: ProgressCallback) -> Any:
+    progress(0.1, "Generating quiz")
+    return generate_quiz_from_transcript(
+        video_id=params["video_id"],
+        language_code=params.get("language_code"),
+        temperature=params.get("temperature", 0.3),
+        difficulty_level=params.get("difficulty_level", "medium"),
+        client=client,
+    )
+
+
+PIPELINES: Dict[str, Callable[[Mapping[str, Any], "Together", ProgressCallback], Any]] = {
+    "graph": _run_graph,
+    "quiz": _run_quiz,
+}
+
+
+class JobManager:
+    """Runs submitted jobs on a bounded pool and persists their progress."""
+
+    def __init__(self, max_workers: int = JOB_WORKERS) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._fail_orphaned_jobs()
+        self._prune_finished_jobs()
+
+    def _fail_orphaned_jobs(self) -> None:
+        for job in get_store().unfinished_jobs():
+            self._fail_if_orphaned(job)
+
+    def _fail_if_orphaned(self, job: Optional[dict]) -> Optional[dict]:
+        """
+        The job, failed first if it is queued or running but its owning process died
+        (restart, crash): it would never finish, so clients stop waiting for it and
+        resubmissions start a fresh job.
+        """
+        if job is None or job["status"] not in ACTIVE_STATUSES or owner_alive(job["owner"]):
+            return job
+        store = get_store()
+        with store.locked("jobs", job["id"]):
+            # Another worker may have failed it meanwhile.
+            current = store.get_job(job["id"])
+            if current is not None and current["status"] in ACTIVE_STATUSES:
+                logger.info(f"Failing job {job['id']}: its owner {job['owner']} is gone")
+                store.update_job(
+                    job["id"], status="failed", progress=0.0, message="interrupted",
+                    event="failed", error="Job was interrupted by a server restart.",
+                )
+        return store.get_job(job["id"])
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """The job's current state (None if unknown or expired), orphaned jobs failed first."""
+        return self._fail_if_orphaned(get_store().get_job(job_id))
+
+    def _prune_finished_jobs(self) -> None:
+        deleted = get_store().prune_jobs(TERMINAL_STATUSES, time.time() - JOB_RETENTION_SECONDS)
+        if deleted:
+            logger.info(f"Deleted {deleted} finished jobs older than {JOB_RETENTION_SECONDS:.0f}s")
+
+    def submit(self, kind: str, params: Mapping[str, Any], client: "Together") -> Tuple[dict, bool]:
+        """
+        Start a job, or attach to an identical queued, running or finished one.
+
+        Returns:
+            (job, created) where created is False when an existing job was reused
+        """
+        if kind not in PIPELINES:
+            raise ValueError(f"Unknown job kind: {kind}")
+        store = get_store()
+        dedupe_key = f"{kind}:{params_key(params)}"
+        # Expired jobs are neither reused nor kept.
+        self._prune_finished_jobs()
+
+        with store.locked("jobs", dedupe_key):
+            existing = self._fail_if_orphaned(store.find_job(dedupe_key, (*ACTIVE_STATUSES, "succeeded")))
+            if existing is not None and existing["status"] != "failed":
+                return existing, False
+            job_id = uuid.uuid4().hex
+            store.create_job(job_id, kind, params, dedupe_key, process_owner())
+
+        self._executor.submit(self._run, job_id, kind, dict(params), client)
+        return store.get_job(job_id), True
+
+    def _run(self, job_id: str, kind: str, params: Dict[str, Any], client: "Together") -> None:
+        store = get_store()
+
+        def progress(fraction: float, message: str) -> None:
+            store.update_job(job_id, status="running", progress=fraction, message=message, event="progress")
+
+        progress(0.0, "started")
+        try:
+            # Jobs are background work: their YouTube fetches yield to interactive requests.
+            with fetch_priority(BACKGROUND):
+                result = PIPELINES[kind](params, client, progress)
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else f"{type(e).__name__}: {e}"
+            logger.error(f"Job {job_id} ({kind}) failed: {detail}", exc_info=not isinstance(e, HTTPException))
+            store.update_job(job_id, status="failed", progress=1.0, message="failed", event="failed", error=str(detail))
+            return
+        store.update_job(job_id, status="succeeded", progress=1.0, message="done", event="succeeded", result=result)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Return the process-wide job manager, starting it on first use."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = JobManager()
+    return _manager
+
+
+def shutdown_job_manager() -> None:
+    """Stop the job manager if it was started (called at app shutdown)."""
+    with _manager_lock:
+        if _manager is not None:
+            _manager.shutdown()
@@ -0,0 +1,406 @@
+"""
+Resilient wrapper around Together chat completions used by every generator.
+
+A call is hedged: if the first request has not answered by the model's recent p95
+latency (counted from when it was sent, not while it queued for a model slot), an
+identical second request is sent and whichever finishes first wins.
+Transient failures are retried with jittered exponential backoff, and a per-model
+circuit breaker makes callers fail fast while a model is down.
+
+Completed responses are cached in the shared artifact store keyed by the full request,
+so identical requests from any worker process are answered once; every request that
+does go out draws from the shared Together rate-limit budget. When the calling
+request is cancelled (see helpers.cancellation) the call stops waiting, and responses
+arriving afterwards are still cached.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, TYPE_CHECKING
+
+from together import error as together_error
+from together.types import ChatCompletionResponse
+
+from helpers import profiling
+from helpers.cancellation import CancellationToken, Cancelled, current_token, submit_in_context
+from helpers.governor import get_governor
+from helpers.rate_limit import acquire
+from helpers.storage import get_store
+
+if TYPE_CHECKING:
+    from together import Together
+
+logger = logging.getLogger(__name__)
+
+# Retry policy
+MAX_ATTEMPTS = int(os.getenv("KNOWTUBE_LLM_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+
+# Hedging policy: hedge after the observed p95, clamped to these bounds. Until we
+# have enough samples the default deadline is used.
+HEDGE_ENABLED = os.getenv("KNOWTUBE_LLM_HEDGE", "1") != "0"
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY_SECONDS = 30.0
+HEDGE_MIN_DELAY_SECONDS = 1.0
+HEDGE_MAX_DELAY_SECONDS = 60.0
+
+# Circuit breaker policy
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN_SECONDS = 30.0
+
+LATENCY_WINDOW = 200
+
+# Shared completion cache (artifact store table "completions").
+COMPLETION_CACHE_ENABLED = os.getenv("KNOWTUBE_LLM_CACHE", "1") != "0"
+
+TRANSIENT_ERRORS = (
+    together_error.RateLimitError,
+    together_error.Timeout,
+    together_error.APIConnectionError,
+    together_error.ServiceUnavailableError,
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a model's circuit breaker is open and the call is not attempted."""
+
+
+class ModelStats:
+    """Rolling latency and outcome statistics for one model."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.outcomes: Deque[bool] = deque(maxlen=LATENCY_WINDOW)
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def count_hedge(self, won: bool = False) -> None:
+        """Count a hedged request (won: the hedge answered first)."""
+        with self._lock:
+            if won:
+                self.hedge_wins += 1
+            else:
+                self.hedges += 1
+
+    def record(self, latency: Optional[float], ok: bool) -> None:
+        with self._lock:
+            if ok and latency is not None:
+                self.latencies.append(latency)
+            self.outcomes.append(ok)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def hedge_delay(self) -> float:
+        with self._lock:
+            enough = len(self.latencies) >= HEDGE_MIN_SAMPLES
+        if not enough:
+            return HEDGE_DEFAULT_DELAY_SECONDS
+        p95 = self.quantile(HEDGE_QUANTILE)
+        return min(HEDGE_MAX_DELAY_SECONDS, max(HEDGE_MIN_DELAY_SECONDS, p95))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "samples": len(self.latencies),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "error_rate": self.error_rate(),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+
+    After BREAKER_FAILURE_THRESHOLD consecutive failures the breaker opens for
+    BREAKER_COOLDOWN_SECONDS; afterwards a single probe call is let through and its
+    outcome decides whether the breaker closes again.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= BREAKER_COOLDOWN_SECONDS:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def release(self) -> None:
+        """End a call whose outcome says nothing about model health (e.g. a 4xx)."""
+        with self._lock:
+            # A half-open breaker lets the next call probe instead.
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._probing or self.consecutive_failures >= BREAKER_FAILURE_THRESHOLD:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+_registry_lock = threading.Lock()
+_stats: Dict[str, ModelStats] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+
+# Shared pool for primary and hedged requests. The blocking Together client cannot be
+# interrupted, so a losing request simply finishes in the background.
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("KNOWTUBE_LLM_WORKERS", "32")), thread_name_prefix="llm")
+
+
+def get_model_stats(model: str) -> ModelStats:
+    with _registry_lock:
+        return _stats.setdefault(model, ModelStats())
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    with _registry_lock:
+        return _breakers.setdefault(model, CircuitBreaker())
+
+
+def stats_snapshot() -> Dict[str, Dict[str, Any]]:
+    """Per-model latency, error and breaker state, for diagnostics."""
+    with _registry_lock:
+        models = list(_stats)
+    return {model: {**get_model_stats(model).snapshot(), "breaker": get_breaker(model).state} for model in models}
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, TRANSIENT_ERRORS):
+        return True
+    status = getattr(exc, "http_status", None)
+    return status is not None and (status in (408, 429) or status >= 500)
+
+
+def _timed_call(client: "Together", model: str, kwargs: Dict[str, Any], started: Optional[Future] = None) -> Any:
+    stats = get_model_stats(model)
+    # Bounded concurrency per model, queued fairly across requests; then the rate budget.
+    with profiling.thread_scope(), get_governor().slot(f"together:{model}"):
+        acquire("together")
+        if started is not None:
+            # The hedge deadline counts from here, not from the time spent queued.
+            started.set_result(None)
+        start = time.monotonic()
+        try:
+            response = client.chat.completions.create(model=model, **kwargs)
+        except Exception:
+            stats.record(None, ok=False)
+            raise
+    stats.record(time.monotonic() - start, ok=True)
+    return response
+
+
+def _hedged_call(
+    client: "Together",
+    model: str,
+    kwargs: Dict[str, Any],
+    hedge: bool,
+    token: Optional[CancellationToken] = None,
+    keep: Optional[Callable[[Any], None]] = None,
+) -> Any:
+    stats = get_model_stats(model)
+    started: Future = Future()
+    primary = submit_in_context(_executor, _timed_call, client, model, kwargs, started)
+    # Waiting on the token's future as well makes a cancellation end the wait at once.
+    cancelled = [token.future] if token is not None else []
+    pending: List[Future] = [primary]
+
+    def _abandon() -> None:
+        # The blocking requests cannot be interrupted; let their results reach the cache.
+        for future in pending:
+            if keep is not None:
+                future.add_done_callback(lambda f: f.exception() is None and keep(f.result()))
+        raise Cancelled(token.reason)
+
+    if hedge:
+        # A primary still queued for a model slot is not slow, the model is saturated;
+        # a duplicate would only queue behind it. Start the hedge clock once it is sent.
+        done, _ = wait([primary, started] + cancelled, return_when=FIRST_COMPLETED)
+        if primary not in done and started not in done:
+            _abandon()
+    done, _ = wait(pending + cancelled, timeout=stats.hedge_delay() if hedge else None, return_when=FIRST_COMPLETED)
+    if primary in done:
+        return primary.result()
+    if done:
+        _abandon()
+
+    logger.info(f"Hedging slow completion for model={model}")
+    stats.count_hedge()
+    secondary = submit_in_context(_executor, _timed_call, client, model, kwargs)
+    pending = [primary, secondary]
+    first_error: Optional[BaseException] = None
+    while pending:
+        done, not_done = wait(pending + cancelled, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future not in pending:
+                continue
+            exc = future.exception()
+            if exc is None:
+                if future is secondary:
+                    stats.count_hedge(won=True)
+                return future.result()
+            first_error = first_error or exc
+        pending = list(not_done - set(cancelled))
+        if pending and token is not None and token.cancelled:
+            _abandon()
+    raise first_error
+
+
+def chat_completion(
+    client: "Together",
+    *,
+    model: str,
+    messages: List[Dict[str, Any]],
+    max_attempts: int = MAX_ATTEMPTS,
+    hedge: bool = HEDGE_ENABLED,
+    cache: bool = COMPLETION_CACHE_ENABLED,
+    **kwargs: Any,
+) -> Any:
+    """
+    Drop-in replacement for client.chat.completions.create with hedging, retries and
+    a per-model circuit breaker.
+
+    Args:
+        client: Together API client instance
+        model: The model to use for completion
+        messages: Chat messages
+        max_attempts: Total attempts for transient errors (default: KNOWTUBE_LLM_MAX_ATTEMPTS)
+        hedge: Send a duplicate request once the first passes the p95 deadline
+        cache: Serve identical requests from the shared completion cache
+        **kwargs: Forwarded to chat.completions.create (temperature, max_tokens, ...)
+
+    Returns:
+        The Together chat completion response
+
+    Raises:
+        CircuitOpenError: If the model's circuit breaker is open
+        Cancelled: If the calling request's cancellation token fires first
+    """
+    kwargs = {"messages": messages, **kwargs}
+    token = current_token()
+    if not cache:
+        return _call_with_retries(client, model, kwargs, max_attempts, hedge, token)
+
+    store = get_store()
+    cache_key = _completion_cache_key(model, kwargs)
+    params = {"model": model}
+
+    def keep(response: Any) -> None:
+        if _cacheable(response):
+            store.put("completions", cache_key, response.model_dump(mode="json"), params)
+
+    cached = store.get("completions", cache_key, params)
+    if cached is None:
+        # Identical in-flight requests (in any worker process) wait for the first one.
+        with store.locked("completions", cache_key, params):
+            cached = store.get("completions", cache_key, params)
+            if cached is None:
+                response = _call_with_retries(client, model, kwargs, max_attempts, hedge, token, keep)
+                keep(response)
+                return response
+    return ChatCompletionResponse.model_validate(cached)
+
+
+def _completion_cache_key(model: str, kwargs: Dict[str, Any]) -> str:
+    request = json.dumps({"model": model, **kwargs}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+
+def _cacheable(response: Any) -> bool:
+    # Only keep complete answers; truncated or empty ones should be retried next time.
+    if not isinstance(response, ChatCompletionResponse) or not response.choices:
+        return False
+    choice = response.choices[0]
+    return bool(choice.message and choice.message.content) and choice.finish_reason in (None, "stop", "eos")
+
+
+def _call_with_retries(
+    client: "Together",
+    model: str,
+    kwargs: Dict[str, Any],
+    max_attempts: int,
+    hedge: bool,
+    token: Optional[CancellationToken] = None,
+    keep: Optional[Callable[[Any], None]] = None,
+) -> Any:
+    breaker = get_breaker(model)
+    for attempt in range(1, max_attempts + 1):
+        if token is not None:
+            token.raise_if_cancelled()
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker open for model {model}; failing fast.")
+        try:
+            response = _hedged_call(client, model, kwargs, hedge, token, keep)
+        except Cancelled:
+            raise
+        except Exception as exc:
+            if not is_transient(exc):
+                # Request errors (bad prompt, auth) say nothing about model health.
+                breaker.release()
+                raise
+            breaker.record_failure()
+            if attempt == max_attempts:
+                raise
+            delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)))
+            logger.warning(
+                f"Transient error from model={model} (attempt {attempt}/{max_attempts}): {exc}; retrying in {delay:.2f}s"
+            )
+            if token is not None:
+                token.sleep(delay)
+            else:
+                time.sleep(delay)
+            continue
+        breaker.record_success()
+        return response
+
+    raise RuntimeError("unreachable")
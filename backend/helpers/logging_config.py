@@ -0,0 +1,236 @@
+"""
+Non-blocking logging for the backend.
+
+Request threads only put log records on an in-memory queue; one background thread
+(a QueueListener) formats them and writes them to stdout. Writing to a pipe under
+PYTHONUNBUFFERED=1 can block when the log collector is slow, and formatting large
+payloads is not free, so neither happens on a request path anymore.
+
+On top of that:
+- per-logger sampling for high-rate endpoints (KNOWTUBE_LOG_SAMPLE, e.g.
+  "routes.buttons=0.05" keeps every 20th record); warnings and errors are never
+  sampled out,
+- messages longer than KNOWTUBE_LOG_MAX_CHARS (default 2000) are truncated,
+- when the queue is full (KNOWTUBE_LOG_QUEUE_SIZE records) new records are dropped
+  instead of blocking the caller.
+
+Counts of written, sampled-out and dropped records are reported under "logging" in
+GET /metrics. Call configure_logging() once at startup (main.py does).
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from helpers import metrics
+
+LOG_LEVEL = os.getenv("KNOWTUBE_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+MAX_MESSAGE_CHARS = int(os.getenv("KNOWTUBE_LOG_MAX_CHARS", "2000"))
+QUEUE_SIZE = int(os.getenv("KNOWTUBE_LOG_QUEUE_SIZE", "10000"))
+# Default sample rates per logger (and its children); KNOWTUBE_LOG_SAMPLE overrides them.
+DEFAULT_SAMPLE_RATES: Dict[str, float] = {
+    # Button state is posted on every click of the Logitech plugin.
+    "routes.buttons": 0.05,
+}
+
+# uvicorn installs its own (synchronous) handlers on these; they are sent through the queue too.
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.access")
+
+# Arguments of these types are safe to format later on the listener thread.
+_IMMUTABLE_ARGS = (str, bytes, int, float, bool, type(None))
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """
+    Parse "logger=rate,logger=rate" into a dict (rates are clamped to [0, 1]).
+
+    Raises:
+        ValueError: On a malformed entry
+    """
+    rates = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = entry.partition("=")
+        if not name or not rate:
+            raise ValueError(f"Malformed KNOWTUBE_LOG_SAMPLE entry: {entry!r}")
+        rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class _Counters:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.written = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.truncated = 0
+
+    def add(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "written": self.written,
+                "sampled_out": self.sampled_out,
+                "dropped": self.dropped,
+                "truncated": self.truncated,
+                "queued": _queue.qsize() if _queue is not None else 0,
+            }
+
+
+_counters = _Counters()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep one in every 1/rate records below WARNING for the configured loggers.
+
+    Sampling is deterministic (every n-th record per logger), so a rate of 0.05
+    keeps exactly one record in twenty.
+    """
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self._rates = rates
+        self._lock = threading.Lock()
+        self._seen: Dict[str, int] = {}
+        self._resolved: Dict[str, Optional[float]] = {}
+
+    def _rate(self, name: str) -> Optional[float]:
+        # Most specific configured ancestor wins ("routes.buttons" covers "routes.buttons.x").
+        if name not in self._resolved:
+            candidate: Optional[str] = name
+            rate = None
+            while candidate:
+                if candidate in self._rates:
+                    rate = self._rates[candidate]
+                    break
+                candidate = candidate.rpartition(".")[0] or None
+            self._resolved[name] = rate
+        return self._resolved[name]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate is None or rate >= 1.0:
+            return True
+        if rate > 0:
+            every = max(1, round(1 / rate))
+            with self._lock:
+                seen = self._seen.get(record.name, 0)
+                self._seen[record.name] = seen + 1
+            if seen % every == 0:
+                return True
+        _counters.add("sampled_out")
+        return False
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that defers formatting to the listener and drops records when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare() formats on the calling thread. Only merge the arguments
+        # here when they might be mutated before the listener gets to them.
+        if record.args and not all(isinstance(arg, _IMMUTABLE_ARGS) for arg in _args_of(record)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info and not record.exc_text:
+            # The traceback references live frames; render it now.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _counters.add("dropped")
+
+
+def _args_of(record: logging.LogRecord):
+    return record.args.values() if isinstance(record.args, dict) else record.args
+
+
+class _TruncatingFormatter(logging.Formatter):
+    def __init__(self, fmt: str, max_chars: int) -> None:
+        super().__init__(fmt)
+        self._max_chars = max_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        message = record.message
+        if self._max_chars and len(message) > self._max_chars:
+            record.message = f"{message[: self._max_chars]}... ({len(message) - self._max_chars} chars truncated)"
+            _counters.add("truncated")
+        _counters.add("written")
+        return super().formatMessage(record)
+
+
+_queue: Optional[queue.Queue] = None
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(
+    level: str = LOG_LEVEL,
+    sample_rates: Optional[Dict[str, float]] = None,
+    max_chars: int = MAX_MESSAGE_CHARS,
+    queue_size: int = QUEUE_SIZE,
+) -> None:
+    """
+    Route the root logger through a queue and a background writer thread.
+
+    Idempotent: later calls (e.g. from uvicorn's reloader) keep the first setup.
+
+    Args:
+        level: Root log level
+        sample_rates: Logger name -> fraction of records below WARNING to keep
+                      (default: DEFAULT_SAMPLE_RATES updated from KNOWTUBE_LOG_SAMPLE)
+        max_chars: Truncate longer messages (0: never)
+        queue_size: Records buffered before new ones are dropped
+    """
+    global _queue, _listener
+    if _listener is not None:
+        return
+    if sample_rates is None:
+        sample_rates = {**DEFAULT_SAMPLE_RATES, **parse_sample_rates(os.getenv("KNOWTUBE_LOG_SAMPLE", ""))}
+
+    _queue = queue.Queue(maxsize=queue_size)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(_TruncatingFormatter(LOG_FORMAT, max_chars))
+    _listener = QueueListener(_queue, stream, respect_handler_level=True)
+
+    handler = _NonBlockingQueueHandler(_queue)
+    handler.addFilter(SamplingFilter(sample_rates))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        for existing in list(uvicorn_logger.handlers):
+            uvicorn_logger.removeHandler(existing)
+        uvicorn_logger.propagate = True
+
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush the queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+metrics.register("logging", _counters.snapshot)
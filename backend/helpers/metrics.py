@@ -0,0 +1,36 @@
+"""
+Process-local operational metrics.
+
+Components register a snapshot function under a name; GET /metrics returns all
+snapshots. Snapshots must be cheap and must not raise.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+_sources: Dict[str, Callable[[], Any]] = {}
+_lock = threading.Lock()
+
+
+def register(name: str, snapshot: Callable[[], Any]) -> None:
+    """Expose snapshot() under `name` in GET /metrics (replaces an earlier registration)."""
+    with _lock:
+        _sources[name] = snapshot
+
+
+def collect() -> Dict[str, Any]:
+    with _lock:
+        sources = dict(_sources)
+    result: Dict[str, Any] = {}
+    for name, snapshot in sources.items():
+        try:
+            result[name] = snapshot()
+        except Exception as exc:
+            logger.warning(f"Metrics source {name} failed: {exc}")
+            result[name] = {"error": str(exc)}
+    return result
@@ -0,0 +1,314 @@
+"""
+Opt-in profiling of single requests in production.
+
+Set KNOWTUBE_PROFILE_TOKEN and send a request with the header
+`X-Profile-Token: <token>`. That request then runs under a sampling profiler and
+records the wall time spent waiting for and calling each upstream (Together per
+model, YouTube, DuckDuckGo, rate limits). The profile is stored in the artifact
+store's "debug" table, tagged with the route and video_id, and the response carries
+an X-Profile-Id header (fetch it from GET /profiles/{id}) plus a Server-Timing header
+with the upstream totals.
+
+Without KNOWTUBE_PROFILE_TOKEN the middleware is not installed at all; the hooks in
+the upstream clients then cost one context-variable lookup.
+
+The sampler only sees threads that announce themselves with thread_scope(): the
+generation routes (helpers.cancellation.run_cancellable), governor tasks and LLM
+calls do.
+"""
+
+from __future__ import annotations
+
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs
+
+from helpers.storage import get_store
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile-token"
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("KNOWTUBE_PROFILE_INTERVAL", "0.005"))
+MAX_STACK_DEPTH = 64
+TOP_FUNCTIONS = 40
+TOP_STACKS = 200
+# Stored profiles of requests without a video_id are filed under this key.
+NO_VIDEO = "-"
+
+_session: ContextVar[Optional["ProfileSession"]] = ContextVar("profile_session", default=None)
+
+
+def _profile_token() -> str:
+    # Read on use: main.py loads .env after the helpers are imported.
+    return os.getenv("KNOWTUBE_PROFILE_TOKEN", "")
+
+
+def profiling_enabled() -> bool:
+    return bool(_profile_token())
+
+
+def token_matches(value: Optional[str]) -> bool:
+    expected = _profile_token()
+    return bool(expected) and value is not None and hmac.compare_digest(value.encode(), expected.encode())
+
+
+def _frame_name(frame: Any) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}.{code.co_qualname}"
+
+
+class ProfileSession:
+    """Samples of the registered threads and upstream timings of one request."""
+
+    def __init__(self, route: str, method: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.route = route
+        self.method = method
+        self.video_id: Optional[str] = None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        # Thread ident -> nesting depth of thread_scope().
+        self._threads: Dict[int, int] = {}
+        self._stacks: Counter = Counter()
+        self._upstreams: Dict[str, Dict[str, float]] = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{self.id[:8]}", daemon=True)
+        self._sampler.start()
+
+    def enter_thread(self) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+
+    def exit_thread(self) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            depth = self._threads.get(ident, 0) - 1
+            if depth > 0:
+                self._threads[ident] = depth
+            else:
+                self._threads.pop(ident, None)
+
+    def record(self, upstream: str, phase: str, seconds: float) -> None:
+        with self._lock:
+            entry = self._upstreams.setdefault(upstream, {"wait": 0.0, "busy": 0.0, "calls": 0})
+            entry[phase] += seconds
+            if phase == "busy":
+                entry["calls"] += 1
+
+    def _sample_loop(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(SAMPLE_INTERVAL_SECONDS):
+            with self._lock:
+                threads = [ident for ident in self._threads if ident != own]
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            stacks = []
+            for ident in threads:
+                frame = frames.get(ident)
+                names: List[str] = []
+                while frame is not None and len(names) < MAX_STACK_DEPTH:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                if names:
+                    stacks.append(";".join(reversed(names)))
+            with self._lock:
+                self._stacks.update(stacks)
+                self.samples += len(stacks)
+
+    def finish(self) -> Dict[str, Any]:
+        """Stop sampling and return the profile."""
+        self._stop.set()
+        self._sampler.join()
+        wall = time.perf_counter() - self._started
+        with self._lock:
+            stacks = dict(self._stacks)
+            upstreams = {name: dict(entry) for name, entry in sorted(self._upstreams.items())}
+
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in stacks.items():
+            names = stack.split(";")
+            own[names[-1]] += count
+            for name in set(names):
+                total[name] += count
+        return {
+            "id": self.id,
+            "route": self.route,
+            "method": self.method,
+            "video_id": self.video_id,
+            "started_at": self.started_at,
+            "wall_seconds": wall,
+            "sample_interval_seconds": SAMPLE_INTERVAL_SECONDS,
+            "samples": self.samples,
+            "upstreams": upstreams,
+            "top_functions": [
+                {"function": name, "self_samples": own[name], "total_samples": count}
+                for name, count in total.most_common(TOP_FUNCTIONS)
+            ],
+            # Collapsed stacks ("outer;...;inner": samples), e.g. for flamegraph.pl / speedscope.
+            "stacks": dict(Counter(stacks).most_common(TOP_STACKS)),
+        }
+
+
+def current_session() -> Optional[ProfileSession]:
+    return _session.get()
+
+
+def record(upstream: str, phase: str, seconds: float) -> None:
+    """
+    Add time spent on an upstream to the current request's profile, if it has one.
+
+    Args:
+        upstream: e.g. "together:<model>", "youtube", "rate:together"
+        phase: "wait" (queued / throttled) or "busy" (call in progress)
+        seconds: Wall time
+    """
+    session = _session.get()
+    if session is not None:
+        session.record(upstream, phase, seconds)
+
+
+@contextmanager
+def thread_scope() -> Iterator[None]:
+    """Let the current request's sampler see this thread while the block runs."""
+    session = _session.get()
+    if session is None:
+        yield
+        return
+    session.enter_thread()
+    try:
+        yield
+    finally:
+        session.exit_thread()
+
+
+def _server_timing(profile: Dict[str, Any]) -> str:
+    metrics = [f"total;dur={profile['wall_seconds'] * 1000:.1f}"]
+    for name, entry in profile["upstreams"].items():
+        label = "".join(ch if ch.isalnum() or ch in "-_" else "-" for ch in name)
+        for phase in ("wait", "busy"):
+            if entry[phase]:
+                metrics.append(f'{label}-{phase};dur={entry[phase] * 1000:.1f};desc="{name} {phase}"')
+    return ", ".join(metrics)
+
+
+def _video_id_from_body(body: bytes) -> Optional[str]:
+    try:
+        value = json.loads(body).get("video_id")
+    except (ValueError, AttributeError):
+        return None
+    return value if isinstance(value, str) else None
+
+
+async def store_profile(profile: Dict[str, Any]) -> None:
+    params = {"kind": "profile", "route": profile["route"], "id": profile["id"], "started_at": profile["started_at"]}
+    await get_store().aput("debug", profile["video_id"] or NO_VIDEO, profile, params)
+
+
+def list_profiles(video_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Stored profiles of a video (of requests without one for None), newest first.
+
+    Returns:
+        [{"id", "route", "started_at"}] of each profile
+    """
+    params = get_store().list_params("debug", video_id or NO_VIDEO)
+    profiles = [p for p in params if p.get("kind") == "profile"]
+    profiles.sort(key=lambda p: p["started_at"], reverse=True)
+    return [{"id": p["id"], "route": p["route"], "started_at": p["started_at"]} for p in profiles]
+
+
+def find_profile(profile_id: str, video_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Look a stored profile up by id."""
+    video_id = video_id or NO_VIDEO
+    store = get_store()
+    for params in store.list_params("debug", video_id):
+        if params.get("kind") == "profile" and params.get("id") == profile_id:
+            return store.get("debug", video_id, params)
+    return None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles requests carrying a valid X-Profile-Token header.
+    Only installed when KNOWTUBE_PROFILE_TOKEN is set (see main.py).
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER.encode("latin-1"):
+                header = value.decode("latin-1")
+                break
+        if header is None:
+            await self.app(scope, receive, send)
+            return
+        if not token_matches(header):
+            logger.warning(f"Rejected profiling request for {scope['path']}: bad token")
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(scope["path"], scope["method"])
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        session.video_id = query.get("video_id", [None])[0]
+        body = bytearray()
+
+        async def receive_tee() -> Dict[str, Any]:
+            message = await receive()
+            if message["type"] == "http.request":
+                body.extend(message.get("body", b""))
+            return message
+
+        finished = False
+
+        async def send_with_profile(message: Dict[str, Any]) -> None:
+            nonlocal finished
+            if message["type"] == "http.response.start" and not finished:
+                finished = True
+                if session.video_id is None and body:
+                    session.video_id = _video_id_from_body(bytes(body))
+                profile = session.finish()
+                try:
+                    await store_profile(profile)
+                except Exception as exc:
+                    logger.warning(f"Could not store profile {profile['id']}: {exc}")
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile["id"].encode("latin-1")),
+                    (b"server-timing", _server_timing(profile).encode("latin-1")),
+                ]
+                logger.info(
+                    f"Profiled {session.method} {session.route} ({session.video_id}): "
+                    f"{profile['wall_seconds']:.2f}s, {profile['samples']} samples, id {profile['id']}"
+                )
+            await send(message)
+
+        reset = _session.set(session)
+        try:
+            with thread_scope():
+                await self.app(scope, receive_tee, send_with_profile)
+        finally:
+            _session.reset(reset)
+            if not finished:
+                session.finish()
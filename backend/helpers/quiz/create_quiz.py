@@ -4,57 +4,106 @@ Utilities for generating quizzes from video transcripts with Together's GPT-OSS
 
 from __future__ import annotations
 
-import json
+import logging
 import random
-from typing import Mapping, Optional, Sequence, Union
+from typing import Any, Mapping, Optional, Sequence, Union
 
 from together import Together
 
-from .quiz_prompts import get_prompt_generate_quiz_questions
-from helpers.transcripts import get_transcript
+from .quiz_prompts import get_prompt_generate_quiz_questions, get_prompt_repair_quiz_questions
+from helpers.admission import get_admission
+from helpers.cancellation import Cancelled
+from helpers.compaction import compact_transcript
+from helpers.routing import routed_completion
+from helpers.schemas import QuizQuestion
+from helpers.storage import get_store
+from helpers.structured_output import scan_json_array, validate_items
+from helpers.transcript_index import TranscriptIndex
+from helpers.transcripts import get_chapter, get_transcript_index
 
-DEFAULT_MODEL = "moonshotai/Kimi-K2-Instruct-0905"
+logger = logging.getLogger(__name__)
+
+# The prompt asks for 15 questions: 5 easy, then 5 medium, then 5 hard. Banks are
+# stored positionally (None where a question is missing), so that each difficulty
+# is always the same slice.
+QUIZ_BANK_SIZE = 15
+QUIZ_DIFFICULTIES = ("easy", "medium", "hard")
+DEFAULT_MAX_TRANSCRIPT_CHARS = 8_000
+# Chapter banks are smaller for short chapters: one question per difficulty for every
+# len(QUIZ_DIFFICULTIES) * QUIZ_SECONDS_PER_QUESTION seconds, at least one and at most
+# as many as a whole video's bank.
+QUIZ_SECONDS_PER_QUESTION = 40.0
+
+
+def chapter_bank_size(chapter: Mapping[str, Any]) -> int:
+    """Number of questions in the quiz bank of a chapter (a multiple of the difficulties)."""
+    levels = len(QUIZ_DIFFICULTIES)
+    per_difficulty = round((chapter["end"] - chapter["start"]) / (levels * QUIZ_SECONDS_PER_QUESTION))
+    return levels * max(1, min(QUIZ_BANK_SIZE // levels, per_difficulty))
+
+
+def difficulty_of(position: int, bank_size: int = QUIZ_BANK_SIZE) -> str:
+    """Difficulty of the question at a bank position."""
+    return QUIZ_DIFFICULTIES[position * len(QUIZ_DIFFICULTIES) // bank_size]
+
+
+def bank_complete(bank: Sequence[Optional[dict]], bank_size: int = QUIZ_BANK_SIZE) -> bool:
+    """Whether a quiz bank has a valid question at every position (only those are cached)."""
+    return len(bank) == bank_size and all(question is not None for question in bank)
+
+
+def questions_of_difficulty(
+    bank: Sequence[Optional[dict]], difficulty_level: str, bank_size: int = QUIZ_BANK_SIZE
+) -> list:
+    """The questions of one difficulty (all questions for any other difficulty_level)."""
+    if difficulty_level not in QUIZ_DIFFICULTIES:
+        return [question for question in bank if question is not None]
+    return [
+        question
+        for position, question in enumerate(bank)
+        if question is not None and difficulty_of(position, bank_size) == difficulty_level
+    ]
 
 
 def _collapse_transcript_text(
-    transcript: Union[str, Mapping[str, str], Sequence[Union[str, Mapping[str, str]]]],
+    transcript: Union[TranscriptIndex, str, Mapping[str, str], Sequence[Union[str, Mapping[str, str]]]],
     max_chars: int = 8_000,
 ) -> str:
     """
-    Convert a transcript payload (string or list of transcript segments) into text.
+    Convert a transcript payload (index, string or list of transcript segments) into
+    compacted text (see helpers.compaction) of at most max_chars characters.
     """
 
-    def _extract_text(entry: Union[str, Mapping[str, str]]) -> str:
+    def _as_segment(entry: Union[str, Mapping[str, str]]) -> Mapping[str, str]:
         if isinstance(entry, str):
-            return entry.strip()
+            return {"text": entry}
         if isinstance(entry, Mapping):
-            return str(entry.get("text", "")).strip()
+            return entry
         raise TypeError(
             "Each transcript entry must be a string or a mapping containing 'text'."
         )
 
-    if isinstance(transcript, str):
-        text = transcript.strip()
+    if isinstance(transcript, TranscriptIndex):
+        segments = transcript
+    elif isinstance(transcript, str):
+        segments = [{"text": transcript}]
     elif isinstance(transcript, Mapping):
-        text = str(transcript.get("text", "")).strip()
+        segments = [{"text": str(transcript.get("text", ""))}]
     elif isinstance(transcript, Sequence):
-        text = " ".join(filter(None, (_extract_text(chunk) for chunk in transcript)))
+        segments = [_as_segment(chunk) for chunk in transcript]
     else:
         raise TypeError(
             "transcript must be a string, mapping, or sequence of transcript segments."
         )
 
+    text = compact_transcript(segments, max_chars, label="quiz transcript")
     if not text:
         raise ValueError("Transcript text is empty.")
-
-    if len(text) > max_chars:
-        text = f"{text[:max_chars]}..."
-
     return text
 
 
-def _build_prompt(transcript_text: str, difficulty_level: str) -> str:
-    prompt = get_prompt_generate_quiz_questions(transcript_text, difficulty_level)
+def _build_prompt(transcript_text: str, difficulty_level: str, bank_size: int = QUIZ_BANK_SIZE) -> str:
+    prompt = get_prompt_generate_quiz_questions(transcript_text, difficulty_level, bank_size)
     return prompt
 
 
@@ -65,15 +114,25 @@ def _response_text(response) -> str:
         raise RuntimeError("Together chat completion response missing content.") from exc
 
 
+def quiz_cache_params(language_code: Optional[str], max_transcript_chars: int, chapter: Optional[int] = None) -> dict:
+    """Cache params of a video's (or one chapter's) quiz bank in the "quizzes" table."""
+    params = {"language_code": language_code, "max_transcript_chars": max_transcript_chars}
+    if chapter is not None:
+        params["chapter"] = chapter
+    return params
+
+
 def generate_quiz_from_transcript(
     video_id: str,
     language_code: Optional[str] = None,
     temperature: float = 0.3,
-    model: str = DEFAULT_MODEL,
-    max_transcript_chars: int = 8_000,
+    model: Optional[str] = None,
+    max_transcript_chars: int = DEFAULT_MAX_TRANSCRIPT_CHARS,
     difficulty_level: str = "medium",
+    chapter: Optional[int] = None,
     *,
     client: Together,
+    admission_route: Optional[str] = "quiz",
 ) -> dict:
     """
     Create a quiz from a transcript using Together's chat completion API.
@@ -82,22 +141,88 @@ def generate_quiz_from_transcript(
         video_id: YouTube video identifier to fetch transcript for.
         language_code: Optional language override when fetching the transcript.
         temperature: Sampling temperature for the completion.
-        model: GPT model identifier (defaults to openai/gpt-oss-20b).
+        model: Model identifier; by default the router picks one for the "quiz" task.
         max_transcript_chars: Max characters from the transcript to send to the model.
         max_output_tokens: Token cap for the response.
         difficulty_level: Difficulty descriptor passed to the quiz prompt helper.
+        chapter: Quiz only this chapter of the video (see helpers.chapters); None for the whole video.
+            Short chapters get fewer questions (see chapter_bank_size).
         client: Together client that will execute the completion.
+        admission_route: Admission route a generation waits for (see helpers.admission); None
+            for callers that bound their own concurrency, like the batch route's pool.
 
     Returns:
         Parsed quiz dictionary (matching the schema defined in quiz_prompts.py).
     """
-    transcript_payload = get_transcript(video_id=video_id, language_code=language_code)
-    transcript_text = _collapse_transcript_text(
-        transcript_payload.get("transcript", []), max_chars=max_transcript_chars
-    )
-    prompt = _build_prompt(transcript_text, difficulty_level)
+    store = get_store()
+    cache_params = quiz_cache_params(language_code, max_transcript_chars, chapter)
+    bank_size = QUIZ_BANK_SIZE
+    if chapter is not None:
+        bank_size = chapter_bank_size(get_chapter(video_id, chapter, language_code=language_code))
+
+    def factory() -> list:
+        return _generate_quiz_bank(
+            video_id,
+            language_code=language_code,
+            temperature=temperature,
+            model=model,
+            max_transcript_chars=max_transcript_chars,
+            difficulty_level=difficulty_level,
+            chapter=chapter,
+            bank_size=bank_size,
+            client=client,
+        )
+
+    def complete(bank: Sequence[Optional[dict]]) -> bool:
+        return bank_complete(bank, bank_size)
+
+    # Only a cache miss needs (and waits for) admission; see helpers.admission.
+    gate = None if admission_route is None else get_admission().gate(admission_route)
+    # A bank still incomplete after repair is served but not cached.
+    bank = store.get_or_create("quizzes", video_id, factory, cache_params, store_if=complete, gate=gate)
+    if len(bank) != bank_size:
+        # Cached before banks were stored positionally (missing questions had been
+        # dropped, so the difficulty slices are unknown) or before chapter banks were
+        # sized by chapter length. Build it again.
+        logger.info(f"Replacing quiz bank of {video_id} with {len(bank)} instead of {bank_size} positions")
+        store.delete("quizzes", video_id, cache_params)
+        bank = store.get_or_create("quizzes", video_id, factory, cache_params, store_if=complete, gate=gate)
+
+    questions = questions_of_difficulty(bank, difficulty_level, bank_size)
+    return random.sample(questions, len(questions))
+
+
+def _generate_quiz_bank(
+    video_id: str,
+    *,
+    language_code: Optional[str],
+    temperature: float,
+    model: Optional[str],
+    max_transcript_chars: int,
+    difficulty_level: str,
+    chapter: Optional[int] = None,
+    bank_size: int = QUIZ_BANK_SIZE,
+    client: Together,
+) -> list:
+    """
+    Run the completion for the full bank of bank_size questions (easy, medium and hard in order).
+
+    Returns:
+        The bank by position, None where no valid question could be generated
+    """
+    transcript_index = get_transcript_index(video_id=video_id, language_code=language_code)
+    if chapter is None:
+        transcript_text = _collapse_transcript_text(transcript_index, max_chars=max_transcript_chars)
+    else:
+        selected = get_chapter(video_id, chapter, language_code=language_code)
+        transcript_text = _collapse_transcript_text(
+            transcript_index[selected["first_segment"]:selected["stop_segment"]], max_chars=max_transcript_chars
+        )
+    prompt = _build_prompt(transcript_text, difficulty_level, bank_size)
 
-    response = client.chat.completions.create(
+    response = routed_completion(
+        client,
+        task="quiz",
         model=model,
         messages=[
             {"role": "user", "content": prompt},
@@ -107,26 +232,67 @@ def generate_quiz_from_transcript(
     )
 
     quiz_text = _response_text(response)
-    if quiz_text.startswith("```json"):
-        quiz_text = "\n".join(quiz_text.splitlines()[1:-1])
+    scan = scan_json_array(quiz_text)
+    valid, invalid = validate_items(scan.items[:bank_size], QuizQuestion)
+    missing = [index for index in range(bank_size) if index not in valid]
 
-    try:
-        json_object = json.loads(quiz_text)
-        if len(json_object) != 15:
-            raise RuntimeError(
-                f"Expected 15 quiz questions, but got {len(json_object)}. Inspect quiz_text for debugging."
+    if missing:
+        # Keep what is usable and only ask for the missing / invalid positions.
+        logger.info(f"Quiz for {video_id}: {len(valid)} valid, repairing positions {missing} ({invalid})")
+        get_store().put("debug", video_id, quiz_text, {"kind": "quiz", "model": model})
+        valid.update(
+            _repair_quiz_questions(
+                missing,
+                transcript_text,
+                [question["question"] for question in valid.values()],
+                bank_size=bank_size,
+                temperature=temperature,
+                model=model,
+                client=client,
             )
-        if difficulty_level == "easy":
-            json_object = json_object[:5]
-        elif difficulty_level == "medium":
-            json_object = json_object[5:10]
-        elif difficulty_level == "hard":
-            json_object = json_object[10:15]
-        return random.sample(json_object, len(json_object))
-    except json.JSONDecodeError as exc:
-        # Save quiz_text for debugging
-        with open("quiz_debug.txt", "w", encoding="utf-8") as debug_file:
-            debug_file.write(quiz_text)
+        )
+
+    if not valid:
         raise RuntimeError(
-            "Together response was not valid JSON. Inspect quiz_text for debugging." + quiz_text
-        ) from exc
+            "Together response contained no valid quiz questions. Inspect quiz_text for debugging." + quiz_text
+        )
+    return [valid.get(index) for index in range(bank_size)]
+
+
+def _repair_quiz_questions(
+    positions: list,
+    transcript_text: str,
+    existing_questions: list,
+    *,
+    bank_size: int = QUIZ_BANK_SIZE,
+    temperature: float,
+    model: Optional[str],
+    client: Together,
+) -> dict:
+    """
+    Request replacement questions for the given bank positions.
+
+    Returns:
+        Mapping of bank position to validated question (may be partial if the repair
+        itself comes back short)
+    """
+    difficulties = [difficulty_of(index, bank_size) for index in positions]
+    prompt = get_prompt_repair_quiz_questions(transcript_text, difficulties, existing_questions)
+    try:
+        response = routed_completion(
+            client,
+            task="quiz",
+            model=model,
+            messages=[
+                {"role": "user", "content": prompt},
+            ],
+            temperature=temperature,
+        )
+    except Cancelled:
+        raise
+    except Exception as exc:
+        logger.warning(f"Quiz repair failed: {exc}")
+        return {}
+
+    repaired, _ = validate_items(scan_json_array(_response_text(response)).items, QuizQuestion)
+    return dict(zip(positions, (repaired[index] for index in sorted(repaired))))
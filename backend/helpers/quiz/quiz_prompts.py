@@ -1,12 +1,12 @@
 PROMPT_GENERATE_QUIZ_QUESTIONS = """
 You are an expert at creating educational content. Your task is to generate a set of quiz questions based on the provided text, which is the transcript of a YouTube video. The questions should test comprehension and retention of the material covered in the transcript. Please follow these guidelines:
 
-1. Generate a total of 15 questions.
+1. Generate a total of NUM_QUESTIONS_PLACEHOLDER questions.
 2. Each question should be multiple-choice with 4 answer options (A, B, C, D).
 3. Ensure that only one answer is correct for each question.
 4. The questions should cover a range of topics discussed in the transcript to ensure a comprehensive understanding.
 5. Make the questions clear and concise, avoiding ambiguity.
-6. The first five questions should be of easy difficulty (suitable for beginners with basic knowledge of the subject), the next five should be of medium difficulty (suitable for learners with some prior knowledge of the subject), and the last five should be of hard difficulty (suitable for advanced learners with substantial knowledge of the subject). All should be answerable solely based on the transcript.
+6. The first PER_DIFFICULTY_PLACEHOLDER questions should be of easy difficulty (suitable for beginners with basic knowledge of the subject), the next PER_DIFFICULTY_PLACEHOLDER should be of medium difficulty (suitable for learners with some prior knowledge of the subject), and the last PER_DIFFICULTY_PLACEHOLDER should be of hard difficulty (suitable for advanced learners with substantial knowledge of the subject). All should be answerable solely based on the transcript.
 7. Avoid using "all of the above" or "none of the above" as answer options.
 8. The correct answer should be random every time; i.e., do not always make "A" the correct answer.
 9. Don't mention the word "transcript" and use "video" or "video content" instead.
@@ -34,7 +34,7 @@ Below is the transcript text to base the questions on:
 """
 
 
-def get_prompt_generate_quiz_questions(transcript_text: str, difficulty_level: str) -> str:
+def get_prompt_generate_quiz_questions(transcript_text: str, difficulty_level: str, num_questions: int = 15) -> str:
     difficulty_level_description = ""
     if difficulty_level == "easy":
         difficulty_level_description = "easy; suitable for beginners with basic knowledge of the subject"
@@ -44,5 +44,48 @@ def get_prompt_generate_quiz_questions(transcript_text: str, difficulty_level: s
         difficulty_level_description = "hard; suitable for advanced learners with substantial knowledge of the subject"
     else:
         difficulty_level_description = "of varying difficulty levels to challenge learners at all stages"
-    return PROMPT_GENERATE_QUIZ_QUESTIONS + transcript_text
+    prompt = PROMPT_GENERATE_QUIZ_QUESTIONS.replace("NUM_QUESTIONS_PLACEHOLDER", str(num_questions))
+    return prompt.replace("PER_DIFFICULTY_PLACEHOLDER", str(num_questions // 3)) + transcript_text
     # return PROMPT_GENERATE_QUIZ_QUESTIONS.replace("DIFFICULTY_LEVEL_PLACEHOLDER", difficulty_level_description) + transcript_text
+
+
+PROMPT_REPAIR_QUIZ_QUESTIONS = """
+You are an expert at creating educational content. A previous request for quiz questions about a YouTube video returned too few usable questions. Generate ONLY the missing questions.
+
+Generate exactly NUM_QUESTIONS_PLACEHOLDER multiple-choice questions, one for each of these difficulty levels, in this order: DIFFICULTIES_PLACEHOLDER.
+
+Follow these rules:
+1. Each question has 4 answer options (A, B, C, D) and exactly one correct answer.
+2. The questions must be answerable solely based on the video content and must not repeat any of the existing questions listed below.
+3. Avoid "all of the above" or "none of the above", vary the correct letter, and say "video" instead of "transcript".
+
+Existing questions (do not repeat):
+EXISTING_PLACEHOLDER
+
+Output ONLY a JSON list in this format, not inside a code block:
+[
+    {
+        "question": "Question text here",
+        "options": {
+            "A": "Option A text",
+            "B": "Option B text",
+            "C": "Option C text",
+            "D": "Option D text"
+        },
+        "correct_answer": "A"
+    }
+]
+
+Below is the transcript text to base the questions on:
+
+"""
+
+
+def get_prompt_repair_quiz_questions(transcript_text: str, difficulties: list, existing_questions: list) -> str:
+    existing = "\n".join(f"- {question}" for question in existing_questions) or "- (none)"
+    return (
+        PROMPT_REPAIR_QUIZ_QUESTIONS.replace("NUM_QUESTIONS_PLACEHOLDER", str(len(difficulties)))
+        .replace("DIFFICULTIES_PLACEHOLDER", ", ".join(difficulties))
+        .replace("EXISTING_PLACEHOLDER", existing)
+        + transcript_text
+    )
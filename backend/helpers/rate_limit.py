@@ -0,0 +1,89 @@
+"""
+Request budgets for upstream APIs, shared by every worker process.
+
+Each upstream gets a token bucket stored in the artifact database (see
+ArtifactStore.reserve_tokens), so running more uvicorn workers does not multiply the
+request rate we send to Together or YouTube.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from helpers import profiling
+from helpers.storage import get_store
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    # Sustained requests per second.
+    rate: float
+    # Requests that may be sent back to back after an idle period.
+    burst: float
+
+
+RATE_LIMITS: Dict[str, RateLimit] = {
+    "together": RateLimit(
+        rate=float(os.getenv("KNOWTUBE_TOGETHER_RPS", "10")),
+        burst=float(os.getenv("KNOWTUBE_TOGETHER_BURST", "20")),
+    ),
+    "youtube": RateLimit(
+        rate=float(os.getenv("KNOWTUBE_YOUTUBE_RPS", "1")),
+        burst=float(os.getenv("KNOWTUBE_YOUTUBE_BURST", "5")),
+    ),
+}
+
+
+def reserve(upstream: str, cost: float = 1.0, max_wait: Optional[float] = None) -> float:
+    """
+    Reserve the next request to `upstream` from the shared budget, without waiting.
+
+    Args:
+        upstream: Key of RATE_LIMITS
+        cost: Tokens the request consumes
+        max_wait: Reserve nothing if the request could only be sent after more than
+                  this many seconds
+
+    Returns:
+        Seconds until the request may be sent; more than max_wait if nothing was reserved
+    """
+    limit = RATE_LIMITS[upstream]
+    if limit.rate <= 0:
+        # A non-positive rate disables limiting for this upstream.
+        return 0.0
+    return get_store().reserve_tokens(f"rate:{upstream}", limit.rate, limit.burst, cost, max_wait)
+
+
+def acquire(upstream: str, cost: float = 1.0) -> float:
+    """
+    Block until the shared budget for `upstream` allows another request.
+
+    Args:
+        upstream: Key of RATE_LIMITS
+        cost: Tokens the request consumes
+
+    Returns:
+        Seconds spent waiting
+    """
+    wait = reserve(upstream, cost)
+    if wait > 0:
+        logger.debug(f"Rate limit for {upstream}: waiting {wait:.2f}s")
+        time.sleep(wait)
+        profiling.record(f"rate:{upstream}", "wait", wait)
+    return wait
+
+
+def penalize(upstream: str, seconds: float) -> None:
+    """
+    Withhold `seconds` worth of budget from `upstream` in every process, e.g. after
+    the upstream signalled that we are sending too much.
+    """
+    limit = RATE_LIMITS[upstream]
+    if limit.rate > 0 and seconds > 0:
+        get_store().reserve_tokens(f"rate:{upstream}", limit.rate, limit.burst, seconds * limit.rate)
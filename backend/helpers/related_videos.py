@@ -0,0 +1,332 @@
+"""
+Local index of related videos, built from the cached transcripts and concept graphs.
+
+The concept graph links every concept to related YouTube videos. Before, each
+concept cost a DuckDuckGo search (gather_links), even when videos on exactly that
+topic had already been ingested here. Now the graph builder asks this index first
+and only searches externally for concepts without local coverage.
+
+A video covers a concept when
+- its own concept graph contains the concept (top level or sub-concept), or
+- the concept has at least two words and its transcript mentions it as a phrase at
+  least MIN_MENTIONS times. Single words ("function", "model") are said in far too
+  many videos to stand for the concept on their own.
+
+Concepts and transcripts are normalized the same way (lowercase words, a few
+function words dropped, plural "s" stripped), so "Neural Networks" matches "a neural
+network". Every match carries the time of the first mention, so the graph can link
+into the right spot of the video, and the video's title, taken from the video nodes
+of the cached graphs (DuckDuckGo results); videos never seen there are labelled
+with their ID and start time.
+
+The index lives in memory: it is built from the artifact store in a background
+thread on first use and every REFRESH_SECONDS after (to pick up the other worker
+processes' artifacts), and updated as transcripts are ingested and graphs built in
+this process. Lookups never wait for a build; until the first one finishes nothing
+is covered locally. Normalized text is kept for the most recently used transcripts
+up to MAX_TEXT_CHARS characters (KNOWTUBE_RELATED_INDEX_MAX_CHARS). A word ->
+videos posting list narrows the transcripts searched for each phrase.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+from helpers import metrics
+from helpers.storage import get_store
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECONDS = float(os.getenv("KNOWTUBE_RELATED_INDEX_REFRESH", "300"))
+MAX_TEXT_CHARS = int(os.getenv("KNOWTUBE_RELATED_INDEX_MAX_CHARS", str(32_000_000)))
+# Transcript-only matches need a concept of this many words, mentioned this often.
+MIN_PHRASE_WORDS = 2
+MIN_MENTIONS = 3
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_FUNCTION_WORDS = frozenset("a an and as at by for from in into of on or the to with".split())
+
+
+def _normalize_words(text: str) -> List[str]:
+    words = []
+    for word in _WORD_RE.findall(str(text).lower()):
+        if word in _FUNCTION_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+def concept_key(name: str) -> str:
+    """Normalized form of a concept name used as the index key."""
+    return " ".join(_normalize_words(name))
+
+
+class _Transcript:
+    """Normalized transcript text with the start time of each segment's words."""
+
+    __slots__ = ("text", "offsets", "starts")
+
+    def __init__(self, segments: Iterable[Mapping[str, Any]]) -> None:
+        parts: List[str] = []
+        self.offsets = array("I")
+        self.starts = array("d")
+        length = 1
+        for segment in segments:
+            words = _normalize_words(segment.get("text", ""))
+            if not words:
+                continue
+            self.offsets.append(length)
+            self.starts.append(float(segment.get("start", 0.0)))
+            part = " ".join(words)
+            parts.append(part)
+            length += len(part) + 1
+        # Leading and trailing spaces let phrases be matched as " phrase ".
+        self.text = " " + " ".join(parts) + " "
+
+    def words(self) -> Set[str]:
+        return set(self.text.split())
+
+    def mentions(self, key: str) -> Tuple[int, Optional[float]]:
+        """(number of mentions of the phrase, start time of the first one)."""
+        needle = f" {key} "
+        first = self.text.find(needle)
+        if first < 0:
+            return 0, None
+        count = self.text.count(needle)
+        segment = max(0, bisect_right(self.offsets, first + 1) - 1)
+        return count, self.starts[segment] if self.starts else 0.0
+
+
+def _tree_concepts(trees: Any) -> Iterable[str]:
+    for tree in trees if isinstance(trees, list) else []:
+        if not isinstance(tree, Mapping) or tree.get("type") != "concept":
+            continue
+        yield str(tree.get("name", ""))
+        yield from _tree_concepts(tree.get("children"))
+
+
+def _tree_video_titles(trees: Any) -> Iterable[Tuple[str, str]]:
+    """(video_id, title) of the searched (not locally linked) video nodes of a graph."""
+    for tree in trees if isinstance(trees, list) else []:
+        if not isinstance(tree, Mapping):
+            continue
+        data = tree.get("data")
+        if tree.get("type") == "video" and isinstance(data, Mapping) and data.get("source") != "local":
+            if data.get("video_id") and tree.get("name"):
+                yield str(data["video_id"]), str(tree["name"])
+        yield from _tree_video_titles(tree.get("children"))
+
+
+def video_label(video_id: str, start: float) -> str:
+    """Label of a linked video whose title is unknown."""
+    seconds = int(start)
+    return f"Video {video_id} at {seconds // 60}:{seconds % 60:02d}"
+
+
+def _segments_of(payload: Any) -> Sequence[Mapping[str, Any]]:
+    segments = payload.get("transcript", []) if isinstance(payload, Mapping) else payload
+    return segments if isinstance(segments, list) else []
+
+
+class RelatedVideoIndex:
+    """Concept -> ingested videos (with the time of the first mention)."""
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS, max_chars: int = MAX_TEXT_CHARS) -> None:
+        self.refresh_seconds = refresh_seconds
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._built_at: Optional[float] = None
+        # Least recently used first; evicted from the front beyond max_chars.
+        self._transcripts: "OrderedDict[str, _Transcript]" = OrderedDict()
+        self._chars = 0
+        self._postings: Dict[str, Set[str]] = {}
+        # Concept key -> {video_id: concept name as written in that video's graph}.
+        self._graph_concepts: Dict[str, Dict[str, str]] = {}
+        self._titles: Dict[str, str] = {}
+        self.local_hits = 0
+        self.misses = 0
+
+    # -- building ----------------------------------------------------------
+
+    def _ensure_fresh(self) -> None:
+        """Start a background rebuild when the index is missing or stale."""
+        built_at = self._built_at
+        if built_at is not None and time.monotonic() - built_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, name="related-video-index", daemon=True).start()
+
+    def _rebuild_in_background(self) -> None:
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception("Related video index rebuild failed")
+            # Keep serving the current index; retry after the refresh interval.
+            with self._lock:
+                self._built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def rebuild(self) -> None:
+        """Rebuild the index from the cached transcripts (most recently used, up to max_chars) and graphs."""
+        started = time.monotonic()
+        store = get_store()
+        recent: List[Tuple[str, _Transcript]] = []
+        chars = 0
+        for video_id, _, payload in store.scan("transcripts"):
+            transcript = _Transcript(_segments_of(payload))
+            if chars + len(transcript.text) > self.max_chars:
+                break
+            recent.append((video_id, transcript))
+            chars += len(transcript.text)
+        transcripts: "OrderedDict[str, _Transcript]" = OrderedDict(reversed(recent))
+        postings: Dict[str, Set[str]] = {}
+        for video_id, transcript in transcripts.items():
+            for word in transcript.words():
+                postings.setdefault(word, set()).add(video_id)
+        graph_concepts: Dict[str, Dict[str, str]] = {}
+        titles: Dict[str, str] = {}
+        for video_id, _, trees in store.scan("graphs"):
+            for name in _tree_concepts(trees):
+                key = concept_key(name)
+                if key:
+                    graph_concepts.setdefault(key, {}).setdefault(video_id, name)
+            titles.update(_tree_video_titles(trees))
+        with self._lock:
+            self._transcripts = transcripts
+            self._chars = chars
+            self._postings = postings
+            self._graph_concepts = graph_concepts
+            self._titles = titles
+            self._built_at = time.monotonic()
+        logger.info(
+            f"Related video index: {len(transcripts)} transcripts ({chars} chars), "
+            f"{len(graph_concepts)} graph concepts in {time.monotonic() - started:.2f}s"
+        )
+
+    def _drop_transcript(self, video_id: str) -> None:
+        transcript = self._transcripts.pop(video_id)
+        self._chars -= len(transcript.text)
+        for word in transcript.words():
+            videos = self._postings.get(word)
+            if videos is not None:
+                videos.discard(video_id)
+                if not videos:
+                    del self._postings[word]
+
+    def add_transcript(self, video_id: str, segments: Iterable[Mapping[str, Any]]) -> None:
+        """Index a newly ingested transcript (no-op until the index is first built)."""
+        if self._built_at is None:
+            return
+        transcript = _Transcript(segments)
+        with self._lock:
+            if video_id in self._transcripts:
+                self._drop_transcript(video_id)
+            self._transcripts[video_id] = transcript
+            self._chars += len(transcript.text)
+            for word in transcript.words():
+                self._postings.setdefault(word, set()).add(video_id)
+            while self._chars > self.max_chars and len(self._transcripts) > 1:
+                self._drop_transcript(next(iter(self._transcripts)))
+
+    def add_graph(self, video_id: str, trees: Any) -> None:
+        """Index the concepts of a newly built graph (no-op until the index is first built)."""
+        if self._built_at is None:
+            return
+        with self._lock:
+            for name in _tree_concepts(trees):
+                key = concept_key(name)
+                if key:
+                    self._graph_concepts.setdefault(key, {}).setdefault(video_id, name)
+            self._titles.update(_tree_video_titles(trees))
+
+    # -- queries -----------------------------------------------------------
+
+    def lookup(self, concept: str, *, exclude: Optional[str] = None, limit: int = 3) -> List[Dict[str, Any]]:
+        """
+        Ingested videos covering a concept, best first.
+
+        Args:
+            concept: Concept name
+            exclude: Video to leave out (usually the one the graph is built for)
+            limit: Maximum number of videos
+
+        Returns:
+            [{"video_id", "title", "concept", "start", "mentions", "in_graph"}], empty without
+            local coverage. "concept" is the concept as named in the video's graph.
+        """
+        key = concept_key(concept)
+        if not key:
+            return []
+        self._ensure_fresh()
+        with self._lock:
+            in_graph = dict(self._graph_concepts.get(key, {}))
+            words = key.split()
+            candidates: Set[str] = set(in_graph)
+            if len(words) >= MIN_PHRASE_WORDS:
+                posting_sets = sorted((self._postings.get(word, set()) for word in words), key=len)
+                if posting_sets[0]:
+                    candidates |= set.intersection(*posting_sets)
+            transcripts = {video_id: self._transcripts.get(video_id) for video_id in candidates}
+            titles = {video_id: self._titles.get(video_id) for video_id in candidates}
+
+        matches = []
+        for video_id, transcript in transcripts.items():
+            if video_id == exclude:
+                continue
+            mentions, start = transcript.mentions(key) if transcript is not None else (0, None)
+            if video_id not in in_graph and mentions < MIN_MENTIONS:
+                continue
+            start = start or 0.0
+            matches.append({
+                "video_id": video_id,
+                "title": titles[video_id] or video_label(video_id, start),
+                "concept": in_graph.get(video_id, concept),
+                "start": start,
+                "mentions": mentions,
+                "in_graph": video_id in in_graph,
+            })
+        matches.sort(key=lambda match: (not match["in_graph"], -match["mentions"], match["video_id"]))
+        with self._lock:
+            if matches:
+                self.local_hits += 1
+            else:
+                self.misses += 1
+        return matches[:limit]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "transcripts": len(self._transcripts),
+                "chars": self._chars,
+                "titles": len(self._titles),
+                "rebuilding": self._rebuilding,
+                "words": len(self._postings),
+                "graph_concepts": len(self._graph_concepts),
+                "local_hits": self.local_hits,
+                "misses": self.misses,
+                "age": None if self._built_at is None else time.monotonic() - self._built_at,
+            }
+
+
+_index = RelatedVideoIndex()
+metrics.register("related_videos", _index.snapshot)
+
+
+def get_related_video_index() -> RelatedVideoIndex:
+    return _index
@@ -0,0 +1,223 @@
+"""
+Latency-aware model routing for the LLM-backed generators.
+
+Each task declares the models it may use in order of preference, together with the
+largest prompt each one should receive. At call time the router drops models whose
+circuit breaker is open or whose prompt limit is exceeded, then scores the rest by
+their live latency and error rate (from helpers.llm) weighted by preference. Every
+decision and its outcome is written to the artifact store so the policy can be tuned;
+records are batched (every ROUTING_LOG_FLUSH_SECONDS or ROUTING_LOG_BATCH calls) so
+that a call costs no database write of its own.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, TYPE_CHECKING
+
+from helpers.llm import chat_completion, get_breaker, get_model_stats
+from helpers.storage import get_store
+
+if TYPE_CHECKING:
+    from together import Together
+
+logger = logging.getLogger(__name__)
+
+ROUTING_LOG_BATCH = 50
+ROUTING_LOG_FLUSH_SECONDS = 10.0
+
+FAST_MODEL = "meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo"
+BALANCED_MODEL = "openai/gpt-oss-120b"
+LARGE_MODEL = "moonshotai/Kimi-K2-Instruct-0905"
+
+# Prior latency (seconds) used until a model has live samples.
+PRIOR_LATENCY = {
+    FAST_MODEL: 2.0,
+    BALANCED_MODEL: 6.0,
+    LARGE_MODEL: 10.0,
+}
+
+# Each extra preference rank multiplies the latency estimate by (1 + RANK_PENALTY * rank),
+# so a less preferred model only wins when it is clearly faster or healthier.
+RANK_PENALTY = 1.0
+# Weight of the recent error rate in the score (errors usually cost a retry).
+ERROR_PENALTY = 4.0
+
+
+@dataclass(frozen=True)
+class Candidate:
+    model: str
+    max_prompt_chars: Optional[int] = None
+
+
+# Candidates per task, most preferred first.
+TASK_POLICIES: Dict[str, Sequence[Candidate]] = {
+    # Short 30-second flashcard windows: the small model is good enough and fastest.
+    "flashcards_window": (
+        Candidate(FAST_MODEL, max_prompt_chars=6_000),
+        Candidate(BALANCED_MODEL),
+        Candidate(LARGE_MODEL),
+    ),
+    "flashcards_qa": (
+        Candidate(BALANCED_MODEL),
+        Candidate(LARGE_MODEL),
+    ),
+    # Whole-transcript quizzes need the larger models to keep 15 questions coherent.
+    "quiz": (
+        Candidate(LARGE_MODEL),
+        Candidate(BALANCED_MODEL),
+    ),
+    "graph_extract": (
+        Candidate(BALANCED_MODEL),
+        Candidate(LARGE_MODEL),
+    ),
+    "graph_decompose": (
+        Candidate(FAST_MODEL, max_prompt_chars=4_000),
+        Candidate(BALANCED_MODEL),
+    ),
+}
+
+
+@dataclass
+class RoutingDecision:
+    task: str
+    model: str
+    prompt_chars: int
+    reason: str
+    scores: Dict[str, float]
+
+
+def _score(model: str, rank: int) -> float:
+    stats = get_model_stats(model)
+    latency = stats.quantile(0.5) or PRIOR_LATENCY.get(model, 10.0)
+    return latency * (1 + ERROR_PENALTY * stats.error_rate()) * (1 + RANK_PENALTY * rank)
+
+
+def choose_model(task: str, prompt_chars: int) -> RoutingDecision:
+    """
+    Pick the model for a task given the prompt size and live model statistics.
+
+    Args:
+        task: Key of TASK_POLICIES
+        prompt_chars: Length of the prompt in characters
+
+    Returns:
+        RoutingDecision with the chosen model and the per-model scores
+    """
+    if task not in TASK_POLICIES:
+        raise ValueError(f"Unknown routing task: {task}")
+    candidates = TASK_POLICIES[task]
+
+    eligible: List[str] = []
+    for candidate in candidates:
+        if candidate.max_prompt_chars is not None and prompt_chars > candidate.max_prompt_chars:
+            continue
+        if get_breaker(candidate.model).state == "open":
+            continue
+        eligible.append(candidate.model)
+
+    if not eligible:
+        # Everything is tripped or too small: fall back to the last (largest) candidate
+        # and let the circuit breaker decide.
+        model = candidates[-1].model
+        return RoutingDecision(task, model, prompt_chars, "fallback", {})
+
+    scores = {model: _score(model, rank) for rank, model in enumerate(eligible)}
+    model = min(scores, key=scores.get)
+    reason = "preferred" if model == eligible[0] else "latency"
+    return RoutingDecision(task, model, prompt_chars, reason, scores)
+
+
+def routed_completion(
+    client: "Together",
+    *,
+    task: str,
+    messages: List[Dict[str, Any]],
+    model: Optional[str] = None,
+    **kwargs: Any,
+) -> Any:
+    """
+    Run a chat completion on the model chosen for `task`, recording decision and outcome.
+
+    Args:
+        client: Together API client instance
+        task: Key of TASK_POLICIES
+        messages: Chat messages
+        model: Explicit model override; skips routing but is still recorded
+        **kwargs: Forwarded to helpers.llm.chat_completion
+
+    Returns:
+        The Together chat completion response
+    """
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in messages)
+    if model:
+        decision = RoutingDecision(task, model, prompt_chars, "override", {})
+    else:
+        decision = choose_model(task, prompt_chars)
+
+    start = time.monotonic()
+    error: Optional[str] = None
+    try:
+        return chat_completion(client, model=decision.model, messages=messages, **kwargs)
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        _record(decision, time.monotonic() - start, error)
+
+
+class _RoutingLog:
+    """Routing decisions waiting to be written to the artifact store."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        self._flushed_at = time.monotonic()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._pending.append(record)
+            if len(self._pending) < ROUTING_LOG_BATCH and now - self._flushed_at < ROUTING_LOG_FLUSH_SECONDS:
+                return
+            batch, self._pending, self._flushed_at = self._pending, [], now
+        self._write(batch)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._pending, self._flushed_at = self._pending, [], time.monotonic()
+        self._write(batch)
+
+    @staticmethod
+    def _write(batch: List[Dict[str, Any]]) -> None:
+        try:
+            get_store().record_routing(batch)
+        except Exception as exc:
+            # The routing log is diagnostic only; never fail a generation because of it.
+            logger.warning(f"Could not record {len(batch)} routing decisions: {exc}")
+
+
+_routing_log = _RoutingLog()
+atexit.register(_routing_log.flush)
+
+
+def flush_routing_log() -> None:
+    """Write the pending routing decisions now (e.g. before summarizing them)."""
+    _routing_log.flush()
+
+
+def _record(decision: RoutingDecision, latency: float, error: Optional[str]) -> None:
+    _routing_log.add({
+        "created_at": time.time(),
+        "task": decision.task,
+        "model": decision.model,
+        "prompt_chars": decision.prompt_chars,
+        "reason": decision.reason,
+        "scores": decision.scores,
+        "latency": latency,
+        "error": error,
+    })
@@ -0,0 +1,93 @@
+"""
+Pydantic schemas for the structured output we ask the LLM for.
+
+These mirror the JSON formats spelled out in the prompts (quiz_prompts.py,
+flashcard_prompts.py and the concept prompts in graph.py) and are used by
+helpers.structured_output.validate_items to keep valid items and flag the rest.
+"""
+
+from __future__ import annotations
+
+from typing import Annotated, Dict, List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field, StringConstraints, model_validator
+
+NonEmptyStr = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+
+OptionKey = Literal["A", "B", "C", "D"]
+
+
+class QuizQuestion(BaseModel):
+    question: NonEmptyStr
+    options: Dict[OptionKey, NonEmptyStr]
+    correct_answer: OptionKey
+
+    @model_validator(mode="after")
+    def _check_options(self) -> "QuizQuestion":
+        if set(self.options) != {"A", "B", "C", "D"}:
+            raise ValueError("options must contain exactly A, B, C and D")
+        return self
+
+
+class KnowledgeCard(BaseModel):
+    card_type: Literal["knowledge"]
+    title: NonEmptyStr
+    knowledge_summary: NonEmptyStr
+
+
+class MultipleChoiceCard(BaseModel):
+    card_type: Literal["multiple_choice"]
+    question: NonEmptyStr
+    choices: List[NonEmptyStr] = Field(min_length=2)
+    correct_choice_index: int
+    explanation: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _check_index(self) -> "MultipleChoiceCard":
+        if not 0 <= self.correct_choice_index < len(self.choices):
+            raise ValueError("correct_choice_index is out of range")
+        return self
+
+
+class ClozeCard(BaseModel):
+    card_type: Literal["cloze"]
+    cloze_text: NonEmptyStr
+    hint: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _check_deletion(self) -> "ClozeCard":
+        if "{{" not in self.cloze_text:
+            raise ValueError("cloze_text has no {{c1::...}} deletion")
+        return self
+
+
+class QACard(BaseModel):
+    card_type: Literal["qa"]
+    question: NonEmptyStr
+    answer: NonEmptyStr
+    explanation: Optional[str] = None
+
+
+# Any one of the four multitype card kinds, selected by card_type.
+MultitypeFlashcard = Annotated[
+    Union[KnowledgeCard, MultipleChoiceCard, ClozeCard, QACard],
+    Field(discriminator="card_type"),
+]
+
+MULTITYPE_CARD_TYPES = ("knowledge", "multiple_choice", "cloze", "qa")
+
+
+class QAFlashcard(BaseModel):
+    question: NonEmptyStr
+    answer: NonEmptyStr
+
+
+class ConceptItem(BaseModel):
+    concepts: NonEmptyStr
+    description: NonEmptyStr
+    context: str = ""
+
+
+class SubConcept(BaseModel):
+    concepts: NonEmptyStr
+    description: NonEmptyStr
@@ -0,0 +1,778 @@
+"""
+SQLite-backed artifact store for transcripts, quizzes, flashcards, graphs and button state.
+
+Every cached artifact lives in one database file running in WAL mode so readers never
+block the writer. Cache tables are keyed by (video_id, params) where params is a
+canonical JSON encoding of the generation parameters, and are evicted least recently
+used first once the total payload size exceeds the configured byte budget.
+
+The database is shared by all worker processes: per-key locks are backed by leases in
+the database so that only one process builds a given artifact, and rate-limit token
+buckets live here too so that every worker draws from the same budget.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Dict, Hashable, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import orjson
+except ImportError:  # optional dependency; the json module is used instead
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.getenv("KNOWTUBE_DB_PATH", "artifacts.db")
+DEFAULT_MAX_BYTES = int(os.getenv("KNOWTUBE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Tables holding regenerable artifacts; these are subject to LRU eviction.
+CACHE_TABLES = ("transcripts", "quizzes", "flashcards", "graphs", "debug", "completions")
+
+# Fraction of the byte budget to shrink to once eviction kicks in, so that we do not
+# evict again on the very next insert.
+EVICTION_LOW_WATERMARK = 0.9
+
+# Routing decisions kept for tuning (see helpers.routing); older rows are pruned.
+ROUTING_LOG_MAX_ROWS = 50_000
+
+# Skip touching accessed_at on reads when it was refreshed this recently (seconds).
+TOUCH_INTERVAL = 60.0
+
+# Cross-process leases expire after this long even if their owner is alive on another
+# host (owners on this host are checked directly and taken over as soon as they die).
+LEASE_TTL = float(os.getenv("KNOWTUBE_LEASE_TTL", "900"))
+# Waiters for a lease poll after this fraction of the time waited so far (with
+# jitter), within these bounds: a quick build is noticed quickly, and a long LLM
+# call is not polled several times a second by every waiting process.
+LEASE_POLL_BACKOFF = 0.1
+LEASE_POLL_MIN_SECONDS = 0.02
+LEASE_POLL_MAX_SECONDS = 2.0
+
+_CACHE_TABLE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    video_id TEXT NOT NULL,
+    params TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (video_id, params)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at);
+CREATE TRIGGER IF NOT EXISTS {table}_usage_insert AFTER INSERT ON {table}
+BEGIN
+    UPDATE store_usage SET total_bytes = total_bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_usage_update AFTER UPDATE OF size ON {table}
+BEGIN
+    UPDATE store_usage SET total_bytes = total_bytes - OLD.size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_usage_delete AFTER DELETE ON {table}
+BEGIN
+    UPDATE store_usage SET total_bytes = total_bytes - OLD.size;
+END;
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS store_usage (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total_bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO store_usage (id, total_bytes) VALUES (0, 0);
+CREATE TABLE IF NOT EXISTS button_state (
+    kind TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (kind, item_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS routing_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    task TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_chars INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    scores TEXT NOT NULL,
+    latency REAL NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS routing_log_task_model ON routing_log (task, model);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL,
+    message TEXT NOT NULL,
+    result BLOB,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_dedupe_key ON jobs (dedupe_key, created_at);
+CREATE INDEX IF NOT EXISTS jobs_status_updated_at ON jobs (status, updated_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (job_id, seq)
+) WITHOUT ROWID;
+""" + "".join(_CACHE_TABLE_SCHEMA.format(table=table) for table in CACHE_TABLES)
+
+# Statements are module constants so sqlite3's per-connection statement cache
+# prepares each of them exactly once.
+_SELECT_SQL = {t: f"SELECT payload, accessed_at FROM {t} WHERE video_id = ? AND params = ?" for t in CACHE_TABLES}
+_TOUCH_SQL = {t: f"UPDATE {t} SET accessed_at = ? WHERE video_id = ? AND params = ?" for t in CACHE_TABLES}
+_UPSERT_SQL = {
+    t: (
+        f"INSERT INTO {t} (video_id, params, payload, size, created_at, accessed_at) "
+        "VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (video_id, params) DO UPDATE SET "
+        "payload = excluded.payload, size = excluded.size, "
+        "created_at = excluded.created_at, accessed_at = excluded.accessed_at"
+    )
+    for t in CACHE_TABLES
+}
+_DELETE_SQL = {t: f"DELETE FROM {t} WHERE video_id = ? AND params = ?" for t in CACHE_TABLES}
+_DELETE_IF_SQL = {t: f"DELETE FROM {t} WHERE video_id = ? AND params = ? AND payload = ?" for t in CACHE_TABLES}
+_LIST_SQL = {t: f"SELECT params FROM {t} WHERE video_id = ?" for t in CACHE_TABLES}
+_SCAN_SQL = {t: f"SELECT video_id, params, payload FROM {t} ORDER BY accessed_at DESC" for t in CACHE_TABLES}
+_LEASE_SQL = "SELECT owner, expires_at FROM leases WHERE key = ?"
+_LRU_SQL = (
+    "SELECT tbl, video_id, params, size FROM ("
+    + " UNION ALL ".join(
+        f"SELECT '{t}' AS tbl, video_id, params, size, accessed_at FROM {t}" for t in CACHE_TABLES
+    )
+    + ") ORDER BY accessed_at LIMIT ?"
+)
+
+
+def params_key(params: Optional[Mapping[str, Any]] = None) -> str:
+    """
+    Canonical string form of generation parameters used as part of the cache key.
+
+    None values are dropped so that omitting an optional parameter and passing None
+    address the same entry.
+    """
+    if not params:
+        return "{}"
+    cleaned = {k: v for k, v in params.items() if v is not None}
+    return json.dumps(cleaned, sort_keys=True, separators=(",", ":"))
+
+
+def encode_payload(value: Any) -> bytes:
+    """
+    Serialize an artifact to compact UTF-8 JSON, the form it is stored in and served
+    as (see ArtifactStore.get_or_create_bytes).
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Values orjson refuses (e.g. lone surrogates); let json have a go.
+            pass
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_payload(payload: bytes) -> Any:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch either.
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def process_owner() -> str:
+    """Identifier of the current process, used as the owner of leases and jobs."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def owner_alive(owner: str) -> bool:
+    """Whether the process identified by process_owner() output is still running."""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        # Cannot check processes on other hosts; assume they are alive.
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class KeyedLocks:
+    """
+    One lock per key, created on demand and dropped once nobody holds or waits on it.
+    """
+
+    def __init__(self) -> None:
+        self._guard = threading.Lock()
+        self._locks: Dict[Hashable, List[Any]] = {}
+
+    @contextmanager
+    def hold(self, key: Hashable) -> Iterator[None]:
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+
+class ArtifactStore:
+    """
+    Thread-safe handle on the artifact database.
+
+    Each thread gets its own sqlite3 connection; WAL mode lets any number of readers
+    proceed while a single writer commits.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._key_locks = KeyedLocks()
+        # executescript manages its own transaction.
+        self._connection().executescript(_SCHEMA)
+
+    # -- connection handling -------------------------------------------------
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=30.0,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=256,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # -- cache tables --------------------------------------------------------
+
+    @staticmethod
+    def _check_table(table: str) -> None:
+        if table not in CACHE_TABLES:
+            raise ValueError(f"Unknown artifact table: {table}")
+
+    def get_bytes(self, table: str, video_id: str, params: Optional[Mapping[str, Any]] = None) -> Optional[bytes]:
+        """Return the raw payload for an artifact, or None on a cache miss."""
+        self._check_table(table)
+        key = params_key(params)
+        conn = self._connection()
+        row = conn.execute(_SELECT_SQL[table], (video_id, key)).fetchone()
+        if row is None:
+            return None
+        payload, accessed_at = row
+        now = time.time()
+        if now - accessed_at > TOUCH_INTERVAL:
+            conn.execute(_TOUCH_SQL[table], (now, video_id, key))
+        return bytes(payload)
+
+    def get(self, table: str, video_id: str, params: Optional[Mapping[str, Any]] = None) -> Optional[Any]:
+        """Return the decoded artifact, or None on a cache miss."""
+        payload = self.get_bytes(table, video_id, params)
+        if payload is None:
+            return None
+        try:
+            return decode_payload(payload)
+        except json.JSONDecodeError:
+            # Only drop the exact payload we failed to decode; a writer may have replaced
+            # it with a good one in the meantime.
+            logger.warning(f"Dropping corrupted {table} entry for {video_id}")
+            with self._transaction() as conn:
+                conn.execute(_DELETE_IF_SQL[table], (video_id, params_key(params), payload))
+            return None
+
+    @contextmanager
+    def locked(self, table: str, video_id: str, params: Optional[Mapping[str, Any]] = None) -> Iterator[None]:
+        """Serialize writers of one artifact across threads and worker processes."""
+        key = f"{table}:{video_id}:{params_key(params)}"
+        # Threads of this process queue on an in-memory lock, so at most one of them
+        # polls the database lease at a time.
+        with self._key_locks.hold(key):
+            started = time.monotonic()
+            while not self.acquire_lease(key):
+                waited = time.monotonic() - started
+                delay = min(LEASE_POLL_MAX_SECONDS, max(LEASE_POLL_MIN_SECONDS, waited * LEASE_POLL_BACKOFF))
+                time.sleep(random.uniform(0.5, 1.0) * delay)
+            try:
+                yield
+            finally:
+                self.release_lease(key)
+
+    def get_or_create(
+        self,
+        table: str,
+        video_id: str,
+        factory: Callable[[], Any],
+        params: Optional[Mapping[str, Any]] = None,
+        store_if: Optional[Callable[[Any], bool]] = None,
+        gate: Optional[Callable[[], ContextManager[Any]]] = None,
+    ) -> Any:
+        """
+        Return the cached artifact, or build it with factory() and store it.
+
+        Concurrent callers for the same key wait for the first one instead of all
+        calling the (expensive) factory. A built value for which store_if returns
+        False (e.g. a partial result) is returned but not stored, so the next caller
+        builds it again.
+
+        On a cache miss, gate() (e.g. an admission slot, see helpers.admission) is
+        entered before the key lock, so callers waiting for the same key are gated
+        too and none waits for the gate while holding the lock.
+        """
+        value = self.get(table, video_id, params)
+        if value is not None:
+            return value
+        with gate() if gate is not None else nullcontext():
+            with self.locked(table, video_id, params):
+                value = self.get(table, video_id, params)
+                if value is None:
+                    value = factory()
+                    if store_if is None or store_if(value):
+                        self.put(table, video_id, value, params)
+        return value
+
+    def get_or_create_bytes(
+        self,
+        table: str,
+        video_id: str,
+        factory: Callable[[], Any],
+        params: Optional[Mapping[str, Any]] = None,
+        gate: Optional[Callable[[], ContextManager[Any]]] = None,
+    ) -> bytes:
+        """
+        Like get_or_create, but return the stored JSON bytes without decoding them, so
+        that a cache hit can be sent as the response body as is.
+        """
+        payload = self.get_bytes(table, video_id, params)
+        if payload is not None:
+            return payload
+        with gate() if gate is not None else nullcontext():
+            with self.locked(table, video_id, params):
+                payload = self.get_bytes(table, video_id, params)
+                if payload is None:
+                    payload = encode_payload(factory())
+                    self._write_payloads(table, [(video_id, params, payload)])
+        return payload
+
+    # Async wrappers so that coroutine routes never run SQLite I/O on the event loop.
+
+    async def aget(self, table: str, video_id: str, params: Optional[Mapping[str, Any]] = None) -> Optional[Any]:
+        return await run_in_threadpool(self.get, table, video_id, params)
+
+    async def aget_bytes(
+        self, table: str, video_id: str, params: Optional[Mapping[str, Any]] = None
+    ) -> Optional[bytes]:
+        return await run_in_threadpool(self.get_bytes, table, video_id, params)
+
+    async def aput(self, table: str, video_id: str, value: Any, params: Optional[Mapping[str, Any]] = None) -> None:
+        await run_in_threadpool(self.put, table, video_id, value, params)
+
+    def put(self, table: str, video_id: str, value: Any, params: Optional[Mapping[str, Any]] = None) -> None:
+        """Insert or replace a single artifact."""
+        self.put_many(table, [(video_id, params, value)])
+
+    def put_bytes(self, table: str, video_id: str, payload: bytes, params: Optional[Mapping[str, Any]] = None) -> None:
+        """Insert or replace a single artifact given as already encoded JSON bytes."""
+        self._write_payloads(table, [(video_id, params, payload)])
+
+    def put_many(
+        self,
+        table: str,
+        rows: Iterable[Tuple[str, Optional[Mapping[str, Any]], Any]],
+    ) -> int:
+        """
+        Insert or replace many artifacts in one transaction.
+
+        Args:
+            table: One of CACHE_TABLES
+            rows: Iterable of (video_id, params, value) tuples
+
+        Returns:
+            Number of rows written
+        """
+        return self._write_payloads(
+            table, [(video_id, params, encode_payload(value)) for video_id, params, value in rows]
+        )
+
+    def _write_payloads(self, table: str, rows: Iterable[Tuple[str, Optional[Mapping[str, Any]], bytes]]) -> int:
+        self._check_table(table)
+        now = time.time()
+        records = [(video_id, params_key(params), payload, len(payload), now, now) for video_id, params, payload in rows]
+        if not records:
+            return 0
+        with self._transaction() as conn:
+            conn.executemany(_UPSERT_SQL[table], records)
+        self._evict_if_needed()
+        return len(records)
+
+    def delete(self, table: str, video_id: str, params: Optional[Mapping[str, Any]] = None) -> None:
+        self._check_table(table)
+        with self._transaction() as conn:
+            conn.execute(_DELETE_SQL[table], (video_id, params_key(params)))
+
+    def list_params(self, table: str, video_id: str) -> list:
+        """Return the decoded params of every cached entry for a video."""
+        self._check_table(table)
+        rows = self._connection().execute(_LIST_SQL[table], (video_id,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def scan(self, table: str) -> Iterator[Tuple[str, dict, Any]]:
+        """
+        Yield (video_id, params, value) for every cached entry of a table, most
+        recently used first.
+
+        Unlike get, this does not refresh the entries' LRU position.
+        """
+        self._check_table(table)
+        for video_id, params, payload in self._connection().execute(_SCAN_SQL[table]):
+            yield video_id, json.loads(params), decode_payload(payload)
+
+    # -- cross-process leases ------------------------------------------------
+
+    def acquire_lease(self, key: str, ttl: float = LEASE_TTL) -> bool:
+        """
+        Take the lease on key for this process unless another live process holds it.
+
+        Returns:
+            True if this process now holds the lease
+        """
+        owner = process_owner()
+        now = time.time()
+
+        def held_elsewhere(row: Optional[Tuple[str, float]]) -> bool:
+            return row is not None and row[0] != owner and row[1] > now and owner_alive(row[0])
+
+        # Check with a plain read first, so that waiting for a held lease never takes
+        # the database's write lock.
+        if held_elsewhere(self._connection().execute(_LEASE_SQL, (key,)).fetchone()):
+            return False
+        with self._transaction() as conn:
+            if held_elsewhere(conn.execute(_LEASE_SQL, (key,)).fetchone()):
+                return False
+            conn.execute(
+                "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                (key, owner, now + ttl),
+            )
+        return True
+
+    def release_lease(self, key: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, process_owner()))
+
+    # -- shared rate limits --------------------------------------------------
+
+    def reserve_tokens(
+        self, bucket: str, rate: float, capacity: float, cost: float = 1.0, max_wait: Optional[float] = None
+    ) -> float:
+        """
+        Take `cost` tokens from a token bucket shared by all processes.
+
+        The bucket refills at `rate` tokens per second up to `capacity`. Tokens are
+        reserved even when the bucket is short, so callers are served in arrival order.
+
+        Args:
+            max_wait: Leave the bucket untouched if the reservation could only be used
+                      after more than this many seconds
+
+        Returns:
+            Seconds the caller must wait before using its reservation (0 if none); more
+            than max_wait if nothing was reserved
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE name = ?", (bucket,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            tokens -= cost
+            wait = 0.0 if tokens >= 0 else -tokens / rate
+            if max_wait is not None and wait > max_wait:
+                return wait
+            conn.execute(
+                "INSERT INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (bucket, tokens, now),
+            )
+        return wait
+
+    # -- eviction ------------------------------------------------------------
+
+    def usage(self) -> int:
+        """Total payload bytes currently held in the cache tables."""
+        row = self._connection().execute("SELECT total_bytes FROM store_usage WHERE id = 0").fetchone()
+        return int(row[0]) if row else 0
+
+    def _evict_if_needed(self) -> None:
+        if self.max_bytes > 0 and self.usage() > self.max_bytes:
+            self.evict(int(self.max_bytes * EVICTION_LOW_WATERMARK))
+
+    def evict(self, target_bytes: int, batch_size: int = 64) -> int:
+        """
+        Delete least recently used artifacts until usage is at or below target_bytes.
+
+        Returns:
+            Number of artifacts evicted
+        """
+        evicted = 0
+        with self._transaction() as conn:
+            usage = conn.execute("SELECT total_bytes FROM store_usage WHERE id = 0").fetchone()[0]
+            while usage > target_bytes:
+                victims = conn.execute(_LRU_SQL, (batch_size,)).fetchall()
+                if not victims:
+                    break
+                for table, video_id, params, size in victims:
+                    conn.execute(_DELETE_SQL[table], (video_id, params))
+                    usage -= size
+                    evicted += 1
+                    if usage <= target_bytes:
+                        break
+        if evicted:
+            logger.info(f"Evicted {evicted} artifacts to stay under {target_bytes} bytes")
+        return evicted
+
+    # -- button state --------------------------------------------------------
+
+    def get_button(self, kind: str, item_id: int) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT text FROM button_state WHERE kind = ? AND item_id = ?", (kind, item_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_buttons(self, kind: str, items: Iterable[Tuple[int, str]]) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO button_state (kind, item_id, text, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (kind, item_id) DO UPDATE SET text = excluded.text, updated_at = excluded.updated_at",
+                [(kind, item_id, text, now) for item_id, text in items],
+            )
+
+    def set_button(self, kind: str, item_id: int, text: str) -> None:
+        self.set_buttons(kind, [(item_id, text)])
+
+    # -- routing log ---------------------------------------------------------
+
+    def record_routing(self, records: Iterable[Mapping[str, Any]]) -> None:
+        """
+        Append routing decisions in one transaction (see helpers.routing, which batches them).
+
+        Args:
+            records: {"created_at", "task", "model", "prompt_chars", "reason", "scores", "latency", "error"}
+        """
+        rows = [
+            (
+                record["created_at"], record["task"], record["model"], record["prompt_chars"], record["reason"],
+                json.dumps(record["scores"]), record["latency"], record["error"],
+            )
+            for record in records
+        ]
+        if not rows:
+            return
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO routing_log (created_at, task, model, prompt_chars, reason, scores, latency, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            last_id = conn.execute("SELECT MAX(id) FROM routing_log").fetchone()[0]
+            conn.execute("DELETE FROM routing_log WHERE id <= ?", (last_id - ROUTING_LOG_MAX_ROWS,))
+
+    def routing_summary(self) -> list:
+        """Per (task, model) call count, error count and latency, for tuning the policy."""
+        rows = self._connection().execute(
+            "SELECT task, model, COUNT(*), SUM(error IS NOT NULL), AVG(latency), MAX(latency), AVG(prompt_chars) "
+            "FROM routing_log GROUP BY task, model ORDER BY task, model"
+        ).fetchall()
+        return [
+            {
+                "task": task,
+                "model": model,
+                "calls": calls,
+                "errors": errors,
+                "avg_latency": avg_latency,
+                "max_latency": max_latency,
+                "avg_prompt_chars": avg_prompt_chars,
+            }
+            for task, model, calls, errors, avg_latency, max_latency, avg_prompt_chars in rows
+        ]
+
+    # -- jobs ----------------------------------------------------------------
+
+    def create_job(self, job_id: str, kind: str, params: Mapping[str, Any], dedupe_key: str, owner: str) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, dedupe_key, owner, status, progress, message, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', 0, 'queued', ?, ?)",
+                (job_id, kind, params_key(params), dedupe_key, owner, now, now),
+            )
+
+    def find_job(self, dedupe_key: str, statuses: Iterable[str]) -> Optional[dict]:
+        """Most recent job with this dedupe key in one of the given statuses."""
+        statuses = list(statuses)
+        row = self._connection().execute(
+            f"SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ({','.join('?' * len(statuses))}) "
+            "ORDER BY created_at DESC LIMIT 1",
+            (dedupe_key, *statuses),
+        ).fetchone()
+        return self.get_job(row[0]) if row else None
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        row = self._connection().execute(
+            "SELECT id, kind, params, owner, status, progress, message, result, error, created_at, updated_at "
+            "FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        job_id, kind, params, owner, status, progress, message, result, error, created_at, updated_at = row
+        return {
+            "id": job_id,
+            "kind": kind,
+            "params": json.loads(params),
+            "owner": owner,
+            "status": status,
+            "progress": progress,
+            "message": message,
+            "result": decode_payload(result) if result is not None else None,
+            "error": error,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def update_job(
+        self,
+        job_id: str,
+        *,
+        status: str,
+        progress: float,
+        message: str,
+        event: str,
+        result: Any = None,
+        error: Optional[str] = None,
+    ) -> int:
+        """
+        Update a job and append the matching event in one transaction.
+
+        Returns:
+            Sequence number of the appended event
+        """
+        now = time.time()
+        payload = encode_payload(result) if result is not None else None
+        data = json.dumps({"status": status, "progress": progress, "message": message, "error": error})
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, progress = ?, message = ?, result = COALESCE(?, result), "
+                "error = ?, updated_at = ? WHERE id = ?",
+                (status, progress, message, payload, error, now, job_id),
+            )
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO job_events (job_id, seq, event, data, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, seq, event, data, now),
+            )
+        return seq
+
+    def job_events(self, job_id: str, after_seq: int = 0) -> list:
+        """Events of a job with seq > after_seq, oldest first."""
+        rows = self._connection().execute(
+            "SELECT seq, event, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after_seq),
+        ).fetchall()
+        return [{"seq": seq, "event": event, "data": json.loads(data)} for seq, event, data in rows]
+
+    def prune_jobs(self, statuses: Iterable[str], updated_before: float) -> int:
+        """
+        Delete jobs in one of the given statuses last updated before `updated_before`
+        (epoch seconds), with their events.
+
+        Returns:
+            Number of jobs deleted
+        """
+        statuses = list(statuses)
+        where = f"status IN ({','.join('?' * len(statuses))}) AND updated_at < ?"
+        with self._transaction() as conn:
+            conn.execute(
+                f"DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE {where})",
+                (*statuses, updated_before),
+            )
+            return conn.execute(f"DELETE FROM jobs WHERE {where}", (*statuses, updated_before)).rowcount
+
+    def unfinished_jobs(self) -> list:
+        rows = self._connection().execute(
+            "SELECT id, owner, status FROM jobs WHERE status IN ('queued', 'running')"
+        ).fetchall()
+        return [{"id": job_id, "owner": owner, "status": status} for job_id, owner, status in rows]
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ArtifactStore:
+    """Return the process-wide artifact store, opening it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArtifactStore()
+    return _store
@@ -0,0 +1,162 @@
+"""
+Tolerant parsing and validation of JSON lists returned by the LLM.
+
+Models wrap their JSON in code fences, add chatty intros, emit trailing commas or
+get cut off mid-list. scan_json_array walks the first array element by element, so
+every complete element is kept even when a later one is malformed or truncated, and
+validate_items checks each element against a pydantic schema so callers can request
+a targeted repair for just the missing or invalid positions.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+
+class _Invalid:
+    """Placeholder for an array element that could not be parsed."""
+
+    def __init__(self, fragment: str) -> None:
+        self.fragment = fragment
+
+    def __repr__(self) -> str:
+        return f"INVALID({self.fragment[:40]!r})"
+
+
+@dataclass
+class ScanResult:
+    # Parsed elements in order; unparseable ones are _Invalid placeholders.
+    items: List[Any] = field(default_factory=list)
+    # False when the array was never closed (output cut off).
+    complete: bool = False
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE_AND_COMMAS = " \t\r\n,"
+
+
+def _skip_value(text: str, pos: int) -> Optional[int]:
+    """
+    Return the index just past the (possibly malformed) value starting at pos, using
+    bracket depth and string awareness. None if the value is unterminated.
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(pos, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "[{":
+            depth += 1
+        elif char in "]}":
+            if depth == 0:
+                return i
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        elif char == "," and depth == 0:
+            return i
+    return None
+
+
+def _find_array_start(text: str, key: Optional[str]) -> Optional[int]:
+    if key is not None:
+        match = re.search(r'"' + re.escape(key) + r'"\s*:\s*\[', text)
+        if match:
+            return match.end() - 1
+    index = text.find("[")
+    return index if index >= 0 else None
+
+
+def scan_json_array(text: str, key: Optional[str] = None) -> ScanResult:
+    """
+    Incrementally parse the first JSON array in `text`.
+
+    Args:
+        text: Raw model output (may contain code fences or prose around the JSON)
+        key: If given, prefer the array stored under this object key
+             (e.g. "flashcards" for {"flashcards": [...]})
+
+    Returns:
+        ScanResult with every element in order; a lone top-level object with no
+        array is returned as a one-element list.
+    """
+    start = _find_array_start(text, key)
+    if start is None:
+        brace = text.find("{")
+        if brace >= 0:
+            try:
+                value, _ = _decoder.raw_decode(text, brace)
+                return ScanResult(items=[value], complete=True)
+            except json.JSONDecodeError:
+                pass
+        return ScanResult()
+
+    result = ScanResult()
+    pos = start + 1
+    length = len(text)
+    while True:
+        while pos < length and text[pos] in _WHITESPACE_AND_COMMAS:
+            pos += 1
+        if pos >= length:
+            break
+        if text[pos] == "]":
+            result.complete = True
+            break
+        try:
+            value, pos = _decoder.raw_decode(text, pos)
+            result.items.append(value)
+            continue
+        except json.JSONDecodeError:
+            pass
+        end = _skip_value(text, pos)
+        if end is None:
+            # Truncated final element: nothing more to recover.
+            break
+        if end == pos:
+            # A stray closing bracket; step over it.
+            end += 1
+        result.items.append(_Invalid(text[pos:end]))
+        pos = end
+    return result
+
+
+@lru_cache(maxsize=None)
+def _adapter(schema: Any) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def validate_items(items: List[Any], schema: Any) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, str]]:
+    """
+    Validate scanned elements against a pydantic model (or annotated union of models).
+
+    Returns:
+        (valid, invalid): valid maps position to the normalized item dict,
+        invalid maps position to a short error description
+    """
+    valid: Dict[int, Dict[str, Any]] = {}
+    invalid: Dict[int, str] = {}
+    for index, item in enumerate(items):
+        if isinstance(item, _Invalid):
+            invalid[index] = "unparseable JSON"
+            continue
+        try:
+            valid[index] = _adapter(schema).validate_python(item).model_dump(exclude_none=True)
+        except ValidationError as exc:
+            invalid[index] = "; ".join(error["msg"] for error in exc.errors())
+    return valid, invalid
@@ -0,0 +1,264 @@
+"""
+Precomputed text index for transcripts.
+
+Routes and generators need the transcript as one normalized string (raw text, quiz
+and QA prompts) and need to map positions in that string back to video time. Building
+the string from the segment list on every request is wasteful, so each transcript gets
+a TranscriptIndex once at ingest: the joined text plus compact arrays with the
+character offset, start and duration of every segment. Indexes are kept in a
+size-aware in-memory LRU shared by the whole process.
+
+A TranscriptIndex is also a read-only sequence of segments: index[i] is a
+{"text", "start", "duration"} mapping view over the arrays, so code written for the
+decoded list of segment dicts works on it unchanged, at about a fifth of the memory
+(see helpers.bench_transcript_memory).
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from collections.abc import Mapping as MappingABC, Sequence as SequenceABC
+from typing import Any, Callable, Hashable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+DEFAULT_INDEX_CACHE_BYTES = int(os.getenv("KNOWTUBE_INDEX_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+SEGMENT_SEPARATOR = " "
+
+
+def normalize_segment_text(text: Any) -> str:
+    """Collapse runs of whitespace (including caption line breaks) to single spaces."""
+    return " ".join(str(text).split())
+
+
+SEGMENT_KEYS = ("text", "start", "duration")
+
+
+class Segment(MappingABC):
+    """Read-only {"text", "start", "duration"} view of one segment of a TranscriptIndex."""
+
+    __slots__ = ("_index", "_position")
+
+    def __init__(self, index: "TranscriptIndex", position: int) -> None:
+        self._index = index
+        self._position = position
+
+    def __getitem__(self, key: str) -> Any:
+        index, position = self._index, self._position
+        if key == "text":
+            return index.text[index.offsets[position]:index.ends[position]]
+        if key == "start":
+            return index.starts[position]
+        if key == "duration":
+            return index.durations[position]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(SEGMENT_KEYS)
+
+    def __len__(self) -> int:
+        return len(SEGMENT_KEYS)
+
+    def __repr__(self) -> str:
+        # Same as the segment dict, so prompts built with str(segments) do not change.
+        return repr(dict(self))
+
+
+class TranscriptIndex(SequenceABC):
+    """
+    Normalized full text of a transcript with per-segment character offsets.
+
+    Segment i occupies text[offsets[i]:ends[i]]. Segments whose text is empty after
+    normalization get a zero-length span and are skipped when joining. `metadata`
+    holds the transcript's other fields (video_id, language, ...) when known. Indexes
+    are shared between requests and must not be modified.
+    """
+
+    __slots__ = ("text", "offsets", "ends", "starts", "durations", "metadata")
+
+    def __init__(
+        self,
+        text: str,
+        offsets: array,
+        ends: array,
+        starts: array,
+        durations: array,
+        metadata: Optional[Mapping[str, Any]] = None,
+    ) -> None:
+        self.text = text
+        self.offsets = offsets
+        self.ends = ends
+        self.starts = starts
+        self.durations = durations
+        self.metadata = metadata
+
+    @classmethod
+    def from_segments(
+        cls, segments: Sequence[Mapping[str, Any]], metadata: Optional[Mapping[str, Any]] = None
+    ) -> "TranscriptIndex":
+        """
+        Build the index from a list of {"text", "start", "duration"} segments.
+        """
+        parts = []
+        offsets = array("l")
+        ends = array("l")
+        starts = array("d")
+        durations = array("d")
+        position = 0
+        for segment in segments:
+            text = normalize_segment_text(segment.get("text", ""))
+            if text and parts:
+                position += len(SEGMENT_SEPARATOR)
+            offsets.append(position)
+            if text:
+                parts.append(text)
+                position += len(text)
+            ends.append(position)
+            starts.append(float(segment.get("start", 0.0)))
+            durations.append(float(segment.get("duration", 0.0)))
+        return cls(SEGMENT_SEPARATOR.join(parts), offsets, ends, starts, durations, metadata)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[Segment, List[Segment]]:
+        if isinstance(item, slice):
+            return [Segment(self, position) for position in range(*item.indices(len(self)))]
+        position = item + len(self) if item < 0 else item
+        if not 0 <= position < len(self):
+            raise IndexError("segment index out of range")
+        return Segment(self, position)
+
+    def __iter__(self) -> Iterator[Segment]:
+        return (Segment(self, position) for position in range(len(self)))
+
+    @property
+    def end_time(self) -> float:
+        """End of the last segment (seconds), 0.0 for an empty transcript."""
+        if not len(self):
+            return 0.0
+        return self.starts[-1] + self.durations[-1]
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the index."""
+        arrays = (self.offsets, self.ends, self.starts, self.durations)
+        return sys.getsizeof(self.text) + sum(a.itemsize * len(a) for a in arrays)
+
+    def truncated(self, max_chars: int) -> str:
+        """Full text cut to max_chars, with "..." appended when it was cut."""
+        if len(self.text) > max_chars:
+            return f"{self.text[:max_chars]}..."
+        return self.text
+
+    def segment_at_char(self, char_pos: int) -> int:
+        """
+        Index of the segment containing character position char_pos (clamped to the
+        transcript; a separator belongs to the segment before it).
+        """
+        if not len(self):
+            raise IndexError("Transcript has no segments.")
+        index = max(0, bisect_right(self.offsets, char_pos) - 1)
+        while index > 0 and self.offsets[index] == self.ends[index]:
+            # Empty segments own no characters.
+            index -= 1
+        return index
+
+    def time_at_char(self, char_pos: int) -> float:
+        """Video time (seconds) at which the segment containing char_pos starts."""
+        return self.starts[self.segment_at_char(char_pos)]
+
+    def segment_at_time(self, seconds: float) -> int:
+        """Index of the last segment starting at or before `seconds` (0 if none)."""
+        if not len(self):
+            raise IndexError("Transcript has no segments.")
+        return max(0, bisect_right(self.starts, seconds) - 1)
+
+    def char_range(self, first: int, last: int) -> Tuple[int, int]:
+        """Character span covering segments first..last (inclusive)."""
+        return self.offsets[first], self.ends[last]
+
+    def segment_range(self, start_seconds: Optional[float] = None, end_seconds: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Half-open range [first, stop) of the segments overlapping [start_seconds, end_seconds].
+        Either bound may be None to leave that side open.
+        """
+        first, stop = 0, len(self)
+        if start_seconds is not None and stop:
+            first = self.segment_at_time(start_seconds)
+            if self.starts[first] + self.durations[first] <= start_seconds and self.starts[first] < start_seconds:
+                first += 1
+        if end_seconds is not None:
+            stop = bisect_right(self.starts, end_seconds)
+        return first, max(first, stop)
+
+    def text_between(self, start_seconds: float, end_seconds: float) -> str:
+        """Text of the segments overlapping [start_seconds, end_seconds]."""
+        first, stop = self.segment_range(start_seconds, end_seconds)
+        if first >= stop:
+            return ""
+        begin, end = self.char_range(first, stop - 1)
+        return self.text[begin:end]
+
+
+class SizedLRU:
+    """Thread-safe LRU mapping bounded by the total `nbytes` of its values."""
+
+    def __init__(self, max_bytes: int = DEFAULT_INDEX_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = value.nbytes
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            if size > self.max_bytes:
+                # Larger than the whole budget: do not cache it, and do not flush
+                # everything else trying to make room.
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            # Building is cheap and deterministic; a rare duplicate build is harmless.
+            value = build()
+            self.put(key, value)
+        return value
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+_index_cache = SizedLRU()
+
+
+def get_index_cache() -> SizedLRU:
+    return _index_cache
@@ -1,24 +1,45 @@
-import os
-import json
-from typing import Optional
+from typing import Any, Dict, List, Mapping, Optional
+
+from fastapi import HTTPException
+
+from helpers.chapters import chapter_at_time, segment_chapters
 from helpers.helpers import fetch_transcript
+from helpers.related_videos import get_related_video_index
+from helpers.storage import get_store
+from helpers.transcript_index import TranscriptIndex, get_index_cache
+
+# Fields of a stored transcript that are not metadata.
+TRANSCRIPT_BODY_KEYS = ("transcript", "chapters")
+
+
+def transcript_metadata(transcript: Mapping[str, Any]) -> Dict[str, Any]:
+    """The stored transcript's fields other than its segments and chapters."""
+    return {key: value for key, value in transcript.items() if key not in TRANSCRIPT_BODY_KEYS}
+
 
 def get_transcript(
     video_id: str,
     language_code: Optional[str] = None,
 ):
-    file_path = f"transcript_{video_id}.json"
-
-    # 1. Try to use cache
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            # Cache is corrupted; delete and regenerate
-            os.remove(file_path)
-
-    # 2. Fetch from YouTube
+    # Cached transcripts are returned directly; concurrent misses share one fetch.
+    return get_store().get_or_create(
+        "transcripts", video_id, lambda: _fetch_transcript_dict(video_id, language_code)
+    )
+
+
+def get_transcript_bytes(
+    video_id: str,
+    language_code: Optional[str] = None,
+) -> bytes:
+    # Same cache entry as get_transcript, returned as the stored JSON bytes (the
+    # GET /transcript response body) without decoding.
+    return get_store().get_or_create_bytes(
+        "transcripts", video_id, lambda: _fetch_transcript_dict(video_id, language_code)
+    )
+
+
+def _fetch_transcript_dict(video_id: str, language_code: Optional[str]) -> dict:
+    # Fetch from YouTube
     fetched_transcript = fetch_transcript(video_id, language_code)
 
     # Convert to raw data
@@ -31,10 +52,81 @@ def get_transcript(
         "is_generated": fetched_transcript.is_generated,
         "transcript": transcript_data,  # <-- KEEP AS LIST OF DICTS
         "total_segments": len(fetched_transcript),
+        # Topic boundaries are computed once here and stored with the transcript.
+        "chapters": segment_chapters(transcript_data),
     }
 
-    # 3. Save valid JSON
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(transcript_dict, f, ensure_ascii=False, indent=4)
+    # Index at ingest so the first text/time lookups do not have to rebuild it.
+    get_index_cache().put(
+        video_id, TranscriptIndex.from_segments(transcript_data, transcript_metadata(transcript_dict))
+    )
+    get_related_video_index().add_transcript(video_id, transcript_data)
+
+    return transcript_dict
+
+
+def get_transcript_index(
+    video_id: str,
+    language_code: Optional[str] = None,
+) -> TranscriptIndex:
+    """
+    Normalized full text and segment offsets for a video's transcript.
+
+    Served from the in-memory index LRU; on a miss the transcript is loaded
+    (from the artifact store or YouTube) and indexed once, with its metadata.
+    """
+
+    def build() -> TranscriptIndex:
+        transcript = get_transcript(video_id, language_code)
+        return TranscriptIndex.from_segments(transcript["transcript"], transcript_metadata(transcript))
+
+    return get_index_cache().get_or_build(video_id, build)
+
+
+def get_transcript_chapters(
+    video_id: str,
+    language_code: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Topical chapters of a video's transcript, see helpers.chapters.
+
+    Transcripts cached before chapters were computed at ingest are segmented once
+    and stored back together with their chapters.
+    """
+    transcript = get_transcript(video_id, language_code)
+    chapters = transcript.get("chapters")
+    if chapters is None:
+        store = get_store()
+        # Same key lock as the transcript's own cache fill; another worker may have
+        # stored the chapters (or replaced the transcript) meanwhile.
+        with store.locked("transcripts", video_id):
+            transcript = store.get("transcripts", video_id) or transcript
+            chapters = transcript.get("chapters")
+            if chapters is None:
+                chapters = segment_chapters(transcript["transcript"])
+                store.put("transcripts", video_id, {**transcript, "chapters": chapters})
+    return chapters
+
+
+def get_chapter(
+    video_id: str,
+    chapter: Optional[int] = None,
+    time_stamp: float = 0.0,
+    language_code: Optional[str] = None,
+) -> Mapping[str, Any]:
+    """
+    One chapter of a video: by index, or the one playing at time_stamp if chapter is None.
 
-    return transcript_dict
\ No newline at end of file
+    Raises:
+        HTTPException: 404 if the transcript is empty or has no such chapter
+    """
+    chapters = get_transcript_chapters(video_id, language_code)
+    if not chapters:
+        raise HTTPException(status_code=404, detail=f"Transcript of {video_id} is empty")
+    if chapter is None:
+        return chapter_at_time(chapters, time_stamp)
+    if not 0 <= chapter < len(chapters):
+        raise HTTPException(
+            status_code=404, detail=f"Chapter {chapter} not found; {video_id} has {len(chapters)} chapters"
+        )
+    return chapters[chapter]
@@ -0,0 +1,256 @@
+"""
+Pre-generate every artifact for a list of videos before a class session.
+
+For each video this builds the transcript, the quiz bank, the multitype flashcards
+the frontend requests (or, with --all-windows, those of every window of the video)
+and the concept graph, using the same cached
+pipelines (and cache keys) as the routes. Anything already in the artifact store is
+skipped, so an interrupted run can simply be started again.
+
+Video IDs are read from text files (one ID or YouTube URL per line), CSV playlist
+exports (e.g. Google Takeout, first column "Video ID") or JSON files containing
+"videoId" / "video_id" fields.
+
+Usage:
+    cd backend && python -m helpers.warmup videos.txt --concurrency 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from together import Together
+
+from helpers.fetch_scheduler import BACKGROUND, fetch_priority
+from helpers.flashcards.create_flashcard import (
+    default_context_chars,
+    get_multitype_flashcards,
+    multitype_cache_params,
+)
+from helpers.graph import build_video_graph, graph_cache_params
+from helpers.quiz.create_quiz import generate_quiz_from_transcript, quiz_cache_params
+from helpers.storage import get_store
+from helpers.transcripts import get_transcript, get_transcript_index
+
+# Window length and time stamps the frontend requests multitype flashcards with
+# (FlashcardBoard.tsx cycles through `counter % 3`).
+DEFAULT_WINDOW_SECONDS = 45
+CLIENT_TIME_STAMPS = (0.0, 1.0, 2.0)
+# Defaults of the /quiz and /graph/video-item-descriptions routes.
+QUIZ_MAX_TRANSCRIPT_CHARS = 8_000
+GRAPH_MAX_TRANSCRIPT_CHARS = 10_000
+
+STEPS = ("transcript", "quiz", "flashcards", "graph")
+
+_VIDEO_ID = r"[A-Za-z0-9_-]{11}"
+_URL_ID_RE = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)(" + _VIDEO_ID + r")")
+_JSON_ID_RE = re.compile(r'"(?:videoId|video_id)"\s*:\s*"(' + _VIDEO_ID + r')"')
+_BARE_ID_RE = re.compile(r"^\s*\"?(" + _VIDEO_ID + r")\"?\s*(?:[,;\t]|$)")
+
+
+def read_video_ids(paths: Iterable[str]) -> List[str]:
+    """
+    Collect video IDs from the given files, in order and without duplicates.
+    """
+    video_ids: List[str] = []
+    for path in paths:
+        text = Path(path).read_text(encoding="utf-8")
+        if path.endswith(".json"):
+            video_ids.extend(_JSON_ID_RE.findall(text))
+            continue
+        for line in text.splitlines():
+            match = _URL_ID_RE.search(line) or _BARE_ID_RE.match(line)
+            if match:
+                video_ids.append(match.group(1))
+    return list(dict.fromkeys(video_ids))
+
+
+@dataclass
+class VideoReport:
+    video_id: str
+    built: Dict[str, int] = field(default_factory=dict)
+    cached: Dict[str, int] = field(default_factory=dict)
+    failures: List[Tuple[str, str]] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def count(self, step: str, was_cached: bool) -> None:
+        target = self.cached if was_cached else self.built
+        target[step] = target.get(step, 0) + 1
+
+
+class Warmup:
+    """Runs the pipelines for many videos with bounded concurrency."""
+
+    def __init__(
+        self,
+        client: Together,
+        *,
+        concurrency: int = 4,
+        window_seconds: int = DEFAULT_WINDOW_SECONDS,
+        language_code: Optional[str] = None,
+        steps: Iterable[str] = STEPS,
+        all_windows: bool = False,
+    ) -> None:
+        self.client = client
+        self.concurrency = concurrency
+        self.window_seconds = window_seconds
+        self.language_code = language_code
+        self.steps = tuple(steps)
+        self.all_windows = all_windows
+
+    def _step(
+        self,
+        report: VideoReport,
+        step: str,
+        table: str,
+        params: Optional[dict],
+        build: Callable[[], object],
+    ) -> bool:
+        """Run one cached step unless its artifact exists; record the outcome."""
+        if get_store().get_bytes(table, report.video_id, params) is not None:
+            report.count(step, was_cached=True)
+            return True
+        try:
+            build()
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else f"{type(e).__name__}: {e}"
+            label = f"flashcards@{params['time_stamp']:g}s" if step == "flashcards" else step
+            report.failures.append((label, str(detail)))
+            return False
+        report.count(step, was_cached=False)
+        return True
+
+    def warm_video(self, video_id: str) -> VideoReport:
+        report = VideoReport(video_id)
+        start = time.monotonic()
+        client = self.client
+        language_code = self.language_code
+        # Warm-up never competes with users for YouTube fetches.
+        with fetch_priority(BACKGROUND):
+            # Everything else needs the transcript; stop early if it is unavailable.
+            if not self._step(report, "transcript", "transcripts", None,
+                              lambda: get_transcript(video_id, language_code)):
+                report.seconds = time.monotonic() - start
+                return report
+
+            if "quiz" in self.steps:
+                self._step(
+                    report, "quiz", "quizzes", quiz_cache_params(language_code, QUIZ_MAX_TRANSCRIPT_CHARS),
+                    lambda: generate_quiz_from_transcript(
+                        video_id, language_code=language_code,
+                        max_transcript_chars=QUIZ_MAX_TRANSCRIPT_CHARS, client=client,
+                    ),
+                )
+
+            if "flashcards" in self.steps:
+                # The route's default budget, so that warmed windows are the ones requested.
+                context_chars = default_context_chars()
+                for time_stamp in self._window_timestamps(video_id):
+                    self._step(
+                        report, "flashcards", "flashcards",
+                        multitype_cache_params(time_stamp, self.window_seconds, language_code, context_chars),
+                        lambda time_stamp=time_stamp: get_multitype_flashcards(
+                            video_id, time_stamp, self.window_seconds,
+                            language_code=language_code, client=client, context_chars=context_chars,
+                        ),
+                    )
+
+            if "graph" in self.steps:
+                self._step(
+                    report, "graph", "graphs", graph_cache_params(None, GRAPH_MAX_TRANSCRIPT_CHARS),
+                    lambda: build_video_graph(video_id, client=client, max_transcript_chars=GRAPH_MAX_TRANSCRIPT_CHARS),
+                )
+        report.seconds = time.monotonic() - start
+        return report
+
+    def _window_timestamps(self, video_id: str) -> List[float]:
+        """Time stamps to warm: the client's, or the start of every window with all_windows."""
+        transcript_index = get_transcript_index(video_id, self.language_code)
+        if not len(transcript_index):
+            return []
+        end_time = transcript_index.end_time
+        if not self.all_windows:
+            return [t for t in CLIENT_TIME_STAMPS if t <= end_time]
+        return [float(t) for t in range(0, int(end_time) + 1, self.window_seconds)]
+
+    def run(self, video_ids: List[str]) -> List[VideoReport]:
+        reports: List[VideoReport] = []
+        start = time.monotonic()
+        total = len(video_ids)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="warmup") as pool:
+            futures = {pool.submit(self.warm_video, video_id): video_id for video_id in video_ids}
+            for future in as_completed(futures):
+                report = future.result()
+                reports.append(report)
+                elapsed = time.monotonic() - start
+                built = sum(report.built.values())
+                cached = sum(report.cached.values())
+                status = "ok" if not report.failures else f"{len(report.failures)} failed"
+                print(
+                    f"[{len(reports)}/{total}] {report.video_id}: {built} built, {cached} cached, {status} "
+                    f"({report.seconds:.1f}s) | {len(reports) / elapsed * 60:.1f} videos/min",
+                    flush=True,
+                )
+        return reports
+
+
+def print_summary(reports: List[VideoReport], elapsed: float) -> None:
+    built = {step: sum(r.built.get(step, 0) for r in reports) for step in STEPS}
+    cached = {step: sum(r.cached.get(step, 0) for r in reports) for step in STEPS}
+    print(f"\nWarmed {len(reports)} videos in {elapsed:.1f}s")
+    for step in STEPS:
+        print(f"  {step:<11} built {built[step]:>5}  cached {cached[step]:>5}")
+    failed = [r for r in reports if r.failures]
+    if not failed:
+        print("No failures.")
+        return
+    print(f"\nFailures ({len(failed)} videos, rerun to retry only these):")
+    for report in failed:
+        for step, error in report.failures:
+            print(f"  {report.video_id}  {step:<16} {error}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="Files with video IDs, URLs or playlist exports")
+    parser.add_argument("--concurrency", type=int, default=4, help="Videos processed in parallel")
+    parser.add_argument("--window-seconds", type=int, default=DEFAULT_WINDOW_SECONDS,
+                        help="Flashcard window length (context_seconds)")
+    parser.add_argument("--all-windows", action="store_true",
+                        help="Warm flashcards for every window of each video, not only the time stamps the frontend requests")
+    parser.add_argument("--language-code", default=None)
+    parser.add_argument("--steps", nargs="+", choices=STEPS, default=list(STEPS),
+                        help="Artifacts to build (the transcript is always fetched)")
+    args = parser.parse_args()
+
+    video_ids = read_video_ids(args.sources)
+    if not video_ids:
+        parser.error("No video IDs found in the given files")
+    print(f"Warming {len(video_ids)} videos with concurrency {args.concurrency}", flush=True)
+
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+    warmup = Warmup(
+        Together(),
+        concurrency=args.concurrency,
+        window_seconds=args.window_seconds,
+        language_code=args.language_code,
+        steps=args.steps,
+        all_windows=args.all_windows,
+    )
+    start = time.monotonic()
+    reports = warmup.run(video_ids)
+    print_summary(reports, time.monotonic() - start)
+    sys.exit(1 if any(r.failures for r in reports) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,37 @@
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from together import Together
-from routes import transcript, quiz, flashcard, graph, buttons
+from helpers.cancellation import Cancelled, cancelled_handler
+from helpers.http_cache import DEFAULT_RESPONSE_CLASS
+from helpers.http_clients import close_http_clients, get_http_clients
+from helpers.jobs import shutdown_job_manager
+from helpers.logging_config import configure_logging
+from helpers.profiling import ProfilingMiddleware, profiling_enabled
+from routes import transcript, quiz, flashcard, graph, buttons, llm, jobs, metrics, profiles
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pooled, kept-alive connections to Together, YouTube and DuckDuckGo (see helpers.http_clients).
+    app.state.http_clients = get_http_clients()
+    yield
+    shutdown_job_manager()
+    quiz.shutdown_batch_pool()
+    close_http_clients()
+
+
+app = FastAPI(default_response_class=DEFAULT_RESPONSE_CLASS, lifespan=lifespan)
+# Generation cancelled because the client disconnected (see helpers.cancellation).
+app.add_exception_handler(Cancelled, cancelled_handler)
 
 load_dotenv(Path(__file__).resolve().parent / ".env")
+# All logging (ours and uvicorn's) is written from a background thread; see helpers.logging_config.
+configure_logging()
 
 
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
@@ -33,6 +55,11 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# Per-request profiling for requests with a valid X-Profile-Token (see helpers.profiling).
+# Not installed at all unless KNOWTUBE_PROFILE_TOKEN is set.
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
 # --- ROUTES ---
 @app.get("/")
 def read_root():
@@ -67,3 +94,7 @@ app.include_router(quiz.router)
 app.include_router(flashcard.router)
 app.include_router(graph.router)
 app.include_router(buttons.router)
+app.include_router(llm.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
+app.include_router(profiles.router)
@@ -1,6 +1,11 @@
+import logging
+
 from fastapi import APIRouter, HTTPException, responses
 from pydantic import BaseModel
-from pathlib import Path
+
+from helpers.storage import get_store
+
+logger = logging.getLogger(__name__)
 
 class ActionInput(BaseModel):
     id: int
@@ -9,24 +14,19 @@ class ActionInput(BaseModel):
 router = APIRouter()
 @router.get("/action/{item_id}")
 def read_file(item_id: int) -> str:
-    file_path = Path("actions") / f"{item_id}.txt"
+    text = get_store().get_button("actions", item_id)
 
-    if not file_path.exists():
+    if text is None:
         raise HTTPException(status_code=404, detail="File not found")
 
-    try:
-        return responses.PlainTextResponse(file_path.read_text(encoding="utf-8"))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return responses.PlainTextResponse(text)
 
 @router.post("/action")
 def write_file(payload: ActionInput):
-    print(f"Received payload: {payload}")
-    file_path = Path("actions") / f"{payload.id}.txt"
+    logger.info("Received action payload: %s %s", payload.id, payload.text)
 
     try:
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        file_path.write_text(payload.text, encoding="utf-8")
+        get_store().set_button("actions", payload.id, payload.text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -35,25 +35,20 @@ def write_file(payload: ActionInput):
 
 @router.get("/color/{item_id}")
 def read_file(item_id: int) -> str:
-    file_path = Path("colors") / f"{item_id}.txt"
+    text = get_store().get_button("colors", item_id)
 
-    if not file_path.exists():
+    if text is None:
         raise HTTPException(status_code=404, detail="File not found")
 
-    try:
-        return responses.PlainTextResponse(file_path.read_text(encoding="utf-8"))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return responses.PlainTextResponse(text)
 
 @router.post("/color")
 def write_file(payload: ActionInput):
-    print(f"Received payload: {payload}")
-    file_path = Path("colors") / f"{payload.id}.txt"
+    logger.info("Received color payload: %s %s", payload.id, payload.text)
 
     try:
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        file_path.write_text(payload.text, encoding="utf-8")
+        get_store().set_button("colors", payload.id, payload.text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    return {"status": "ok", "id": payload.id}
\ No newline at end of file
+    return {"status": "ok", "id": payload.id}
@@ -1,11 +1,18 @@
+import logging
 from typing import Optional, Any
-import json
-import os
 from fastapi import APIRouter, Request
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from helpers.flashcards.create_flashcard import generate_multitype_flashcards, generate_qa_flashcards
+from helpers.cancellation import run_cancellable
+from helpers.flashcards.create_flashcard import (
+    default_context_chars,
+    generate_qa_flashcards,
+    get_chapter_flashcards_bytes,
+    get_multitype_flashcards_bytes,
+)
+from helpers.http_cache import json_bytes_response
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 class QAFlashcardRequest(BaseModel):
@@ -18,10 +25,19 @@ class MultitypeFlashcardRequest(BaseModel):
     time_stamp: float = 0.0
     context_seconds: int = 30
     language_code: Optional[str] = None
+    # Text budget of the window; context_seconds then only bounds it (see select_budget_window).
+    # None: the server default, 0: sized by context_seconds alone.
+    context_chars: Optional[int] = Field(None, ge=0)
+
+class ChapterFlashcardRequest(BaseModel):
+    video_id: str
+    chapter: Optional[int] = None
+    time_stamp: float = 0.0
+    language_code: Optional[str] = None
 
 
 @router.post("/generate_qa_flashcards")
-def generate_qa_flashcards_api(
+async def generate_qa_flashcards_api(
     request: Request,
     body: QAFlashcardRequest
 ):
@@ -31,7 +47,9 @@ def generate_qa_flashcards_api(
     
     client = request.app.state.together_client
 
-    flashcards = generate_qa_flashcards(
+    flashcards = await run_cancellable(
+        request,
+        generate_qa_flashcards,
         body.quiz_questions_with_wrong_answers,
         body.video_id,
         language_code=body.language_code,
@@ -42,31 +60,59 @@ def generate_qa_flashcards_api(
 
 
 @router.post("/generate_multitype_flashcards")
-def generate_multitype_flashcards_api(
+async def generate_multitype_flashcards_api(
     request: Request,
     body: MultitypeFlashcardRequest
 ):
     """
     Generate a flashcard for a given quiz questions using Together's chat completions.
     """
-    print(f"Generating flashcards for video ID: {body.video_id} {body.time_stamp} {body.context_seconds} {body.language_code}")
-   
-    if os.path.exists(f"flashcards_{body.video_id}_{body.time_stamp}.json"):
-        with open(f"flashcards_{body.video_id}_{body.time_stamp}.json", "r") as f:
-            data = json.load(f)
-        return data
-     
+    logger.info(
+        "Generating flashcards for video ID: %s %s %s %s",
+        body.video_id, body.time_stamp, body.context_seconds, body.language_code,
+    )
+
     client = request.app.state.together_client
-    
-    flashcards = generate_multitype_flashcards(
+    context_chars = default_context_chars() if body.context_chars is None else body.context_chars or None
+
+    # Served from cache (as the stored bytes) when present; concurrent requests for the
+    # same window share one generation. Generation stops if the client disconnects.
+    payload = await run_cancellable(
+        request,
+        get_multitype_flashcards_bytes,
         body.video_id,
         body.time_stamp,
         body.context_seconds,
         language_code=body.language_code,
-        client=client
+        client=client,
+        context_chars=context_chars,
     )
+    return json_bytes_response(request, payload)
 
-    with open(f"flashcards_{body.video_id}_{body.time_stamp}.json", "w") as f:
-        json.dump({"flashcards": flashcards}, f, indent=4)
 
-    return {"flashcards": flashcards}
+@router.post("/generate_chapter_flashcards")
+async def generate_chapter_flashcards_api(
+    request: Request,
+    body: ChapterFlashcardRequest
+):
+    """
+    Generate multitype flashcards for one topical chapter of the video: the given
+    chapter index, or the chapter playing at time_stamp. See GET /transcript/chapters.
+    """
+    logger.info(
+        "Generating chapter flashcards for video ID: %s %s %s %s",
+        body.video_id, body.chapter, body.time_stamp, body.language_code,
+    )
+
+    client = request.app.state.together_client
+
+    payload = await run_cancellable(
+        request,
+        get_chapter_flashcards_bytes,
+        body.video_id,
+        body.chapter,
+        body.time_stamp,
+        language_code=body.language_code,
+        client=client
+    )
+    return json_bytes_response(request, payload)
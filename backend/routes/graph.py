@@ -1,10 +1,15 @@
+import logging
+from typing import Optional
+
 from fastapi import APIRouter, Query, Request, HTTPException
-from helpers.graph import transcript_to_item_descriptions
+from helpers.cancellation import Cancelled, run_cancellable
+from helpers.graph import build_video_graph, transcript_to_item_descriptions
+from helpers.http_cache import json_response
 from helpers.helpers import fetch_transcript
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
-MODEL = "openai/gpt-oss-120b"
 
 
 # @router.get("/graph/to-wikidata-item")
@@ -36,12 +41,13 @@ MODEL = "openai/gpt-oss-120b"
 
 
 @router.get("/graph/video-item-descriptions")
-def video_item_descriptions_endpoint(
+async def video_item_descriptions_endpoint(
     request: Request,
     video_id: str = Query(..., description="YouTube video ID to extract transcript from"),
-    model: str = Query(MODEL, description="Together model to use"),
+    model: Optional[str] = Query(None, description="Together model to use (default: routed per task)"),
     temperature: float = Query(0.7, ge=0.0, le=1.0, description="Sampling temperature (0.0-1.0)"),
-    max_transcript_chars: int = Query(10000, ge=100, description="Maximum characters from transcript to process")
+    max_transcript_chars: int = Query(10000, ge=100, description="Maximum characters from transcript to process"),
+    chapter: Optional[int] = Query(None, ge=0, description="Only this chapter of the video (see /transcript/chapters)")
 ):
     """
     Extract a list of items/topics/concepts from a YouTube video transcript.
@@ -49,49 +55,41 @@ def video_item_descriptions_endpoint(
     
     Args:
         video_id: YouTube video ID
-        model: The Together model to use
+        model: The Together model to use (default: chosen by helpers.routing)
         temperature: Sampling temperature (default: 0.7)
         max_transcript_chars: Maximum characters from transcript to send (default: 10000)
+        chapter: Optional chapter index; the graph then covers (and is cached for) that chapter only
     
     Returns:
         List of strings, where each string is a 10-15 word description of an item/topic/concept
     """
-    print(f"[DEBUG] video-item-descriptions: Starting with video_id={video_id}, model={model}, temperature={temperature}")
+    logger.info("video-item-descriptions: Starting with video_id=%s, model=%s, temperature=%s", video_id, model, temperature)
     client = request.app.state.together_client
-    print(f"[DEBUG] Got together_client: {client is not None}")
     
-    # Fetch transcript
-    print(f"[DEBUG] Fetching transcript for video_id: {video_id}")
-    # fetched_transcript = fetch_transcript(video_id)
-    # print(f"[DEBUG] Fetched {len(fetched_transcript)} transcript snippets")
-
-    # # Convert to raw text
-    # text_parts = [snippet.text for snippet in fetched_transcript]
-    # transcript_text = " ".join(text_parts)
-    # print(f"[DEBUG] Transcript text length: {len(transcript_text)} characters")
-    # print(f"[DEBUG] Transcript preview (first 200 chars): {transcript_text[:200]}")
-    transcript_text = "dsuahdiuashidajshosdjsaoidjasoidjoasda"
     try:
-        print(f"[DEBUG] Calling transcript_to_item_descriptions with model={model}, temperature={temperature}, max_transcript_chars={max_transcript_chars}")
-        items = transcript_to_item_descriptions(
-            transcript_text,
+        # Queued decompositions and link searches are dropped if the client disconnects.
+        items = await run_cancellable(
+            request,
+            build_video_graph,
+            video_id,
             client=client,
             model=model,
             temperature=temperature,
-            max_transcript_chars=max_transcript_chars
+            max_transcript_chars=max_transcript_chars,
+            chapter=chapter
         )
-        print(f"[DEBUG] Got {len(items)} items from transcript_to_item_descriptions")
-        print(f"[DEBUG] Items: {items}")
+        logger.info("Got %d items from build_video_graph", len(items))
+        logger.debug("Items: %s", items)
         
-        return {
+        return json_response(request, {
             "video_id": video_id,
             "count": len(items),
             "items": items
-        }
+        })
+    except (HTTPException, Cancelled):
+        raise
     except Exception as e:
-        print(f"[DEBUG] ERROR in video-item-descriptions: {type(e).__name__}: {str(e)}")
-        import traceback
-        print(f"[DEBUG] Traceback: {traceback.format_exc()}")
+        logger.exception(f"ERROR in video-item-descriptions: {type(e).__name__}: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Error extracting items from transcript: {str(e)}"
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from helpers.jobs import TERMINAL_STATUSES, get_job_manager
+from helpers.storage import get_store
+
+router = APIRouter()
+
+# How often the SSE stream polls the store for new events (seconds).
+EVENT_POLL_INTERVAL = 0.5
+# How often a stream without new events checks that the job's worker is still alive.
+ORPHAN_CHECK_INTERVAL = 10.0
+
+
+class GraphJobRequest(BaseModel):
+    video_id: str
+    model: Optional[str] = None
+    temperature: float = Field(0.7, ge=0.0, le=1.0)
+    max_transcript_chars: int = Field(10000, ge=100)
+
+
+class QuizJobRequest(BaseModel):
+    video_id: str
+    difficulty_level: str = "medium"
+    temperature: float = Field(0.3, ge=0.0, le=1.0)
+    language_code: Optional[str] = None
+
+
+def _submit(request: Request, kind: str, params: dict):
+    client = request.app.state.together_client
+    job, created = get_job_manager().submit(kind, params, client)
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job["id"], "status": job["status"], "attached": not created},
+        headers={"Location": f"/jobs/{job['id']}"},
+    )
+
+
+@router.post("/jobs/graph")
+def submit_graph_job(request: Request, body: GraphJobRequest):
+    """
+    Queue a concept graph build (see /graph/video-item-descriptions) and return its job ID.
+    """
+    return _submit(request, "graph", body.model_dump())
+
+
+@router.post("/jobs/quiz")
+def submit_quiz_job(request: Request, body: QuizJobRequest):
+    """
+    Queue a quiz generation (see /quiz) and return its job ID.
+    """
+    return _submit(request, "quiz", body.model_dump())
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Current status, progress and (once finished) result or error of a job.
+    """
+    job = get_job_manager().get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(
+    request: Request,
+    job_id: str,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Server-sent progress events for a job.
+
+    Reconnecting clients send Last-Event-ID (browsers do this automatically) and only
+    receive the events they missed. The stream ends after the succeeded/failed event
+    (a job whose worker died is failed, see helpers.jobs) or when the job expires.
+    """
+    store = get_store()
+    manager = get_job_manager()
+    if await run_in_threadpool(manager.get_job, job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    after_seq = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+
+    async def stream():
+        nonlocal after_seq
+        checked = time.monotonic()
+        while not await request.is_disconnected():
+            events = await run_in_threadpool(store.job_events, job_id, after_seq)
+            for event in events:
+                after_seq = event["seq"]
+                yield f"id: {event['seq']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+                if event["data"]["status"] in TERMINAL_STATUSES:
+                    return
+            if events:
+                checked = time.monotonic()
+            elif time.monotonic() - checked >= ORPHAN_CHECK_INTERVAL:
+                checked = time.monotonic()
+                # Fails the job (the failed event follows on the next poll) if its worker died.
+                if await run_in_threadpool(manager.get_job, job_id) is None:
+                    return
+            await asyncio.sleep(EVENT_POLL_INTERVAL)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+
+from helpers.llm import stats_snapshot
+from helpers.routing import flush_routing_log
+from helpers.storage import get_store
+
+router = APIRouter()
+
+
+@router.get("/llm/stats")
+def get_llm_stats():
+    """
+    Live per-model latency / breaker state and the recorded routing outcomes per task.
+    """
+    flush_routing_log()
+    return {
+        "models": stats_snapshot(),
+        "routing": get_store().routing_summary(),
+    }
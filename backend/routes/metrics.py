@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+
+from helpers.metrics import collect
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+def get_metrics():
+    """
+    Operational metrics of this worker process (queue depths, wait times, ...).
+    """
+    return collect()
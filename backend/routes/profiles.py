@@ -0,0 +1,43 @@
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+
+from helpers.profiling import find_profile, list_profiles, profiling_enabled, token_matches
+
+router = APIRouter()
+
+
+def _check_token(token: Optional[str]) -> None:
+    # Without KNOWTUBE_PROFILE_TOKEN profiling does not exist, as far as clients can tell.
+    if not profiling_enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token_matches(token):
+        raise HTTPException(status_code=403, detail="Invalid profile token.")
+
+
+@router.get("/profiles")
+def get_profiles(
+    video_id: Optional[str] = Query(None),
+    x_profile_token: Optional[str] = Header(None),
+):
+    """
+    Stored request profiles of a video (of requests without a video_id if omitted), newest first.
+    """
+    _check_token(x_profile_token)
+    return {"video_id": video_id, "profiles": list_profiles(video_id)}
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(
+    profile_id: str,
+    video_id: Optional[str] = Query(None),
+    x_profile_token: Optional[str] = Header(None),
+):
+    """
+    One stored request profile: upstream wait/busy times, top functions and collapsed stacks.
+    """
+    _check_token(x_profile_token)
+    profile = find_profile(profile_id, video_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return profile
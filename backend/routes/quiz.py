@@ -1,19 +1,43 @@
-from typing import Optional
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional
 
 from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
-from helpers.helpers import fetch_transcript
-from helpers.quiz.create_quiz import generate_quiz_from_transcript
-import json
+from helpers.cancellation import CancellationToken, cancellation_scope, run_cancellable
+from helpers.fetch_scheduler import BACKGROUND, fetch_priority
+from helpers.http_cache import json_response
+from helpers.quiz.create_quiz import DEFAULT_MAX_TRANSCRIPT_CHARS, generate_quiz_from_transcript, quiz_cache_params
+from helpers.storage import get_store
 
 
 router = APIRouter()
 
 
+# Upper bound on concurrently generated videos per batch request.
+BATCH_MAX_WORKERS = 8
+# Generations of all batch requests share this pool instead of the request threadpool,
+# so batches cannot starve /transcript and the button routes of threads.
+BATCH_POOL_WORKERS = int(os.getenv("KNOWTUBE_QUIZ_BATCH_WORKERS", "4"))
+_batch_pool = ThreadPoolExecutor(max_workers=BATCH_POOL_WORKERS, thread_name_prefix="quiz-batch")
+
+
+class QuizBatchRequest(BaseModel):
+    video_ids: List[str] = Field(..., min_length=1, description="YouTube video IDs to generate quizzes for")
+    difficulty_levels: List[str] = Field(["medium"], min_length=1, description="Difficulty levels to return for each video")
+    temperature: float = Field(0.3, ge=0.0, le=1.0)
+    language_code: Optional[str] = None
+    max_workers: int = Field(4, ge=1, le=BATCH_MAX_WORKERS, description="Videos generated in parallel")
 
 
 @router.get("/quiz")
-def get_quiz(
+async def get_quiz(
     request: Request,
     video_id: str = Query(..., description="YouTube video ID (e.g., 'dQw4w9WgXcQ')"),
     difficulty_level: str = Query(
@@ -26,9 +50,11 @@ def get_quiz(
         le=1.0,
         description="Sampling temperature for Together completions.",
     ),
+    chapter: Optional[int] = Query(None, ge=0, description="Quiz only this chapter (see /transcript/chapters)"),
 ):
     """
     Generate a quiz for a given YouTube video transcript using Together's chat completions.
+    With `chapter`, the quiz covers (and is cached for) that chapter only.
     """
     
     client = request.app.state.together_client
@@ -36,12 +62,99 @@ def get_quiz(
     # fetched_transcript = fetch_transcript(video_id)
     # transcript_payload = fetched_transcript.to_raw_data()
         
-    quiz = generate_quiz_from_transcript(
+    # Stops (and caches nothing incomplete) if the client disconnects meanwhile.
+    quiz = await run_cancellable(
+        request,
+        generate_quiz_from_transcript,
         video_id=video_id,
         temperature=temperature,
         difficulty_level=difficulty_level,
+        chapter=chapter,
         client=client,
     )
 
 
-    return {"quiz": quiz}
+    return json_response(request, {"quiz": quiz})
+
+
+def _batch_quiz(token: CancellationToken, **kwargs) -> list:
+    # Batch work: transcript fetches yield to interactive requests.
+    with cancellation_scope(token), fetch_priority(BACKGROUND):
+        return generate_quiz_from_transcript(**kwargs)
+
+
+def shutdown_batch_pool() -> None:
+    """Drop queued batch generations (called at app shutdown)."""
+    _batch_pool.shutdown(wait=False, cancel_futures=True)
+
+
+@router.post("/quiz/batch")
+async def get_quiz_batch(request: Request, body: QuizBatchRequest):
+    """
+    Generate quizzes for many videos concurrently, streamed as NDJSON.
+
+    Each line is either {"video_id", "difficulty_level", "quiz"} or
+    {"video_id", "difficulty_level", "error", "status_code"}, written as soon as it is
+    ready. Videos whose quiz bank is already cached are answered immediately; the others
+    are generated in a pool shared by all batch requests (KNOWTUBE_QUIZ_BATCH_WORKERS).
+    Generations stop when the client goes away.
+    """
+    client = request.app.state.together_client
+    semaphore = asyncio.Semaphore(body.max_workers)
+    lines: asyncio.Queue = asyncio.Queue()
+    video_ids = list(dict.fromkeys(body.video_ids))
+    token = CancellationToken()
+    loop = asyncio.get_running_loop()
+
+    async def run_levels(video_id: str, cached: bool) -> None:
+        # The first level generates (and caches) the whole bank; the others are cache hits.
+        for difficulty_level in body.difficulty_levels:
+            line = {"video_id": video_id, "difficulty_level": difficulty_level}
+            run = partial(
+                _batch_quiz,
+                token,
+                video_id=video_id,
+                language_code=body.language_code,
+                temperature=body.temperature,
+                difficulty_level=difficulty_level,
+                client=client,
+            )
+            try:
+                if cached:
+                    # A cache hit (or, if it was evicted meanwhile, an admission controlled miss).
+                    line["quiz"] = await run_in_threadpool(run)
+                else:
+                    # The pool bounds these generations, so they skip admission.
+                    line["quiz"] = await loop.run_in_executor(_batch_pool, partial(run, admission_route=None))
+            except HTTPException as e:
+                line.update(error=e.detail, status_code=e.status_code)
+            except Exception as e:
+                line.update(error=str(e), status_code=500)
+            await lines.put(line)
+            if "error" in line:
+                break
+
+    async def run_video(video_id: str) -> None:
+        # Cached banks do not wait behind the generations for a worker slot.
+        params = quiz_cache_params(body.language_code, DEFAULT_MAX_TRANSCRIPT_CHARS)
+        if await get_store().aget_bytes("quizzes", video_id, params) is not None:
+            await run_levels(video_id, cached=True)
+            return
+        async with semaphore:
+            await run_levels(video_id, cached=False)
+
+    async def produce() -> None:
+        await asyncio.gather(*(run_video(video_id) for video_id in video_ids))
+        await lines.put(None)
+
+    async def stream():
+        producer = asyncio.create_task(produce())
+        try:
+            while (line := await lines.get()) is not None:
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away or we are done: stop generations in flight, drop queued ones.
+            token.cancel("batch stream closed")
+            producer.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -1,40 +1,76 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query, Request
 from typing import Optional
-from helpers.helpers import fetch_transcript
+from helpers.http_cache import json_bytes_response, json_response
+from helpers.transcripts import (
+    get_transcript as get_cached_transcript,
+    get_transcript_bytes,
+    get_transcript_chapters,
+    get_transcript_index,
+    transcript_metadata,
+)
 
 router = APIRouter()
 
 
+# Upper bound on segments returned per page when paginating with `limit`.
+MAX_PAGE_SEGMENTS = 2000
+
+
 @router.get("/transcript")
 def get_transcript(
+    request: Request,
     video_id: str = Query(..., description="YouTube video ID (e.g., 'dQw4w9WgXcQ')"),
-    language_code: Optional[str] = Query(None, description="Language code (e.g., 'en', 'es'). Defaults to English if not provided.")
+    language_code: Optional[str] = Query(None, description="Language code (e.g., 'en', 'es'). Defaults to English if not provided."),
+    start: Optional[float] = Query(None, ge=0, description="Only segments overlapping this time onward (seconds)"),
+    end: Optional[float] = Query(None, ge=0, description="Only segments starting at or before this time (seconds)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SEGMENTS, description="Maximum number of segments per page"),
 ):
     """
     Fetch transcript for a YouTube video.
     example: http://localhost:5173/api/transcript?video_id=RBmOgQi4Fr0
+    example: http://localhost:5173/api/transcript?video_id=RBmOgQi4Fr0&start=120&end=300&limit=50
     
     Args:
         video_id: YouTube video ID (extract from URL: youtube.com/watch?v=VIDEO_ID)
         language_code: Optional language code. If not provided, defaults to English.
+        start: Optional start of the time range in seconds.
+        end: Optional end of the time range in seconds.
+        cursor: Opaque cursor returned as next_cursor by the previous page.
+        limit: Optional page size in segments.
     
     Returns:
         Object containing the transcript data with text, start time, and duration for each segment,
-        along with video metadata (language, language_code, is_generated).
+        along with video metadata (language, language_code, is_generated). When a time range,
+        cursor or limit is given, only the selected segments (with whitespace-normalized text,
+        without chapters) are returned together with next_cursor (null on the last page).
+        Responses carry an ETag and are compressed (brotli/gzip) when the client accepts it.
     """
-    fetched_transcript = fetch_transcript(video_id, language_code)
-    
-    # Convert to raw data format (list of dictionaries)
-    transcript_data = fetched_transcript.to_raw_data()
-    
-    return {
-        "video_id": fetched_transcript.video_id,
-        "language": fetched_transcript.language,
-        "language_code": fetched_transcript.language_code,
-        "is_generated": fetched_transcript.is_generated,
-        "transcript": transcript_data,
-        "total_segments": len(fetched_transcript)
-    }
+    if start is None and end is None and cursor is None and limit is None:
+        # The stored bytes are the response body; no decode / re-encode round trip.
+        return json_bytes_response(request, get_transcript_bytes(video_id, language_code))
+
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    transcript_index = get_transcript_index(video_id, language_code)
+    first, range_stop = transcript_index.segment_range(start, end)
+    stop = range_stop
+    if cursor is not None:
+        if not cursor.isdigit():
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+        first = max(first, int(cursor))
+    if limit is not None:
+        stop = min(stop, first + limit)
+    first = min(first, stop)
+
+    # Pages come from the shared in-memory index; the stored transcript is not decoded.
+    metadata = transcript_index.metadata
+    if metadata is None:
+        metadata = transcript_metadata(get_cached_transcript(video_id, language_code))
+    page = dict(metadata)
+    page["transcript"] = [dict(segment) for segment in transcript_index[first:stop]]
+    page["next_cursor"] = str(stop) if stop < range_stop else None
+    return json_response(request, page)
 
 
 @router.get("/transcript/raw")
@@ -53,11 +89,28 @@ def get_transcript_raw(
     Returns:
         A long string containing all transcript text concatenated together.
     """
-    fetched_transcript = fetch_transcript(video_id, language_code)
-    
-    # Concatenate all text snippets into a single string
-    text_parts = [snippet.text for snippet in fetched_transcript]
-    full_text = " ".join(text_parts)
-    
-    return {"text": full_text}
+    # Joined and whitespace-normalized once at ingest, see helpers.transcript_index
+    return {"text": get_transcript_index(video_id, language_code).text}
+
+
 
+@router.get("/transcript/chapters")
+def get_transcript_chapters_api(
+    request: Request,
+    video_id: str = Query(..., description="YouTube video ID (e.g., 'dQw4w9WgXcQ')"),
+    language_code: Optional[str] = Query(None, description="Language code (e.g., 'en', 'es'). Defaults to English if not provided.")
+):
+    """
+    Topical chapters of a video's transcript, found by lexical cohesion (TextTiling) at ingest.
+    example: http://localhost:5173/api/transcript/chapters?video_id=RBmOgQi4Fr0
+
+    Args:
+        video_id: YouTube video ID (extract from URL: youtube.com/watch?v=VIDEO_ID)
+        language_code: Optional language code. If not provided, defaults to English.
+
+    Returns:
+        {"video_id", "chapters"} where each chapter has index, start and end (seconds),
+        the half-open segment range [first_segment, stop_segment) and its top keywords.
+        Flashcards, quizzes and graphs accept the chapter index.
+    """
+    return json_response(request, {"video_id": video_id, "chapters": get_transcript_chapters(video_id, language_code)})
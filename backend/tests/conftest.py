@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Keep the tests away from the development database (backend/artifacts.db).
+os.environ.setdefault("KNOWTUBE_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="knowtube-tests-"), "artifacts.db"))
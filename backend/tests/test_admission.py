@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from helpers.admission import Admission, RouteLimit, parse_route_limits
+from helpers.cancellation import Cancelled, CancellationToken, cancellation_scope
+
+
+def _limits(concurrency=1, queue=1, max_wait=10.0, initial_latency=1.0):
+    return {"quiz": RouteLimit(concurrency=concurrency, queue=queue, max_wait=max_wait, initial_latency=initial_latency)}
+
+
+def _hold(admission: Admission, route: str = "quiz") -> threading.Event:
+    """Hold one of the route's slots (as a request) until the returned event is set."""
+    release = threading.Event()
+    holding = threading.Event()
+
+    def holder() -> None:
+        with cancellation_scope(CancellationToken()), admission.slot(route):
+            holding.set()
+            release.wait(5)
+
+    threading.Thread(target=holder, daemon=True).start()
+    assert holding.wait(5)
+    return release
+
+
+def _queue(admission: Admission, route: str = "quiz") -> threading.Thread:
+    """Start a request that waits in the route's queue."""
+
+    def waiter() -> None:
+        with cancellation_scope(CancellationToken()), admission.slot(route):
+            pass
+
+    thread = threading.Thread(target=waiter, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while admission.snapshot()["routes"][route]["queued"] == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    return thread
+
+
+def test_full_queue_is_refused_with_503_and_retry_after():
+    admission = Admission(_limits(queue=1, initial_latency=3.0))
+    release = _hold(admission)
+    waiter = _queue(admission)
+
+    with cancellation_scope(CancellationToken()), pytest.raises(HTTPException) as refused:
+        with admission.slot("quiz"):
+            pytest.fail("admitted past a full queue")
+    assert refused.value.status_code == 503
+    # Two requests ahead at 3 s each, one at a time.
+    assert refused.value.headers["Retry-After"] == "6"
+
+    release.set()
+    waiter.join(5)
+    routes = admission.snapshot()["routes"]["quiz"]
+    assert (routes["admitted"], routes["rejected"], routes["in_flight"]) == (2, 1, 0)
+
+
+def test_expected_wait_over_max_wait_is_refused():
+    admission = Admission(_limits(queue=10, max_wait=5.0, initial_latency=10.0))
+    release = _hold(admission)
+    with cancellation_scope(CancellationToken()), pytest.raises(HTTPException) as refused:
+        with admission.slot("quiz"):
+            pass
+    assert refused.value.status_code == 503
+    release.set()
+
+
+def test_queued_request_times_out_after_max_wait():
+    admission = Admission(_limits(queue=4, max_wait=0.3, initial_latency=0.1))
+    release = _hold(admission)
+    started = time.monotonic()
+    with cancellation_scope(CancellationToken()), pytest.raises(HTTPException) as refused:
+        with admission.slot("quiz"):
+            pass
+    assert refused.value.status_code == 503
+    assert 0.3 <= time.monotonic() - started < 2.0
+    snapshot = admission.snapshot()
+    assert snapshot["routes"]["quiz"]["timed_out"] == 1
+    assert snapshot["routes"]["quiz"]["queued"] == 0
+    release.set()
+
+
+def test_cancelled_request_leaves_the_queue():
+    admission = Admission(_limits(queue=4))
+    release = _hold(admission)
+    token = CancellationToken()
+    raised = []
+
+    def waiter() -> None:
+        with cancellation_scope(token):
+            try:
+                with admission.slot("quiz"):
+                    pass
+            except Cancelled as exc:
+                raised.append(exc)
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.05)
+    token.cancel()
+    thread.join(2)
+    assert raised and admission.snapshot()["routes"]["quiz"]["queued"] == 0
+    release.set()
+
+
+def test_overall_request_limit_sheds_every_route():
+    admission = Admission({**_limits(concurrency=4, queue=4), "graph": RouteLimit(4, 4, 10.0, 1.0)}, request_limit=1)
+    release = _hold(admission, "quiz")
+    with cancellation_scope(CancellationToken()), pytest.raises(HTTPException) as refused:
+        with admission.slot("graph"):
+            pass
+    assert refused.value.status_code == 503
+    assert admission.snapshot()["busy_rejected"] == 1
+    release.set()
+
+
+def test_background_work_is_not_admission_controlled():
+    admission = Admission(_limits(queue=0), request_limit=0)
+    with admission.slot("quiz"):
+        pass
+    assert admission.snapshot()["routes"]["quiz"]["admitted"] == 0
+
+
+def test_parse_route_limits_overrides_fields():
+    limits = parse_route_limits("quiz=2/3/4.5", _limits(concurrency=8, queue=16))
+    assert limits["quiz"] == RouteLimit(concurrency=2, queue=3, max_wait=4.5, initial_latency=1.0)
+    with pytest.raises(ValueError):
+        parse_route_limits("graph=1", _limits())
@@ -0,0 +1,80 @@
+import pytest
+
+from helpers.flashcards.create_flashcard import (
+    BUDGET_MAX_SECONDS_FACTOR,
+    BUDGET_MIN_SECONDS_FACTOR,
+    select_budget_window,
+    select_context_window,
+)
+from helpers.transcript_index import TranscriptIndex
+
+SEGMENT_SECONDS = 2.0
+
+
+def _index(count: int = 100) -> TranscriptIndex:
+    # Ten characters per segment, one segment every two seconds.
+    return TranscriptIndex.from_segments(
+        [{"text": f"s{i:03d}-text", "start": i * SEGMENT_SECONDS, "duration": SEGMENT_SECONDS} for i in range(count)]
+    )
+
+
+def _span(window) -> float:
+    return window[-1]["start"] + window[-1]["duration"] - window[0]["start"]
+
+
+def _chars(window) -> int:
+    return len(" ".join(segment["text"] for segment in window))
+
+
+@pytest.mark.parametrize("max_chars", [10, 32, 55, 200])
+def test_window_fills_the_budget_and_ends_at_the_timestamp(max_chars):
+    window = select_budget_window(_index(), 101.0, max_chars)
+    assert window[-1]["start"] == 100.0
+    assert _chars(window) <= max_chars
+    # One more segment would not fit.
+    assert _chars(window) + 11 > max_chars
+
+
+def test_target_segment_is_kept_over_budget():
+    window = select_budget_window(_index(), 101.0, 0)
+    assert [segment["start"] for segment in window] == [100.0]
+
+
+def test_min_seconds_extends_the_window_over_budget():
+    window = select_budget_window(_index(), 101.0, 10, min_seconds=20.0)
+    assert _span(window) >= 20.0
+    assert window[-1]["start"] == 100.0
+
+
+def test_max_seconds_caps_the_window():
+    window = select_budget_window(_index(), 101.0, 10_000, max_seconds=30.0)
+    assert _span(window) <= 30.0
+    assert _span(window) > 30.0 - SEGMENT_SECONDS
+
+
+def test_window_before_the_video_starts_runs_forward():
+    index = _index()
+    assert select_budget_window(index, -5.0, 32)[0]["start"] == 0.0
+    assert _chars(select_budget_window(index, -5.0, 32)) <= 32
+    assert _span(select_budget_window(index, 0.0, 10_000, max_seconds=30.0)) <= 30.0
+    assert _span(select_budget_window(index, 0.0, 10, min_seconds=20.0)) >= 20.0
+
+
+def test_timestamp_in_a_caption_gap_ends_with_the_next_caption():
+    index = TranscriptIndex.from_segments(
+        [{"text": "first", "start": 0.0, "duration": 2.0}, {"text": "second", "start": 10.0, "duration": 2.0}]
+    )
+    assert [segment["text"] for segment in select_budget_window(index, 5.0, 100)] == ["first", "second"]
+
+
+def test_empty_transcript():
+    assert select_budget_window(TranscriptIndex.from_segments([]), 10.0, 100) == []
+
+
+def test_context_window_keeps_the_budget_within_the_seconds_bounds():
+    index = _index()
+    context_seconds = 20
+    small = select_context_window(index, 101.0, context_seconds, context_chars=1)
+    large = select_context_window(index, 101.0, context_seconds, context_chars=10_000)
+    assert _span(small) >= context_seconds * BUDGET_MIN_SECONDS_FACTOR
+    assert _span(large) <= context_seconds * BUDGET_MAX_SECONDS_FACTOR
@@ -0,0 +1,25 @@
+from helpers.compaction import compact_segments, compact_text
+
+
+def _segments(*texts):
+    return [{"text": text} for text in texts]
+
+
+def test_rolling_caption_overlap_is_removed():
+    text = compact_segments(_segments("today we will look at", "look at the derivative of", "the derivative of x squared"))
+    assert text == "today we will look at the derivative of x squared"
+
+
+def test_single_word_repeated_across_a_caption_boundary_is_kept():
+    assert compact_segments(_segments("this is the", "the reason it works"), drop_fillers=False) == (
+        "this is the the reason it works"
+    )
+    assert compact_segments(_segments("we add one", "one more time")) == "we add one one more time"
+
+
+def test_cues_and_fillers_are_dropped_but_brackets_in_content_are_kept():
+    assert compact_text("[Music] so um f(x) is a[i] (laughs) >> right") == "so f(x) is a[i] right"
+
+
+def test_repeated_phrases_collapse_but_single_words_do_not():
+    assert compact_text("so we so we start that that way") == "so we start that that way"
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from helpers.fetch_scheduler import BACKGROUND, INTERACTIVE, FetchScheduler, SchedulerTimeout
+from helpers.rate_limit import RATE_LIMITS, RateLimit, penalize, reserve
+
+
+@pytest.fixture
+def upstream(monkeypatch, request):
+    # A fresh shared bucket per test: 10 requests per second, one at a time.
+    name = f"test-{request.node.name}"
+    monkeypatch.setitem(RATE_LIMITS, name, RateLimit(rate=10.0, burst=1.0))
+    return name
+
+
+def test_penalized_budget_times_out_interactive_fetch_without_waiting(upstream):
+    scheduler = FetchScheduler(upstream)
+    # Another worker was blocked: the shared budget is withheld for 60 s.
+    penalize(upstream, 60.0)
+    started = time.monotonic()
+    with pytest.raises(SchedulerTimeout) as timeout:
+        with scheduler.slot(INTERACTIVE, max_wait=0.5):
+            pytest.fail("fetched while the budget is withheld")
+    assert time.monotonic() - started < 0.5
+    assert timeout.value.retry_after > 50
+    assert scheduler.snapshot()["classes"]["interactive"]["timeouts"] == 1
+
+
+def test_refused_reservation_leaves_the_budget_untouched(upstream):
+    scheduler = FetchScheduler(upstream)
+    penalize(upstream, 1.0)
+    with pytest.raises(SchedulerTimeout):
+        with scheduler.slot(INTERACTIVE, max_wait=0.1):
+            pass
+    # The penalty (0.9 s after the burst) and this request are owed, not the refused fetch.
+    assert reserve(upstream, max_wait=0.0) == pytest.approx(1.0, abs=0.05)
+
+
+def test_reservation_within_the_deadline_is_waited_out(upstream):
+    scheduler = FetchScheduler(upstream)
+    penalize(upstream, 0.3)
+    started = time.monotonic()
+    with scheduler.slot(INTERACTIVE, max_wait=2.0):
+        pass
+    assert 0.3 <= time.monotonic() - started < 1.0
+
+
+def test_waiting_caller_does_not_hold_up_the_queue(upstream):
+    scheduler = FetchScheduler(upstream)
+    penalize(upstream, 0.5)
+    background_entered = threading.Event()
+
+    def background_fetch() -> None:
+        with scheduler.slot(BACKGROUND):
+            background_entered.set()
+
+    thread = threading.Thread(target=background_fetch)
+    thread.start()
+    time.sleep(0.05)
+    # The background fetch sleeps out its reservation; an interactive fetch with too
+    # short a deadline is told so at once instead of queueing behind that sleep.
+    started = time.monotonic()
+    with pytest.raises(SchedulerTimeout):
+        with scheduler.slot(INTERACTIVE, max_wait=0.2):
+            pass
+    assert time.monotonic() - started < 0.2
+    thread.join(5)
+    assert background_entered.is_set()
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from helpers.cancellation import Cancelled, CancellationToken, cancellation_scope
+from helpers.governor import CANCEL_POLL_SECONDS, Governor
+
+
+def _hold(governor: Governor, name: str) -> threading.Event:
+    """Occupy one slot of `name` until the returned event is set."""
+    release = threading.Event()
+    holding = threading.Event()
+
+    def blocker() -> None:
+        holding.set()
+        release.wait(5)
+
+    governor.submit(name, blocker)
+    assert holding.wait(5)
+    return release
+
+
+def test_waiting_flows_are_served_round_robin():
+    governor = Governor({"x": 1}, workers=2)
+    release = _hold(governor, "x")
+    order = []
+    futures = []
+    first, second = CancellationToken(), CancellationToken()
+    with cancellation_scope(first):
+        futures += [governor.submit("x", order.append, f"a{i}") for i in range(3)]
+    with cancellation_scope(second):
+        futures.append(governor.submit("x", order.append, "b0"))
+
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert order == ["a0", "b0", "a1", "a2"]
+
+
+def test_limit_is_never_exceeded():
+    governor = Governor({"x": 2}, workers=4)
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def task() -> None:
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.pop()
+
+    futures = [governor.submit("x", task) for _ in range(10)]
+    for future in futures:
+        future.result(timeout=5)
+    assert max(peak) == 2
+    assert governor.snapshot()["x"]["peak_in_flight"] == 2
+
+
+def test_cancelled_task_never_runs_and_frees_its_place():
+    governor = Governor({"x": 1}, workers=2)
+    release = _hold(governor, "x")
+    ran = []
+    dropped = governor.submit("x", ran.append, "dropped")
+    kept = governor.submit("x", ran.append, "kept")
+    assert dropped.cancel()
+    assert governor.snapshot()["x"]["queued"] == 1
+
+    release.set()
+    kept.result(timeout=5)
+    assert ran == ["kept"]
+    assert governor.snapshot()["x"]["dropped"] == 1
+
+
+def test_cancelled_slot_waiter_leaves_the_queue():
+    governor = Governor({"x": 1}, workers=2)
+    release = _hold(governor, "x")
+    token = CancellationToken()
+    raised = []
+
+    def wait_for_slot() -> None:
+        with cancellation_scope(token):
+            try:
+                with governor.slot("x"):
+                    raised.append(None)
+            except Cancelled as exc:
+                raised.append(exc)
+
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    time.sleep(0.05)
+    token.cancel("client went away")
+    waiter.join(CANCEL_POLL_SECONDS * 4)
+    assert not waiter.is_alive()
+    assert isinstance(raised[0], Cancelled)
+    assert governor.snapshot()["x"]["queued"] == 0
+
+    release.set()
+    # The slot is free again for the next caller.
+    assert governor.submit("x", lambda: "ok").result(timeout=5) == "ok"
+
+
+def test_slot_is_reentrant_within_a_thread():
+    governor = Governor({"x": 1}, workers=1)
+    with governor.slot("x"):
+        with governor.slot("x"):
+            pass
+    assert governor.snapshot()["x"]["in_flight"] == 0
+
+
+def test_cancelled_request_does_not_start_its_block():
+    governor = Governor({"x": 1}, workers=1)
+    token = CancellationToken()
+    token.cancel()
+    with cancellation_scope(token), pytest.raises(Cancelled):
+        with governor.slot("x"):
+            pytest.fail("block ran for a cancelled request")
+    assert governor.snapshot()["x"]["in_flight"] == 0
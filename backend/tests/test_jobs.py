@@ -0,0 +1,77 @@
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from helpers import jobs
+from helpers.storage import get_store, params_key
+
+
+@pytest.fixture
+def dead_owner():
+    """process_owner() of a process on this host that has exited."""
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    return f"{socket.gethostname()}:{child.pid}"
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    finished = threading.Event()
+
+    def pipeline(params, client, progress):
+        finished.set()
+        return {"video_id": params["video_id"]}
+
+    monkeypatch.setitem(jobs.PIPELINES, "quiz", pipeline)
+    manager = jobs.JobManager(max_workers=1)
+    manager.finished = finished
+    yield manager
+    manager.shutdown()
+
+
+def _orphan(owner: str, params: dict) -> str:
+    job_id = f"orphan-{params['video_id']}"
+    get_store().create_job(job_id, "quiz", params, f"quiz:{params_key(params)}", owner)
+    get_store().update_job(job_id, status="running", progress=0.5, message="working", event="progress")
+    return job_id
+
+
+def test_submit_replaces_a_job_whose_worker_died(manager, dead_owner):
+    params = {"video_id": "orphaned-submit"}
+    orphan = _orphan(dead_owner, params)
+
+    job, created = manager.submit("quiz", params, client=None)
+    assert created and job["id"] != orphan
+    assert manager.finished.wait(5)
+    assert get_store().get_job(orphan)["status"] == "failed"
+    assert [event["event"] for event in get_store().job_events(orphan)] == ["progress", "failed"]
+
+
+def test_get_job_fails_an_orphaned_job_once(manager, dead_owner):
+    orphan = _orphan(dead_owner, {"video_id": "orphaned-get"})
+    assert manager.get_job(orphan)["status"] == "failed"
+    assert manager.get_job(orphan)["status"] == "failed"
+    assert [event["event"] for event in get_store().job_events(orphan)].count("failed") == 1
+
+
+def test_live_jobs_are_attached_to(manager):
+    params = {"video_id": "live"}
+    live = _orphan(jobs.process_owner(), params)
+    job, created = manager.submit("quiz", params, client=None)
+    assert not created and job["id"] == live
+    assert manager.get_job(live)["status"] == "running"
+
+
+def test_job_manager_is_created_once(monkeypatch):
+    monkeypatch.setattr(jobs, "_manager", None)
+    managers = []
+    threads = [threading.Thread(target=lambda: managers.append(jobs.get_job_manager())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(manager) for manager in managers}) == 1
+    jobs.shutdown_job_manager()
@@ -0,0 +1,110 @@
+import time
+
+import pytest
+from together import Together
+from together.error import TogetherException
+
+from helpers import llm
+from helpers.fake_completions import FakeConfig, serve_in_thread
+
+
+@pytest.fixture
+def fake():
+    servers = []
+
+    def start(**config):
+        server = serve_in_thread(FakeConfig(latency=0.02, content="ok", **config))
+        servers.append(server)
+        # No retries in the SDK: helpers.llm decides what is retried.
+        return server, Together(api_key="fake", base_url=server.base_url, max_retries=0)
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+@pytest.fixture
+def model(request):
+    # Stats and breakers are per model and process wide; every test gets its own.
+    return f"fake/{request.node.name}"
+
+
+def _complete(client, model, **kwargs):
+    kwargs.setdefault("cache", False)
+    return llm.chat_completion(client, model=model, messages=[{"role": "user", "content": "hi"}], **kwargs)
+
+
+def test_hedge_fires_on_a_slow_primary(fake, model, monkeypatch):
+    monkeypatch.setattr(llm, "HEDGE_DEFAULT_DELAY_SECONDS", 0.2)
+    server, client = fake(tail_first=1, tail_latency=3.0)
+
+    started = time.monotonic()
+    response = _complete(client, model, hedge=True)
+    assert time.monotonic() - started < 1.5
+    assert response.choices[0].message.content == "ok"
+    assert server.request_count == 2
+    stats = llm.get_model_stats(model).snapshot()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_no_hedge_for_a_fast_primary(fake, model, monkeypatch):
+    monkeypatch.setattr(llm, "HEDGE_DEFAULT_DELAY_SECONDS", 0.5)
+    server, client = fake()
+    _complete(client, model, hedge=True)
+    assert server.request_count == 1
+    assert llm.get_model_stats(model).snapshot()["hedges"] == 0
+
+
+def test_503_is_retried_with_jittered_backoff(fake, model, monkeypatch):
+    delays = []
+
+    def uniform(low, high):
+        delays.append((low, high))
+        return 0.01
+
+    monkeypatch.setattr(llm.random, "uniform", uniform)
+    server, client = fake(fail_first=2, error_status=503)
+
+    response = _complete(client, model, hedge=False, max_attempts=3)
+    assert response.choices[0].message.content == "ok"
+    assert server.request_count == 3
+    # Full jitter over an exponentially growing ceiling.
+    assert delays == [(0, llm.BACKOFF_BASE_SECONDS), (0, 2 * llm.BACKOFF_BASE_SECONDS)]
+    assert llm.get_breaker(model).state == "closed"
+
+
+def test_client_errors_are_not_retried(fake, model):
+    server, client = fake(fail_first=1, error_status=400)
+    with pytest.raises(TogetherException):
+        _complete(client, model, hedge=False, max_attempts=3)
+    assert server.request_count == 1
+    assert llm.get_breaker(model).consecutive_failures == 0
+
+
+def test_breaker_opens_then_half_opens(fake, model, monkeypatch):
+    monkeypatch.setattr(llm, "BREAKER_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(llm, "BREAKER_COOLDOWN_SECONDS", 0.3)
+    monkeypatch.setattr(llm.random, "uniform", lambda low, high: 0.0)
+    server, client = fake(error_rate=1.0)
+    breaker = llm.get_breaker(model)
+
+    with pytest.raises(TogetherException):
+        _complete(client, model, hedge=False, max_attempts=2)
+    assert breaker.state == "open"
+    # Open: fail fast without calling the model.
+    with pytest.raises(llm.CircuitOpenError):
+        _complete(client, model, hedge=False)
+    assert server.request_count == 2
+
+    time.sleep(0.35)
+    assert breaker.state == "half_open"
+    # A failed probe opens it again at once.
+    with pytest.raises(TogetherException):
+        _complete(client, model, hedge=False, max_attempts=1)
+    assert breaker.state == "open"
+    assert server.request_count == 3
+
+    time.sleep(0.35)
+    server.config.error_rate = 0.0
+    assert _complete(client, model, hedge=False).choices[0].message.content == "ok"
+    assert breaker.state == "closed"
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import anyio
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from helpers.cancellation import Cancelled, current_token
+from routes import buttons, quiz
+
+
+@pytest.fixture
+def batch_pool(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="test-quiz-batch")
+    monkeypatch.setattr(quiz, "_batch_pool", pool)
+    yield pool
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _blocking_generation(monkeypatch, release: threading.Event, cancelled: threading.Event):
+    """Replace the quiz generation by one that runs until released or cancelled."""
+
+    def generate(video_id, **kwargs):
+        token = current_token()
+        while not release.wait(0.01):
+            if token is not None and token.cancelled:
+                cancelled.set()
+                raise Cancelled(token.reason)
+        return [{"question": video_id}]
+
+    monkeypatch.setattr(quiz, "generate_quiz_from_transcript", generate)
+
+
+def test_saturated_batches_leave_request_threads_to_interactive_routes(monkeypatch, batch_pool):
+    release, cancelled = threading.Event(), threading.Event()
+    _blocking_generation(monkeypatch, release, cancelled)
+    buttons.get_store().set_button("actions", 1, "play")
+    app = FastAPI()
+    app.state.together_client = None
+    app.include_router(quiz.router)
+    app.include_router(buttons.router)
+
+    async def scenario():
+        # A small request threadpool, which eight batch generations would exhaust.
+        anyio.to_thread.current_default_thread_limiter().total_tokens = 4
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            batches = [
+                asyncio.create_task(
+                    client.post("/quiz/batch", json={"video_ids": [f"video{b}-{i}" for i in range(8)], "max_workers": 8})
+                )
+                for b in range(2)
+            ]
+            await asyncio.sleep(0.2)
+            started = time.monotonic()
+            response = await asyncio.wait_for(client.get("/action/1"), timeout=2)
+            elapsed = time.monotonic() - started
+            release.set()
+            results = await asyncio.gather(*batches)
+        return response, elapsed, results
+
+    response, elapsed, results = asyncio.run(scenario())
+    assert response.status_code == 200 and response.text == "play"
+    assert elapsed < 1.0
+    assert all(result.status_code == 200 and len(result.text.splitlines()) == 8 for result in results)
+
+
+def test_closing_the_stream_cancels_generations_in_flight(monkeypatch, batch_pool):
+    release, cancelled = threading.Event(), threading.Event()
+    _blocking_generation(monkeypatch, release, cancelled)
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(together_client=None)))
+    body = quiz.QuizBatchRequest(video_ids=["slow-video"])
+
+    async def scenario():
+        response = await quiz.get_quiz_batch(request, body)
+        lines = response.body_iterator
+        reader = asyncio.create_task(lines.__anext__())
+        await asyncio.sleep(0.2)
+        # The client goes away before the line is ready.
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        await lines.aclose()
+        return await asyncio.to_thread(cancelled.wait, 2)
+
+    assert asyncio.run(scenario())
+    assert not release.is_set()
@@ -0,0 +1,55 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from helpers import transcripts
+from helpers.storage import get_store
+from helpers.transcript_index import get_index_cache
+from routes import transcript
+
+VIDEO_ID = "pagedvideo1"
+
+
+@pytest.fixture
+def client():
+    get_store().put(
+        "transcripts",
+        VIDEO_ID,
+        {
+            "video_id": VIDEO_ID,
+            "language": "English",
+            "language_code": "en",
+            "is_generated": False,
+            "transcript": [{"text": f"line\n{i}", "start": i * 2.0, "duration": 2.0} for i in range(50)],
+            "total_segments": 50,
+            "chapters": [],
+        },
+    )
+    get_index_cache().discard(VIDEO_ID)
+    app = FastAPI()
+    app.include_router(transcript.router)
+    return TestClient(app)
+
+
+def _fail(*args, **kwargs):
+    raise AssertionError("decoded the stored transcript")
+
+
+def test_pages_are_built_from_the_index_without_decoding(client, monkeypatch):
+    assert client.get("/transcript", params={"video_id": VIDEO_ID, "limit": 1}).status_code == 200
+    # The index is built; following pages must not decode the stored transcript again.
+    monkeypatch.setattr(transcripts, "get_transcript", _fail)
+    monkeypatch.setattr(transcript, "get_cached_transcript", _fail)
+
+    page = client.get("/transcript", params={"video_id": VIDEO_ID, "start": 10, "end": 30, "limit": 5}).json()
+    assert page["video_id"] == VIDEO_ID and page["language_code"] == "en" and page["total_segments"] == 50
+    assert "chapters" not in page
+    assert page["transcript"][0] == {"text": "line 5", "start": 10.0, "duration": 2.0}
+    assert len(page["transcript"]) == 5
+    assert page["next_cursor"] == "10"
+
+    rest = client.get(
+        "/transcript", params={"video_id": VIDEO_ID, "start": 10, "end": 30, "cursor": page["next_cursor"]}
+    ).json()
+    assert [segment["start"] for segment in rest["transcript"]] == [2.0 * i for i in range(10, 16)]
+    assert rest["next_cursor"] is None